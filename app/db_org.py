@@ -1,52 +1,227 @@
-from typing import Any, Dict, Tuple
+from typing import Any, Dict, List, Optional, Tuple
 
-from psycopg2.errors import UniqueViolation
 from postgres import Postgres
 
-from illu_db import init_db
+from db_user import USER_COLS
+from illu_db import init_db, init_read_db
+from illu_prepared import prepared_sql
+from make_sql import (
+    make_upsert_sql,
+    ON_CONFLICT,
+    split_upsert_row,
+    SqlParam,
+    UPSERT_OUTCOME,
+)
 
+ORG_COLS: List[str] = ["id", "org_name", "version"]
+SELECT_ORG: str = (
+    f"SELECT {', '.join(ORG_COLS)} FROM my_schema.organization "
+    "WHERE org_name=%(org_name)s"
+)
+# NOTE: enough to build the ETag of a get_org result, see illu_etag
+SELECT_ORG_VERSION: str = (
+    "SELECT id, version FROM my_schema.organization WHERE org_name=%(org_name)s"
+)
+# NOTE: the org and one page of its members in one round trip, the members
+# aggregated into a json array on the org's row. The page is read in id order
+# from the (org_id, id) index
+SELECT_ORG_WITH_MEMBERS: str = f"""
+    SELECT
+        {", ".join(f"o.{col}" for col in ORG_COLS)},
+        COALESCE(
+            (
+                SELECT json_agg(member ORDER BY member.id)
+                FROM (
+                    SELECT {", ".join(USER_COLS)}
+                    FROM my_schema.illu_user
+                    WHERE org_id=o.id AND id > %(after_id)s
+                    ORDER BY id
+                    LIMIT %(limit)s
+                ) AS member
+            ),
+            '[]'
+        ) AS members
+    FROM my_schema.organization AS o
+    WHERE o.org_name=%(org_name)s
+"""
 
-def create_org(name: str) -> Tuple[bool, Dict[str, Any]]:
+
+def create_org(name: str, cursor: Optional[Any] = None) -> Tuple[bool, Dict[str, Any]]:
     """
     creates an organization
 
     name:
         The name of org to create
 
+    cursor:
+        a cursor from illu_db.transaction to run in, None for a transaction of
+        its own
+
     returns:
         Tuple containing...
-        boolean indicating success or failure of insertion and selection transaction
+        boolean indicating success or failure of the insertion
         dictionary containing org column names and values
     """
+    outcome: UPSERT_OUTCOME
+    result: Dict[str, Any]
+    _, outcome, result = upsert_org(name, on_conflict="nothing", cursor=cursor)
+    return outcome == "inserted", result
+
+
+def upsert_org(
+    name: str, on_conflict: ON_CONFLICT = "nothing", cursor: Optional[Any] = None
+) -> Tuple[bool, UPSERT_OUTCOME, Dict[str, Any]]:
+    """
+    creates an organization, or handles the org that already has the name in the
+    same statement without raising
+
+    name:
+        The name of org to create
+
+    on_conflict:
+        "nothing" returns no org data for an existing org,
+        "update" and "existing" both return the existing org as "existing" since
+        the name is its only column
+
+    cursor:
+        a cursor from illu_db.transaction to run in, None for a transaction of
+        its own
+
+    returns:
+        Tuple containing...
+        boolean indicating success or failure of the statement
+        what happened: "inserted", "updated", "existing" or "skipped"
+        dictionary containing org column names and values, empty if skipped
+    """
     db: Postgres = init_db()
 
     success: bool = False
-    result: Dict[str, Any] = {}
-    with db.get_cursor() as cursor:
-        try:
-            cursor.run(
-                "INSERT INTO my_schema.organization(org_name) VALUES(%(org_name)s)",
-                org_name=name,
-            )
-            result = cursor.one(
-                "SELECT * FROM my_schema.organization WHERE org_name=%(org_name)s",
-                org_name=name,
-                back_as=dict,
-            )
-            success = True
-        except UniqueViolation:
-            pass
-
-    return success, result
-
-
-def delete_org(name: str) -> bool:
+    param_dict: Dict[str, Any] = {}
+    upsert_sql: str = make_upsert_sql(
+        param_dict=param_dict,
+        table_name="my_schema.organization",
+        insert_args=[SqlParam(col_name="org_name", value=name)],
+        conflict_cols=["org_name"],
+        on_conflict=on_conflict,
+        returning_cols=ORG_COLS,
+    )
+    with db.get_cursor(cursor=cursor) as cursor:
+        row: Optional[Dict[str, Any]] = cursor.one(
+            prepared_sql(cursor, f"illu_upsert_org_{on_conflict}", upsert_sql),
+            param_dict,
+            back_as=dict,
+        )
+        success = True
+
+    outcome: UPSERT_OUTCOME
+    result: Dict[str, Any]
+    outcome, result = split_upsert_row(row)
+    return success, outcome, result
+
+
+def get_org(
+    name: str,
+    version_only: bool = False,
+    primary: bool = False,
+    cursor: Optional[Any] = None,
+) -> Tuple[bool, Dict[str, Any]]:
+    """
+    gets an organization by name
+
+    name:
+        The name of the org to get
+
+    version_only:
+        only get the id and version, to check an ETag without fetching the org
+
+    primary:
+        read from the primary instead of a replica, to see a write made just before
+
+    cursor:
+        a cursor from illu_db.transaction, to see its uncommitted writes
+
+    returns:
+        Tuple containing...
+        boolean indicating whether the read succeeded
+        dictionary containing org column names and values, empty if there is no
+        org with the name
+    """
+    db: Postgres = init_read_db(primary)
+
+    success: bool = False
+    with db.get_cursor(cursor=cursor) as cursor:
+        row: Optional[Dict[str, Any]] = cursor.one(
+            prepared_sql(
+                cursor,
+                "illu_get_org_version" if version_only else "illu_get_org",
+                SELECT_ORG_VERSION if version_only else SELECT_ORG,
+            ),
+            {"org_name": name},
+            back_as=dict,
+        )
+        success = True
+
+    return success, row or {}
+
+
+def get_org_with_members(
+    name: str,
+    after_id: Optional[int] = None,
+    limit: int = 100,
+    primary: bool = False,
+    cursor: Optional[Any] = None,
+) -> Tuple[bool, Dict[str, Any]]:
+    """
+    gets an organization by name and one page of its members with one query
+
+    name:
+        The name of the org to get
+
+    after_id:
+        keyset pagination. Pass the id of the last member of the previous page to
+        get the next one
+
+    limit:
+        the page size
+
+    primary:
+        read from the primary instead of a replica, to see a write made just before
+
+    cursor:
+        a cursor from illu_db.transaction, to see its uncommitted writes
+
+    returns:
+        Tuple containing...
+        boolean indicating whether the read succeeded
+        dictionary containing org column names and values and members, a List of
+        the page's users sorted by id. Empty if there is no org with the name
+    """
+    db: Postgres = init_read_db(primary)
+
+    success: bool = False
+    with db.get_cursor(cursor=cursor) as cursor:
+        row: Optional[Dict[str, Any]] = cursor.one(
+            prepared_sql(cursor, "illu_get_org_with_members", SELECT_ORG_WITH_MEMBERS),
+            # NOTE: ids start at 1, so 0 is the first page
+            {"org_name": name, "after_id": after_id or 0, "limit": limit},
+            back_as=dict,
+        )
+        success = True
+
+    return success, row or {}
+
+
+def delete_org(name: str, cursor: Optional[Any] = None) -> bool:
     """
     deletes and organization
 
     name:
         The name of the org to delete
 
+    cursor:
+        a cursor from illu_db.transaction to run in, None for a transaction of
+        its own
+
     returns:
         boolean indicating whether the deletion succeeded
     """
@@ -54,9 +229,13 @@ def delete_org(name: str) -> bool:
     db: Postgres = init_db()
 
     success: bool = False
-    with db.get_cursor() as cursor:
+    with db.get_cursor(cursor=cursor) as cursor:
         cursor.run(
-            "DELETE FROM my_schema.organization WHERE org_name=%(org_name)s",
+            prepared_sql(
+                cursor,
+                "illu_delete_org",
+                "DELETE FROM my_schema.organization WHERE org_name=%(org_name)s",
+            ),
             org_name=name,
         )
         success = True
@@ -0,0 +1,167 @@
+import json
+from typing import Any, Dict, Optional, Tuple, Union
+
+import asyncpg
+
+from db_org import ORG_COLS, SELECT_ORG, SELECT_ORG_VERSION, SELECT_ORG_WITH_MEMBERS
+from illu_db_async import acquire, init_async_db, init_async_read_db
+from make_sql import (
+    make_numbered_args,
+    make_upsert_sql,
+    ON_CONFLICT,
+    split_upsert_row,
+    SqlParam,
+    UPSERT_OUTCOME,
+)
+
+
+async def create_org(
+    name: str, connection: Optional[asyncpg.Connection] = None
+) -> Tuple[bool, Dict[str, Any]]:
+    """
+    asyncio counterpart of db_org.create_org
+
+    name:
+        The name of org to create
+
+    connection:
+        a connection from illu_db_async.async_transaction to run in, None for a
+        transaction of its own
+
+    returns:
+        Tuple containing...
+        boolean indicating success or failure of the insertion
+        dictionary containing org column names and values
+    """
+    outcome: UPSERT_OUTCOME
+    result: Dict[str, Any]
+    _, outcome, result = await upsert_org(
+        name, on_conflict="nothing", connection=connection
+    )
+    return outcome == "inserted", result
+
+
+async def upsert_org(
+    name: str,
+    on_conflict: ON_CONFLICT = "nothing",
+    connection: Optional[asyncpg.Connection] = None,
+) -> Tuple[bool, UPSERT_OUTCOME, Dict[str, Any]]:
+    """
+    asyncio counterpart of db_org.upsert_org, takes the same arguments
+    with connection, a connection from async_transaction, in place of cursor
+
+    returns:
+        Tuple containing...
+        boolean indicating success or failure of the statement
+        what happened: "inserted", "existing" or "skipped"
+        dictionary containing org column names and values, empty if skipped
+    """
+    db: Union[asyncpg.Pool, asyncpg.Connection] = (
+        await init_async_db() if connection is None else connection
+    )
+
+    param_dict: Dict[str, Any] = {}
+    upsert_sql: str = make_upsert_sql(
+        param_dict=param_dict,
+        table_name="my_schema.organization",
+        insert_args=[SqlParam(col_name="org_name", value=name)],
+        conflict_cols=["org_name"],
+        on_conflict=on_conflict,
+        returning_cols=ORG_COLS,
+    )
+    sql, args = make_numbered_args(upsert_sql, param_dict)
+    async with acquire(db) as db:
+        record: Optional[asyncpg.Record] = await db.fetchrow(sql, *args)
+
+    outcome: UPSERT_OUTCOME
+    result: Dict[str, Any]
+    outcome, result = split_upsert_row(None if record is None else dict(record))
+    return True, outcome, result
+
+
+async def get_org(
+    name: str,
+    version_only: bool = False,
+    primary: bool = False,
+    connection: Optional[asyncpg.Connection] = None,
+) -> Tuple[bool, Dict[str, Any]]:
+    """
+    asyncio counterpart of db_org.get_org, takes the same arguments
+    with connection, a connection from async_transaction, in place of cursor
+
+    returns:
+        Tuple containing...
+        boolean indicating whether the read succeeded
+        dictionary containing org column names and values, empty if there is no
+        org with the name
+    """
+    db: Union[asyncpg.Pool, asyncpg.Connection] = (
+        await init_async_read_db(primary) if connection is None else connection
+    )
+
+    sql, args = make_numbered_args(
+        SELECT_ORG_VERSION if version_only else SELECT_ORG, {"org_name": name}
+    )
+    async with acquire(db) as db:
+        record: Optional[asyncpg.Record] = await db.fetchrow(sql, *args)
+    return True, {} if record is None else dict(record)
+
+
+async def get_org_with_members(
+    name: str,
+    after_id: Optional[int] = None,
+    limit: int = 100,
+    primary: bool = False,
+    connection: Optional[asyncpg.Connection] = None,
+) -> Tuple[bool, Dict[str, Any]]:
+    """
+    asyncio counterpart of db_org.get_org_with_members, takes the same arguments
+    with connection, a connection from async_transaction, in place of cursor
+
+    returns:
+        Tuple containing...
+        boolean indicating whether the read succeeded
+        dictionary containing org column names and values and the page of
+        members, empty if there is no org with the name
+    """
+    db: Union[asyncpg.Pool, asyncpg.Connection] = (
+        await init_async_read_db(primary) if connection is None else connection
+    )
+
+    sql, args = make_numbered_args(
+        SELECT_ORG_WITH_MEMBERS,
+        {"org_name": name, "after_id": after_id or 0, "limit": limit},
+    )
+    async with acquire(db) as db:
+        record: Optional[asyncpg.Record] = await db.fetchrow(sql, *args)
+    if record is None:
+        return True, {}
+    # NOTE: asyncpg hands json back as text, psycopg2 decodes it
+    result: Dict[str, Any] = dict(record)
+    result["members"] = json.loads(result["members"])
+    return True, result
+
+
+async def delete_org(
+    name: str, connection: Optional[asyncpg.Connection] = None
+) -> bool:
+    """
+    asyncio counterpart of db_org.delete_org
+
+    name:
+        The name of the org to delete
+
+    connection:
+        a connection from illu_db_async.async_transaction to run in, None for a
+        transaction of its own
+
+    returns:
+        boolean indicating whether the deletion succeeded
+    """
+    db: Union[asyncpg.Pool, asyncpg.Connection] = (
+        await init_async_db() if connection is None else connection
+    )
+
+    async with acquire(db) as db:
+        await db.execute("DELETE FROM my_schema.organization WHERE org_name=$1", name)
+    return True
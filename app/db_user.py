@@ -1,15 +1,118 @@
-from typing import Any, Dict, List, Optional, Tuple
+import io
+from typing import Any, Dict, Hashable, Iterator, List, Optional, Set, Tuple
 
 from postgres import Postgres
-from psycopg2.errors import UniqueViolation
 
-from illu_db import init_db
-from make_sql import make_where_sql, make_update_sql, SqlParam
-
-SELECT_USER: str = (
-    "SELECT id, phone_prefix, phone, user_name, org_id FROM my_schema.illu_user "
+from illu_cache import init_user_cache, TTLCache
+from illu_db import after_commit, init_db, init_read_db
+from illu_prepared import prepared_sql
+from make_sql import (
+    make_bulk_update_sql,
+    make_copy_text,
+    make_insert_many_sql,
+    make_where_sql_col,
+    make_update_sql,
+    make_upsert_sql,
+    ON_CONFLICT,
+    split_upsert_row,
+    SqlParam,
+    UPSERT_OUTCOME,
 )
 
+# NOTE: the user columns that are safe to hand back to callers (no secrets)
+USER_COLS: List[str] = [
+    "id",
+    "phone_prefix",
+    "phone",
+    "user_name",
+    "org_id",
+    "version",
+]
+SELECT_USER: str = f"SELECT {', '.join(USER_COLS)} FROM my_schema.illu_user "
+# NOTE: enough to build the ETag of a get_user result, see illu_etag
+SELECT_USER_VERSIONS: str = "SELECT id, version FROM my_schema.illu_user "
+# NOTE: join against the pairs unnested from two parallel arrays, so a whole batch
+# binds as two parameters and can use the (phone_prefix, phone) index
+SELECT_USERS_BY_PHONES: str = SELECT_USER + """
+        JOIN unnest(%(phone_prefixes)s::varchar[], %(phones)s::varchar[])
+            AS lookup(phone_prefix, phone)
+        USING (phone_prefix, phone)
+    """
+# NOTE: the columns a caller provides when creating a user
+USER_INSERT_COLS: List[str] = [
+    "phone_prefix",
+    "phone",
+    "user_name",
+    "pw_hash",
+    "jwt",
+    "org_id",
+]
+# NOTE: the sql types of the writable user columns, for casting VALUES lists
+USER_COL_TYPES: Dict[str, str] = {
+    "phone_prefix": "varchar",
+    "phone": "varchar",
+    "user_name": "varchar",
+    "pw_hash": "varchar",
+    "jwt": "varchar",
+    "org_id": "bigint",
+}
+# NOTE: batches at least this large are loaded with COPY instead of a multi-row INSERT
+COPY_THRESHOLD: int = 1000
+
+
+def user_cache_key(params: Dict[str, Any]) -> Optional[Hashable]:
+    """
+    the user cache key for a get_user filter. Only lookups by exactly the id or
+    exactly the (phone_prefix, phone) pair are cached
+
+    params:
+        the get_user filter keyed by column name, None for unused columns
+
+    returns:
+        the cache key, None if the filter isn't cached
+    """
+    used: Tuple[str, ...] = tuple(
+        sorted(key for key, value in params.items() if not (value is None))
+    )
+    if used == ("id",):
+        return ("id", params["id"])
+    if used == ("phone", "phone_prefix"):
+        return ("phone", params["phone_prefix"], params["phone"])
+    return None
+
+
+def cache_user(user: Dict[str, Any], guard: Tuple[Hashable, int]) -> None:
+    """
+    caches a user under its id and its (phone_prefix, phone)
+
+    user:
+        the user as read from the primary
+
+    guard:
+        the key the user was looked up by and its TTLCache.generation from before
+        the read. invalidate_users deletes both keys of a user, so if a write
+        committed since, the user isn't cached under either
+    """
+    cache: TTLCache = init_user_cache()
+    cache.set(("id", user["id"]), dict(user), guard)
+    cache.set(("phone", user["phone_prefix"], user["phone"]), dict(user), guard)
+
+
+def invalidate_users(user_ids: List[int], phones: List[Tuple[str, str]]) -> None:
+    """
+    drops users from the user cache. Call this after a write commits
+
+    user_ids:
+        the ids of the changed users
+    phones:
+        every (phone_prefix, phone) the changed users had before or have after
+    """
+    cache: TTLCache = init_user_cache()
+    for user_id in user_ids:
+        cache.delete(("id", user_id))
+    for phone_prefix, phone in phones:
+        cache.delete(("phone", phone_prefix, phone))
+
 
 def create_user(
     phone_prefix: str,
@@ -18,6 +121,7 @@ def create_user(
     pw_hash: str,
     jwt: Optional[str] = None,
     org_id: Optional[int] = None,
+    cursor: Optional[Any] = None,
 ) -> Tuple[bool, Dict[str, Any]]:
     """
     creates a user
@@ -40,50 +144,238 @@ def create_user(
     org_id:
         the organization that the user is a member of
 
+    cursor:
+        a cursor from illu_db.transaction to run in, None for a transaction of
+        its own
+
     returns:
         Tuple containing...
-        boolean indicating the success of the insert and select transaction
+        boolean indicating the success of the insert
         Dictionary containing most of the user data, excluding some secrets
     """
+    outcome: UPSERT_OUTCOME
+    result: Dict[str, Any]
+    _, outcome, result = upsert_user(
+        phone_prefix,
+        phone,
+        user_name,
+        pw_hash,
+        jwt,
+        org_id,
+        on_conflict="nothing",
+        cursor=cursor,
+    )
+    return outcome == "inserted", result
+
+
+def upsert_user(
+    phone_prefix: str,
+    phone: str,
+    user_name: str,
+    pw_hash: str,
+    jwt: Optional[str] = None,
+    org_id: Optional[int] = None,
+    on_conflict: ON_CONFLICT = "nothing",
+    cursor: Optional[Any] = None,
+) -> Tuple[bool, UPSERT_OUTCOME, Dict[str, Any]]:
+    """
+    creates a user, or handles the user that already has the (phone_prefix, phone)
+    in the same statement without raising. Takes the create_user arguments and...
+
+    on_conflict:
+        "nothing" leaves the existing user alone and returns no user data,
+        "update" sets the existing user's user_name and pw_hash, and jwt and
+        org_id when they aren't None,
+        "existing" leaves the existing user alone and returns it
+
+    cursor:
+        a cursor from illu_db.transaction to run in, None for a transaction of
+        its own
 
+    returns:
+        Tuple containing...
+        boolean indicating the success of the statement
+        what happened: "inserted", "updated", "existing" or "skipped"
+        Dictionary containing most of the user data, empty if skipped
+    """
     db: Postgres = init_db()
 
     success: bool = False
-    result: Dict[str, Any] = {}
-    with db.get_cursor() as cursor:
-        try:
-            cursor.run(
-                """
-                    INSERT INTO my_schema.illu_user(
-                        phone_prefix, phone, user_name, pw_hash, jwt, org_id
-                    )
-                    VALUES(
-                        %(phone_prefix)s,
-                        %(phone)s,
-                        %(user_name)s,
-                        %(pw_hash)s,
-                        %(jwt)s,
-                        %(org_id)s
-                    )
-                """,
-                phone_prefix=phone_prefix,
-                phone=phone,
-                user_name=user_name,
-                pw_hash=pw_hash,
-                jwt=jwt,
-                org_id=org_id,
+    param_dict: Dict[str, Any] = {}
+    upsert_sql: str = make_upsert_sql(
+        param_dict=param_dict,
+        table_name="my_schema.illu_user",
+        insert_args=[
+            SqlParam(col_name="phone_prefix", value=phone_prefix),
+            SqlParam(col_name="phone", value=phone),
+            SqlParam(col_name="user_name", value=user_name),
+            SqlParam(col_name="pw_hash", value=pw_hash),
+            SqlParam(col_name="jwt", value=jwt),
+            SqlParam(col_name="org_id", value=org_id),
+        ],
+        conflict_cols=["phone_prefix", "phone"],
+        on_conflict=on_conflict,
+        returning_cols=USER_COLS,
+    )
+    with db.get_cursor(cursor=cursor) as cursor:
+        row: Optional[Dict[str, Any]] = cursor.one(upsert_sql, param_dict, back_as=dict)
+        success = True
+
+    outcome: UPSERT_OUTCOME
+    result: Dict[str, Any]
+    outcome, result = split_upsert_row(row)
+    if outcome == "updated":
+        after_commit(
+            cursor, lambda: invalidate_users([result["id"]], [(phone_prefix, phone)])
+        )
+    return success, outcome, result
+
+
+def create_users(
+    rows: List[Dict[str, Any]],
+    cursor: Optional[Any] = None,
+) -> Tuple[bool, List[Tuple[bool, Dict[str, Any]]]]:
+    """
+    creates many users in a single transaction
+
+    Small batches are inserted with one multi-row INSERT, batches of at least
+    COPY_THRESHOLD rows are loaded with COPY into a temp table first.
+    Rows that collide with an existing user's (phone_prefix, phone), or with an
+    earlier row in the same batch, are skipped instead of aborting the batch.
+
+    rows:
+        one dictionary per user with the create_user arguments as keys.
+        jwt and org_id are optional
+
+    cursor:
+        a cursor from illu_db.transaction to run in, None for a transaction of
+        its own
+
+    returns:
+        Tuple containing...
+        boolean indicating the success of the batch
+        List with one entry per input row, in input order, containing...
+            boolean indicating whether that row was inserted
+            Dictionary containing the created user data, empty if it was skipped
+    """
+    db: Postgres = init_db()
+
+    success: bool = False
+    outcomes: List[Tuple[bool, Dict[str, Any]]] = []
+    if len(rows) == 0:
+        return True, outcomes
+
+    with db.get_cursor(cursor=cursor) as cursor:
+        created: List[Dict[str, Any]]
+        if len(rows) < COPY_THRESHOLD:
+            param_dict: Dict[str, Any] = {}
+            insert_sql: str = make_insert_many_sql(
+                param_dict=param_dict,
+                table_name="my_schema.illu_user",
+                col_names=USER_INSERT_COLS,
+                rows=rows,
+                returning_cols=USER_COLS,
+                conflict_cols=["phone_prefix", "phone"],
             )
-            result = cursor.one(
-                SELECT_USER + "WHERE phone_prefix=%(phone_prefix)s AND phone=%(phone)s",
-                phone_prefix=phone_prefix,
-                phone=phone,
+            created = cursor.all(insert_sql, param_dict, back_as=dict)
+        else:
+            load_cols: str = ", ".join(USER_INSERT_COLS)
+            # NOTE: an earlier batch of the same transaction left the table behind
+            cursor.run(f"""
+                    DROP TABLE IF EXISTS illu_user_load;
+                    CREATE TEMP TABLE illu_user_load ON COMMIT DROP AS
+                    SELECT 0 AS ord, {load_cols} FROM my_schema.illu_user
+                    WITH NO DATA
+                """)
+            ordered_rows: List[Dict[str, Any]] = [
+                dict(row, ord=index) for index, row in enumerate(rows)
+            ]
+            cursor.copy_expert(
+                f"COPY illu_user_load(ord, {load_cols}) FROM STDIN",
+                io.StringIO(make_copy_text(["ord"] + USER_INSERT_COLS, ordered_rows)),
+            )
+            # NOTE: ORDER BY ord so the first of any duplicate rows is the one inserted
+            created = cursor.all(
+                f"""
+                    INSERT INTO my_schema.illu_user({load_cols})
+                    SELECT {load_cols} FROM illu_user_load ORDER BY ord
+                    ON CONFLICT (phone_prefix, phone) DO NOTHING
+                    RETURNING {", ".join(USER_COLS)}
+                """,
                 back_as=dict,
             )
-            success = True
-        except UniqueViolation:
-            pass
+        success = True
 
-    return success, result
+    created_by_phone: Dict[Tuple[str, str], Dict[str, Any]] = {
+        (user["phone_prefix"], user["phone"]): user for user in created
+    }
+    for row in rows:
+        user: Optional[Dict[str, Any]] = created_by_phone.pop(
+            (row["phone_prefix"], row["phone"]), None
+        )
+        if user is None:
+            outcomes.append((False, {}))
+        else:
+            outcomes.append((True, user))
+
+    return success, outcomes
+
+
+def make_select_user_sql(
+    param_dict: Dict[str, Any],
+    params: Dict[str, Any],
+    after_id: Optional[int] = None,
+    limit: Optional[int] = None,
+    descending: bool = False,
+    version_only: bool = False,
+) -> str:
+    """
+    makes the SELECT for get_user and iter_users
+
+    param_dict:
+        The mutable param_dict that will be passed into the db 'all' function
+
+    params:
+        the equality filters keyed by column name, None for unused columns
+
+    after_id:
+        keyset pagination, only return users after this id in the sort order
+
+    limit:
+        the most users to return
+
+    descending:
+        sort by id from highest to lowest instead of lowest to highest.
+        Results are only sorted when after_id or limit is given
+
+    version_only:
+        only select the id and version columns
+
+    returns:
+        string of the select statement
+    """
+    where_args: List[SqlParam] = [
+        SqlParam(col_name=key, value=value) for key, value in params.items()
+    ]
+    where_args.append(
+        SqlParam(
+            col_name="id",
+            value=after_id,
+            param_key="after_id",
+            comparison="<" if descending else ">",
+        )
+    )
+    result: str = (SELECT_USER_VERSIONS if version_only else SELECT_USER) + (
+        make_where_sql_col(param_dict, where_args, "AND")
+    )
+    if after_id is not None or limit is not None:
+        result = result.rstrip() + (
+            " ORDER BY id DESC" if descending else " ORDER BY id"
+        )
+    if limit is not None:
+        result += " LIMIT %(limit)s"
+        param_dict["limit"] = limit
+    return result
 
 
 def get_user(
@@ -92,16 +384,49 @@ def get_user(
     phone: Optional[str] = None,
     user_name: Optional[str] = None,
     org_id: Optional[int] = None,
+    after_id: Optional[int] = None,
+    limit: Optional[int] = None,
+    descending: bool = False,
+    version_only: bool = False,
+    primary: bool = False,
+    cursor: Optional[Any] = None,
 ) -> Tuple[bool, List[Dict[str, Any]]]:
     """
     gets the user based on WHERE AND on the defined parameters
 
+    after_id:
+        keyset pagination. Pass the id of the last user of the previous page to
+        get the next one
+
+    limit:
+        the page size. Lookups by exactly the id or the (phone_prefix, phone) still
+        use the user cache with a limit, they find one user at most
+
+    descending:
+        page from the highest id to the lowest instead
+
+    version_only:
+        only get the id and version of each user, to check an ETag without
+        fetching the users. Skips the user cache
+
+    primary:
+        read from the primary instead of a replica, to see a write made just
+        before. Skips the user cache lookup
+
+    cursor:
+        a cursor from illu_db.transaction, to see its uncommitted writes. Skips
+        the user cache
+
     returns
         Tuple containing...
         boolean indicating whether the read succeeded
-        List containing users who matched the where expression
+        List containing users who matched the where expression, sorted by id
+        when paginating
     """
-    db: Postgres = init_db()
+    db: Postgres = init_read_db(primary)
+    # NOTE: only users read from the primary are cached. A lagging replica can
+    # return a user that a committed write already invalidated
+    from_primary: bool = db is init_db()
 
     params = {
         "id": user_id,
@@ -110,18 +435,266 @@ def get_user(
         "user_name": user_name,
         "org_id": org_id,
     }
+    cache_key: Optional[Hashable] = None
+    # NOTE: a cached lookup finds at most one user, so any limit returns it all
+    if (
+        after_id is None
+        and (limit is None or limit >= 1)
+        and not version_only
+        and cursor is None
+    ):
+        cache_key = user_cache_key(params)
+    generation: int = 0
+    if cache_key is not None:
+        cache: TTLCache = init_user_cache()
+        if not primary:
+            cached: Optional[Dict[str, Any]] = cache.get(cache_key)
+            if cached is not None:
+                return True, [dict(cached)]
+        generation = cache.generation(cache_key)
+
+    param_dict: Dict[str, Any] = {}
+    select_sql: str = make_select_user_sql(
+        param_dict, params, after_id, limit, descending, version_only
+    )
+    # NOTE: one prepared statement per shape, named after the bound parameters
+    statement_name: str = "illu_get_user_" + ("_".join(param_dict) or "all")
+    if descending and (after_id is not None or limit is not None):
+        statement_name += "_desc"
+    if version_only:
+        statement_name += "_version"
     success: bool = False
-    with db.get_cursor() as cursor:
+    with db.get_cursor(cursor=cursor) as cursor:
         result = cursor.all(
-            SELECT_USER + make_where_sql(params, "AND"),
-            params,
+            prepared_sql(cursor, statement_name, select_sql),
+            param_dict,
             back_as=dict,
         )
         success = True
 
+    if cache_key is not None and from_primary and len(result) == 1:
+        cache_user(result[0], (cache_key, generation))
+
     return success, result
 
 
+def get_users_by_ids(
+    user_ids: List[int],
+    primary: bool = False,
+    cursor: Optional[Any] = None,
+) -> Tuple[bool, Dict[int, Optional[Dict[str, Any]]]]:
+    """
+    gets many users by id in one query. Users in the user cache aren't queried
+
+    user_ids:
+        the ids to look up
+
+    primary:
+        read from the primary instead of a replica, to see a write made just
+        before. Skips the user cache lookup
+
+    cursor:
+        a cursor from illu_db.transaction, to see its uncommitted writes. Skips
+        the user cache
+
+    returns:
+        Tuple containing...
+        boolean indicating whether the read succeeded
+        Dictionary from each requested id to its user, None if there is no such user
+    """
+    cache: TTLCache = init_user_cache()
+    result: Dict[int, Optional[Dict[str, Any]]] = {}
+    missing: List[int] = []
+    for user_id in user_ids:
+        cached: Optional[Dict[str, Any]] = None
+        if cursor is None and not primary:
+            cached = cache.get(("id", user_id))
+        result[user_id] = None if cached is None else dict(cached)
+        if cached is None:
+            missing.append(user_id)
+
+    if len(missing) == 0:
+        return True, result
+
+    db: Postgres = init_read_db(primary)
+    # NOTE: see get_user, only users read from the primary are cached
+    cacheable: bool = cursor is None and db is init_db()
+    generations: Dict[int, int] = {
+        user_id: cache.generation(("id", user_id)) for user_id in missing
+    }
+
+    param_dict: Dict[str, Any] = {}
+    select_sql: str = SELECT_USER + make_where_sql_col(
+        param_dict,
+        [SqlParam(col_name="id", value=missing, param_key="ids", comparison="= ANY")],
+        "AND",
+    )
+    success: bool = False
+    with db.get_cursor(cursor=cursor) as cursor:
+        users: List[Dict[str, Any]] = cursor.all(
+            prepared_sql(cursor, "illu_get_users_by_ids", select_sql),
+            param_dict,
+            back_as=dict,
+        )
+        success = True
+
+    for user in users:
+        if cacheable:
+            cache_user(user, (("id", user["id"]), generations[user["id"]]))
+        result[user["id"]] = user
+
+    return success, result
+
+
+def get_users_by_phones(
+    phones: List[Tuple[str, str]],
+    primary: bool = False,
+    cursor: Optional[Any] = None,
+) -> Tuple[bool, Dict[Tuple[str, str], Optional[Dict[str, Any]]]]:
+    """
+    gets many users by (phone_prefix, phone) in one query. Users in the user cache
+    aren't queried
+
+    phones:
+        the (phone_prefix, phone) pairs to look up
+
+    primary:
+        read from the primary instead of a replica, to see a write made just
+        before. Skips the user cache lookup
+
+    cursor:
+        a cursor from illu_db.transaction, to see its uncommitted writes. Skips
+        the user cache
+
+    returns:
+        Tuple containing...
+        boolean indicating whether the read succeeded
+        Dictionary from each requested (phone_prefix, phone) to its user, None if
+        there is no such user
+    """
+    cache: TTLCache = init_user_cache()
+    result: Dict[Tuple[str, str], Optional[Dict[str, Any]]] = {}
+    missing: List[Tuple[str, str]] = []
+    for phone_prefix, phone in phones:
+        cached: Optional[Dict[str, Any]] = None
+        if cursor is None and not primary:
+            cached = cache.get(("phone", phone_prefix, phone))
+        result[(phone_prefix, phone)] = None if cached is None else dict(cached)
+        if cached is None:
+            missing.append((phone_prefix, phone))
+
+    if len(missing) == 0:
+        return True, result
+
+    db: Postgres = init_read_db(primary)
+    # NOTE: see get_user, only users read from the primary are cached
+    cacheable: bool = cursor is None and db is init_db()
+    generations: Dict[Tuple[str, str], int] = {
+        (phone_prefix, phone): cache.generation(("phone", phone_prefix, phone))
+        for phone_prefix, phone in missing
+    }
+
+    success: bool = False
+    with db.get_cursor(cursor=cursor) as cursor:
+        users: List[Dict[str, Any]] = cursor.all(
+            prepared_sql(cursor, "illu_get_users_by_phones", SELECT_USERS_BY_PHONES),
+            phone_prefixes=[phone_prefix for phone_prefix, _ in missing],
+            phones=[phone for _, phone in missing],
+            back_as=dict,
+        )
+        success = True
+
+    for user in users:
+        phone_key: Tuple[str, str] = (user["phone_prefix"], user["phone"])
+        if cacheable:
+            cache_user(user, (("phone",) + phone_key, generations[phone_key]))
+        result[phone_key] = user
+
+    return success, result
+
+
+def iter_users(
+    phone_prefix: Optional[str] = None,
+    phone: Optional[str] = None,
+    user_name: Optional[str] = None,
+    org_id: Optional[int] = None,
+    fetch_size: int = 1000,
+    primary: bool = False,
+) -> Iterator[Dict[str, Any]]:
+    """
+    streams the users matching WHERE AND on the defined parameters, sorted by id,
+    through a server-side cursor so only fetch_size rows are in memory at a time.
+    The generator holds a pooled connection until it is exhausted or closed
+
+    fetch_size:
+        the number of rows to fetch from the server at a time
+
+    primary:
+        read from the primary instead of a replica, to see a write made just before
+
+    returns:
+        Iterator over dictionaries of user data
+    """
+    db: Postgres = init_read_db(primary)
+
+    params = {
+        "phone_prefix": phone_prefix,
+        "phone": phone,
+        "user_name": user_name,
+        "org_id": org_id,
+    }
+    param_dict: Dict[str, Any] = {}
+    select_sql: str = make_select_user_sql(param_dict, params)
+    with db.get_cursor(name="illu_iter_users") as cursor:
+        cursor.run(select_sql.rstrip() + " ORDER BY id", param_dict)
+        while True:
+            rows: List[Dict[str, Any]] = cursor.fetchmany(fetch_size, back_as=dict)
+            if len(rows) == 0:
+                break
+            yield from rows
+
+
+def make_user_update_args(
+    phone_prefix: str,
+    phone: str,
+    new_phone_prefix: Optional[str] = None,
+    new_phone: Optional[str] = None,
+    user_name: Optional[str] = None,
+    pw_hash: Optional[str] = None,
+    jwt: Optional[str] = None,
+    org_id: Optional[int] = None,
+) -> Tuple[List[SqlParam], List[SqlParam]]:
+    """
+    makes the update and where args of a user update, see update_user
+
+    returns:
+        Tuple containing...
+        List of the columns to set, None valued for unchanged columns
+        List of the columns that find the user
+    """
+    update_args: List[SqlParam] = [
+        SqlParam(
+            col_name="phone_prefix",
+            value=new_phone_prefix,
+            param_key="new_phone_prefix",
+        ),
+        SqlParam(col_name="phone", value=new_phone),
+        SqlParam(col_name="user_name", value=user_name),
+        SqlParam(col_name="pw_hash", value=pw_hash),
+        SqlParam(col_name="jwt", value=jwt),
+        SqlParam(col_name="org_id", value=org_id),
+    ]
+    where_args: List[SqlParam] = [
+        SqlParam(
+            col_name="phone_prefix",
+            value=phone_prefix,
+            param_key="old_phone_prefix",
+        ),
+        SqlParam(col_name="phone", value=phone, param_key="old_phone"),
+    ]
+    return update_args, where_args
+
+
 def update_user(
     phone_prefix: str,
     phone: str,
@@ -131,6 +704,7 @@ def update_user(
     pw_hash: Optional[str] = None,
     jwt: Optional[str] = None,
     org_id: Optional[int] = None,
+    cursor: Optional[Any] = None,
 ) -> bool:
     """
     creates a user
@@ -153,6 +727,10 @@ def update_user(
     org_id:
         the organization that the user is a member of
 
+    cursor:
+        a cursor from illu_db.transaction to run in, None for a transaction of
+        its own
+
     returns:
         boolean indicating the success of the insert and select transaction
     """
@@ -161,27 +739,20 @@ def update_user(
 
     success: bool = False
     param_dict: Dict[str, Any] = {}
-    with db.get_cursor() as cursor:
-        update_args: List[SqlParam] = [
-            SqlParam(
-                col_name="phone_prefix",
-                value=new_phone_prefix,
-                param_key="new_phone_prefix",
-            ),
-            SqlParam(col_name="phone", value=new_phone),
-            SqlParam(col_name="user_name", value=user_name),
-            SqlParam(col_name="pw_hash", value=pw_hash),
-            SqlParam(col_name="jwt", value=jwt),
-            SqlParam(col_name="org_id", value=org_id),
-        ]
-        where_args: List[SqlParam] = [
-            SqlParam(
-                col_name="phone_prefix",
-                value=phone_prefix,
-                param_key="old_phone_prefix",
-            ),
-            SqlParam(col_name="phone", value=phone, param_key="old_phone"),
-        ]
+    updated_ids: List[int] = []
+    update_args: List[SqlParam]
+    where_args: List[SqlParam]
+    update_args, where_args = make_user_update_args(
+        phone_prefix,
+        phone,
+        new_phone_prefix,
+        new_phone,
+        user_name,
+        pw_hash,
+        jwt,
+        org_id,
+    )
+    with db.get_cursor(cursor=cursor) as cursor:
         update_sql: str = make_update_sql(
             param_dict=param_dict,
             table_name="my_schema.illu_user",
@@ -190,13 +761,85 @@ def update_user(
             where_operator="AND",
         )
         if len(update_sql) != 0:
-            cursor.run(update_sql, param_dict)
+            updated_ids = cursor.all(update_sql + " RETURNING id", param_dict)
         success = True
 
+    after_commit(
+        cursor,
+        lambda: invalidate_users(
+            updated_ids,
+            [
+                (phone_prefix, phone),
+                (new_phone_prefix or phone_prefix, new_phone or phone),
+            ],
+        ),
+    )
     return success
 
 
-def delete_user(phone_prefix: str, phone: str) -> bool:
+def bulk_update_users(
+    rows: List[Dict[str, Any]], cursor: Optional[Any] = None
+) -> Tuple[bool, List[bool]]:
+    """
+    updates many users with one UPDATE ... FROM (VALUES ...) statement. Each row
+    may change a different set of columns
+
+    rows:
+        one dictionary per user with the update_user arguments as keys.
+        phone_prefix and phone find the user, every other key is optional and
+        None or missing leaves that column unchanged. If several rows find the
+        same user only one of them is applied, and only that one is reported as
+        changed
+
+    cursor:
+        a cursor from illu_db.transaction to run in, None for a transaction of
+        its own
+
+    returns:
+        Tuple containing...
+        boolean indicating the success of the update
+        List with one boolean per input row, in input order, indicating whether
+        the row found a user and changed it
+    """
+    db: Postgres = init_db()
+
+    success: bool = False
+    updated: List[Dict[str, Any]] = []
+    if len(rows) == 0:
+        return True, []
+
+    param_dict: Dict[str, Any] = {}
+    update_sql: str = make_bulk_update_sql(
+        param_dict=param_dict,
+        table_name="my_schema.illu_user",
+        rows=[make_user_update_args(**row) for row in rows],
+        col_types=USER_COL_TYPES,
+        returning_cols=["t.id", "v.ord"],
+    )
+    with db.get_cursor(cursor=cursor) as cursor:
+        if len(update_sql) != 0:
+            updated = cursor.all(update_sql, param_dict, back_as=dict)
+        success = True
+
+    applied: Set[int] = {user["ord"] for user in updated}
+    after_commit(
+        cursor,
+        lambda: invalidate_users(
+            [user["id"] for user in updated],
+            [(row["phone_prefix"], row["phone"]) for row in rows]
+            + [
+                (
+                    row.get("new_phone_prefix") or row["phone_prefix"],
+                    row.get("new_phone") or row["phone"],
+                )
+                for row in rows
+            ],
+        ),
+    )
+    return success, [index in applied for index in range(len(rows))]
+
+
+def delete_user(phone_prefix: str, phone: str, cursor: Optional[Any] = None) -> bool:
     """
     deletes a user
 
@@ -204,6 +847,9 @@ def delete_user(phone_prefix: str, phone: str) -> bool:
         The user's phone number country code
     phone:
         The user's phone number
+    cursor:
+        a cursor from illu_db.transaction to run in, None for a transaction of
+        its own
 
     returns:
         boolean indicating the success or failure of the deletion
@@ -211,17 +857,23 @@ def delete_user(phone_prefix: str, phone: str) -> bool:
     db: Postgres = init_db()
 
     success: bool = False
-    with db.get_cursor() as cursor:
-        cursor.run(
-            """
-                DELETE FROM
-                    my_schema.illu_user
-                WHERE
-                    phone_prefix=%(phone_prefix)s AND phone=%(phone)s
-            """,
+    with db.get_cursor(cursor=cursor) as cursor:
+        deleted_ids: List[int] = cursor.all(
+            prepared_sql(
+                cursor,
+                "illu_delete_user",
+                """
+                    DELETE FROM
+                        my_schema.illu_user
+                    WHERE
+                        phone_prefix=%(phone_prefix)s AND phone=%(phone)s
+                    RETURNING id
+                """,
+            ),
             phone_prefix=phone_prefix,
             phone=phone,
         )
         success = True
 
+    after_commit(cursor, lambda: invalidate_users(deleted_ids, [(phone_prefix, phone)]))
     return success
@@ -0,0 +1,278 @@
+from typing import Any, Dict, Hashable, List, Optional, Tuple, Union
+
+import asyncpg
+
+from db_user import (
+    cache_user,
+    invalidate_users,
+    make_select_user_sql,
+    USER_COLS,
+    user_cache_key,
+)
+from illu_cache import init_user_cache, TTLCache
+from illu_db_async import acquire, async_after_commit, init_async_db, init_async_read_db
+from make_sql import (
+    make_numbered_args,
+    make_update_sql,
+    make_upsert_sql,
+    ON_CONFLICT,
+    split_upsert_row,
+    SqlParam,
+    UPSERT_OUTCOME,
+)
+
+
+async def create_user(
+    phone_prefix: str,
+    phone: str,
+    user_name: str,
+    pw_hash: str,
+    jwt: Optional[str] = None,
+    org_id: Optional[int] = None,
+    connection: Optional[asyncpg.Connection] = None,
+) -> Tuple[bool, Dict[str, Any]]:
+    """
+    asyncio counterpart of db_user.create_user, takes the same arguments
+    with connection, a connection from async_transaction, in place of cursor
+
+    returns:
+        Tuple containing...
+        boolean indicating the success of the insert
+        Dictionary containing most of the user data, excluding some secrets
+    """
+    outcome: UPSERT_OUTCOME
+    result: Dict[str, Any]
+    _, outcome, result = await upsert_user(
+        phone_prefix,
+        phone,
+        user_name,
+        pw_hash,
+        jwt,
+        org_id,
+        on_conflict="nothing",
+        connection=connection,
+    )
+    return outcome == "inserted", result
+
+
+async def upsert_user(
+    phone_prefix: str,
+    phone: str,
+    user_name: str,
+    pw_hash: str,
+    jwt: Optional[str] = None,
+    org_id: Optional[int] = None,
+    on_conflict: ON_CONFLICT = "nothing",
+    connection: Optional[asyncpg.Connection] = None,
+) -> Tuple[bool, UPSERT_OUTCOME, Dict[str, Any]]:
+    """
+    asyncio counterpart of db_user.upsert_user, takes the same arguments
+    with connection, a connection from async_transaction, in place of cursor
+
+    returns:
+        Tuple containing...
+        boolean indicating the success of the statement
+        what happened: "inserted", "updated", "existing" or "skipped"
+        Dictionary containing most of the user data, empty if skipped
+    """
+    db: Union[asyncpg.Pool, asyncpg.Connection] = (
+        await init_async_db() if connection is None else connection
+    )
+
+    param_dict: Dict[str, Any] = {}
+    upsert_sql: str = make_upsert_sql(
+        param_dict=param_dict,
+        table_name="my_schema.illu_user",
+        insert_args=[
+            SqlParam(col_name="phone_prefix", value=phone_prefix),
+            SqlParam(col_name="phone", value=phone),
+            SqlParam(col_name="user_name", value=user_name),
+            SqlParam(col_name="pw_hash", value=pw_hash),
+            SqlParam(col_name="jwt", value=jwt),
+            SqlParam(col_name="org_id", value=org_id),
+        ],
+        conflict_cols=["phone_prefix", "phone"],
+        on_conflict=on_conflict,
+        returning_cols=USER_COLS,
+    )
+    sql, args = make_numbered_args(upsert_sql, param_dict)
+    async with acquire(db) as db:
+        record: Optional[asyncpg.Record] = await db.fetchrow(sql, *args)
+
+    outcome: UPSERT_OUTCOME
+    result: Dict[str, Any]
+    outcome, result = split_upsert_row(None if record is None else dict(record))
+    if outcome == "updated":
+        async_after_commit(
+            connection,
+            lambda: invalidate_users([result["id"]], [(phone_prefix, phone)]),
+        )
+    return True, outcome, result
+
+
+async def get_user(
+    user_id: Optional[int] = None,
+    phone_prefix: Optional[str] = None,
+    phone: Optional[str] = None,
+    user_name: Optional[str] = None,
+    org_id: Optional[int] = None,
+    after_id: Optional[int] = None,
+    limit: Optional[int] = None,
+    descending: bool = False,
+    version_only: bool = False,
+    primary: bool = False,
+    connection: Optional[asyncpg.Connection] = None,
+) -> Tuple[bool, List[Dict[str, Any]]]:
+    """
+    asyncio counterpart of db_user.get_user, takes the same arguments
+    with connection, a connection from async_transaction, in place of cursor
+
+    returns
+        Tuple containing...
+        boolean indicating whether the read succeeded
+        List containing users who matched the where expression
+    """
+    db: Union[asyncpg.Pool, asyncpg.Connection] = (
+        await init_async_read_db(primary) if connection is None else connection
+    )
+    # NOTE: see db_user.get_user, only users read from the primary are cached
+    from_primary: bool = db is await init_async_db()
+
+    params = {
+        "id": user_id,
+        "phone_prefix": phone_prefix,
+        "phone": phone,
+        "user_name": user_name,
+        "org_id": org_id,
+    }
+    cache_key: Optional[Hashable] = None
+    # NOTE: a cached lookup finds at most one user, so any limit returns it all
+    if (
+        after_id is None
+        and (limit is None or limit >= 1)
+        and not version_only
+        and connection is None
+    ):
+        cache_key = user_cache_key(params)
+    generation: int = 0
+    if cache_key is not None:
+        cache: TTLCache = init_user_cache()
+        if not primary:
+            cached: Optional[Dict[str, Any]] = cache.get(cache_key)
+            if cached is not None:
+                return True, [dict(cached)]
+        generation = cache.generation(cache_key)
+
+    param_dict: Dict[str, Any] = {}
+    sql, args = make_numbered_args(
+        make_select_user_sql(
+            param_dict, params, after_id, limit, descending, version_only
+        ),
+        param_dict,
+    )
+    async with acquire(db) as db:
+        records: List[asyncpg.Record] = await db.fetch(sql, *args)
+    result: List[Dict[str, Any]] = [dict(record) for record in records]
+
+    if cache_key is not None and from_primary and len(result) == 1:
+        cache_user(result[0], (cache_key, generation))
+
+    return True, result
+
+
+async def update_user(
+    phone_prefix: str,
+    phone: str,
+    new_phone_prefix: Optional[str] = None,
+    new_phone: Optional[str] = None,
+    user_name: Optional[str] = None,
+    pw_hash: Optional[str] = None,
+    jwt: Optional[str] = None,
+    org_id: Optional[int] = None,
+    connection: Optional[asyncpg.Connection] = None,
+) -> bool:
+    """
+    asyncio counterpart of db_user.update_user, takes the same arguments
+    with connection, a connection from async_transaction, in place of cursor
+
+    returns:
+        boolean indicating the success of the update
+    """
+    db: Union[asyncpg.Pool, asyncpg.Connection] = (
+        await init_async_db() if connection is None else connection
+    )
+
+    param_dict: Dict[str, Any] = {}
+    update_sql: str = make_update_sql(
+        param_dict=param_dict,
+        table_name="my_schema.illu_user",
+        update_args=[
+            SqlParam(
+                col_name="phone_prefix",
+                value=new_phone_prefix,
+                param_key="new_phone_prefix",
+            ),
+            SqlParam(col_name="phone", value=new_phone),
+            SqlParam(col_name="user_name", value=user_name),
+            SqlParam(col_name="pw_hash", value=pw_hash),
+            SqlParam(col_name="jwt", value=jwt),
+            SqlParam(col_name="org_id", value=org_id),
+        ],
+        where_args=[
+            SqlParam(
+                col_name="phone_prefix",
+                value=phone_prefix,
+                param_key="old_phone_prefix",
+            ),
+            SqlParam(col_name="phone", value=phone, param_key="old_phone"),
+        ],
+        where_operator="AND",
+    )
+    updated_ids: List[int] = []
+    if len(update_sql) != 0:
+        sql, args = make_numbered_args(update_sql + " RETURNING id", param_dict)
+        async with acquire(db) as db:
+            updated_ids = [record["id"] for record in await db.fetch(sql, *args)]
+
+    async_after_commit(
+        connection,
+        lambda: invalidate_users(
+            updated_ids,
+            [
+                (phone_prefix, phone),
+                (new_phone_prefix or phone_prefix, new_phone or phone),
+            ],
+        ),
+    )
+    return True
+
+
+async def delete_user(
+    phone_prefix: str, phone: str, connection: Optional[asyncpg.Connection] = None
+) -> bool:
+    """
+    asyncio counterpart of db_user.delete_user, takes the same arguments
+    with connection, a connection from async_transaction, in place of cursor
+
+    returns:
+        boolean indicating the success or failure of the deletion
+    """
+    db: Union[asyncpg.Pool, asyncpg.Connection] = (
+        await init_async_db() if connection is None else connection
+    )
+
+    async with acquire(db) as db:
+        records: List[asyncpg.Record] = await db.fetch(
+            "DELETE FROM my_schema.illu_user WHERE phone_prefix=$1 AND phone=$2 "
+            "RETURNING id",
+            phone_prefix,
+            phone,
+        )
+
+    async_after_commit(
+        connection,
+        lambda: invalidate_users(
+            [record["id"] for record in records], [(phone_prefix, phone)]
+        ),
+    )
+    return True
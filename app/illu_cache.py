@@ -0,0 +1,159 @@
+import os
+import threading
+from collections import OrderedDict
+from time import monotonic
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+from illu_config import load_env
+
+# NOTE: keys share delete counters by hash, so they stay bounded. A shared counter
+# only makes a fill skip the cache more often
+GENERATION_SLOTS: int = 1024
+
+
+class TTLCache:
+    """
+    Thread safe in-process LRU cache whose entries also expire after ttl seconds
+    """
+
+    maxsize: int
+    ttl: float
+    hits: int
+    misses: int
+    evictions: int
+    expirations: int
+
+    def __init__(self, maxsize: int, ttl: float):
+        """
+        maxsize:
+            the number of entries to keep before evicting the least recently used.
+            0 disables the cache
+        ttl:
+            seconds an entry is served for after it was set
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._generations: List[int] = [0] * GENERATION_SLOTS
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """
+        returns:
+            the cached value, None if it is missing or expired
+        """
+        with self._lock:
+            entry: Optional[Tuple[float, Any]] = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+                self.expirations += 1
+            self.misses += 1
+            return None
+
+    def generation(self, key: Hashable) -> int:
+        """
+        returns:
+            a counter that changes whenever the key is deleted. Read it before
+            fetching a value to set, see set
+        """
+        with self._lock:
+            return self._generations[hash(key) % GENERATION_SLOTS]
+
+    def set(
+        self, key: Hashable, value: Any, guard: Optional[Tuple[Hashable, int]] = None
+    ) -> None:
+        """
+        guard:
+            a key and its generation from before the value was fetched. The value
+            isn't set if that key was deleted since, so a fill that raced a write
+            doesn't cache what the write replaced
+        """
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            if guard is not None:
+                guard_key, generation = guard
+                if self._generations[hash(guard_key) % GENERATION_SLOTS] != generation:
+                    return
+            self._entries[key] = (monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+            self._generations[hash(key) % GENERATION_SLOTS] += 1
+
+    def clear(self) -> None:
+        """
+        drops all entries and resets the counters
+        """
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+            self.expirations = 0
+
+    def stats(self) -> Dict[str, float]:
+        """
+        returns:
+            Dictionary containing the size, hits, misses, hit_rate, evictions and
+            expirations of the cache
+        """
+        with self._lock:
+            lookups: int = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups > 0 else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+USER_CACHE: Optional[TTLCache] = None
+
+
+def reset_user_cache_after_fork() -> None:
+    """
+    Runs in the child after every fork. The inherited cache's lock may have been
+    held by a thread that didn't survive the fork, so the child starts a new cache
+    """
+    global USER_CACHE
+
+    USER_CACHE = None
+
+
+os.register_at_fork(after_in_child=reset_user_cache_after_fork)
+
+
+def init_user_cache() -> TTLCache:
+    """
+    Checks if the get_user cache is initialized and initializes it if it hasn't been.
+    Sized by USER_CACHE_SIZE (0 disables it) and USER_CACHE_TTL seconds from .env
+
+    returns:
+        the user cache
+    """
+    global USER_CACHE
+
+    if USER_CACHE is None:
+        load_env()
+        USER_CACHE = TTLCache(
+            maxsize=int(os.environ.get("USER_CACHE_SIZE", "1024")),
+            ttl=float(os.environ.get("USER_CACHE_TTL", "30")),
+        )
+    return USER_CACHE
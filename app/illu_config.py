@@ -0,0 +1,16 @@
+ENV_LOADED: bool = False
+
+
+def load_env() -> None:
+    """
+    Reads the .env file into the environment the first time it is called, every
+    setting is read through here so the file is only parsed once per process.
+    Variables that are already set win over the file
+    """
+    global ENV_LOADED
+
+    if not ENV_LOADED:
+        from dotenv import load_dotenv
+
+        load_dotenv()
+        ENV_LOADED = True
@@ -1,10 +1,223 @@
+import itertools
 import os
-from typing import Optional
+import threading
+from contextlib import contextmanager
+from functools import partial
+from time import perf_counter
+from typing import Any, Callable, Dict, Iterator, List, Optional
 
 from postgres import Postgres
-from dotenv import load_dotenv
+from psycopg2_pool import ConnectionPool, PoolError, ThreadSafeConnectionPool
+
+import illu_query_stats
+from illu_config import load_env
+from illu_query_stats import InstrumentedCursor, record_checkout
 
 DB: Optional[Postgres] = None
+# NOTE: the read replicas from PG_REPLICA_CONNS, empty without any
+REPLICAS: Optional[List[Postgres]] = None
+REPLICA_TURN: Iterator[int] = itertools.count()
+# NOTE: shared by both pools, see get_db_config
+DB_CONFIG: Optional["DbConfig"] = None
+# NOTE: opt in with PG_PREPARED_STATEMENTS=true, see illu_prepared
+PREPARED_STATEMENTS: bool = False
+# NOTE: pools a forked process inherited from its parent. Their connections share
+# sockets with the parent's, so they are kept referenced and never closed, closing
+# or garbage collecting them would end the parent's sessions
+INHERITED_POOLS: List[Any] = []
+
+
+class DbConfig:
+    """
+    Connection pool settings, read from the environment (.env)
+    """
+
+    url: str
+    minconn: int
+    maxconn: int
+    idle_timeout: float
+    acquire_timeout: float
+    prepared_statements: bool
+    slow_query_ms: float
+    workers: int
+    max_connections: Optional[int]
+    replica_urls: List[str]
+    replica_selection: str
+
+    def __init__(self) -> None:
+        load_env()
+        self.url = os.environ["LOCAL_PG_CONN"]
+        # NOTE: minconn connections are opened up front and kept open while idle
+        self.minconn = int(os.environ.get("PG_POOL_MIN", "1"))
+        self.maxconn = int(os.environ.get("PG_POOL_MAX", "10"))
+        # NOTE: seconds before an idle connection above minconn is closed
+        self.idle_timeout = float(os.environ.get("PG_POOL_IDLE_TIMEOUT", "600"))
+        # NOTE: seconds to wait for a connection when all maxconn are in use
+        self.acquire_timeout = float(os.environ.get("PG_POOL_ACQUIRE_TIMEOUT", "5"))
+        self.prepared_statements = (
+            os.environ.get("PG_PREPARED_STATEMENTS", "false").lower() == "true"
+        )
+        # NOTE: statements at least this slow are logged, -1 turns the log off
+        self.slow_query_ms = float(os.environ.get("PG_SLOW_QUERY_MS", "200"))
+        # NOTE: comma separated connection urls of read replicas of LOCAL_PG_CONN
+        self.replica_urls = [
+            url.strip()
+            for url in os.environ.get("PG_REPLICA_CONNS", "").split(",")
+            if url.strip()
+        ]
+        # NOTE: "round_robin" or "least_busy", the replica with the fewest
+        # connections in use
+        self.replica_selection = os.environ.get("PG_REPLICA_SELECTION", "round_robin")
+        if self.replica_selection not in ("round_robin", "least_busy"):
+            raise ValueError(
+                f"PG_REPLICA_SELECTION must be round_robin or least_busy, "
+                f"not {self.replica_selection}"
+            )
+        # NOTE: the number of app processes, set by serve.py and read by uvicorn
+        # and gunicorn too
+        self.workers = int(os.environ.get("WEB_CONCURRENCY", "1"))
+        max_connections: Optional[str] = os.environ.get("PG_MAX_CONNECTIONS")
+        self.max_connections = None
+        if max_connections:
+            self.max_connections = int(max_connections)
+            # NOTE: every worker has a sync and an asyncio pool, so the cap for all
+            # workers is split between 2 * workers pools
+            budget: int = max(1, self.max_connections // (2 * self.workers))
+            self.maxconn = min(self.maxconn, budget)
+            self.minconn = min(self.minconn, self.maxconn)
+
+
+def get_db_config() -> DbConfig:
+    """
+    returns:
+        the settings, read from the environment the first time they are needed
+    """
+    global DB_CONFIG
+
+    if DB_CONFIG is None:
+        DB_CONFIG = DbConfig()
+    return DB_CONFIG
+
+
+def reset_after_fork() -> None:
+    """
+    Runs in the child after every fork. A pool created before the fork, e.g. by
+    gunicorn --preload, is set aside so the child opens its own connections
+    """
+    global DB, REPLICAS
+
+    if DB is not None:
+        INHERITED_POOLS.append(DB)
+        DB = None
+    if REPLICAS is not None:
+        INHERITED_POOLS.extend(REPLICAS)
+        REPLICAS = None
+
+
+os.register_at_fork(after_in_child=reset_after_fork)
+
+
+class IlluConnectionPool(ThreadSafeConnectionPool):
+    """
+    Thread safe pool that waits for a connection to be returned when it is
+    exhausted, instead of failing right away, and keeps acquisition stats
+    """
+
+    def __init__(self, acquire_timeout: float, **kwargs: Any):
+        """
+        acquire_timeout:
+            seconds to wait for a connection before raising PoolError
+
+        kwargs:
+            passed to psycopg2_pool.ConnectionPool
+        """
+        super().__init__(**kwargs)
+        self.acquire_timeout = acquire_timeout
+        self.returned = threading.Condition(self.lock)
+        self.waiting = 0
+        self.acquires = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def getconn(self) -> Any:
+        start: float = perf_counter()
+        deadline: float = start + self.acquire_timeout
+        with self.returned:
+            while True:
+                try:
+                    conn: Any = ConnectionPool.getconn(self)
+                    # NOTE: the base pool only tracks connections it just opened, so
+                    # reused idle ones would not count towards in_use or maxconn
+                    self.connections_in_use.add(conn)
+                    break
+                except PoolError:
+                    remaining: float = deadline - perf_counter()
+                    if remaining <= 0:
+                        self.timeouts += 1
+                        raise
+                    self.waiting += 1
+                    self.returned.wait(remaining)
+                    self.waiting -= 1
+
+            wait_seconds: float = perf_counter() - start
+            self.acquires += 1
+            self.wait_seconds_total += wait_seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, wait_seconds)
+        record_checkout(wait_seconds)
+        return conn
+
+    def putconn(self, conn: Any) -> None:
+        with self.returned:
+            ConnectionPool.putconn(self, conn)
+            self.returned.notify()
+
+    def stats(self) -> Dict[str, float]:
+        """
+        returns:
+            Dictionary containing...
+            in_use, idle: current connection counts
+            maxconn: the pool's connection limit
+            waiting: threads currently waiting for a connection
+            acquires, timeouts: totals since the pool was created
+            wait_seconds_total, wait_seconds_max, wait_seconds_avg: time spent
+            waiting to acquire a connection
+        """
+        with self.lock:
+            return {
+                "in_use": len(self.connections_in_use),
+                "idle": len(self.idle_connections),
+                "maxconn": self.maxconn,
+                "waiting": self.waiting,
+                "acquires": self.acquires,
+                "timeouts": self.timeouts,
+                "wait_seconds_total": self.wait_seconds_total,
+                "wait_seconds_max": self.wait_seconds_max,
+                "wait_seconds_avg": (
+                    self.wait_seconds_total / self.acquires if self.acquires else 0.0
+                ),
+            }
+
+
+def make_db(url: str, config: DbConfig) -> Postgres:
+    """
+    url:
+        the connection url of the primary or of a replica
+
+    config:
+        the pool settings
+
+    returns:
+        Postgres db instance with its own pool
+    """
+    return Postgres(
+        url=url,
+        minconn=config.minconn,
+        maxconn=config.maxconn,
+        idle_timeout=config.idle_timeout,
+        cursor_factory=InstrumentedCursor,
+        pool_class=partial(IlluConnectionPool, acquire_timeout=config.acquire_timeout),
+    )
 
 
 def init_db() -> Postgres:
@@ -15,9 +228,146 @@ def init_db() -> Postgres:
     returns:
         Postgres db instance
     """
-    global DB
+    global DB, PREPARED_STATEMENTS
 
     if DB is None:
-        load_dotenv()
-        DB = Postgres(url=os.environ["LOCAL_PG_CONN"])
+        config: DbConfig = get_db_config()
+        PREPARED_STATEMENTS = config.prepared_statements
+        illu_query_stats.SLOW_QUERY_MS = config.slow_query_ms
+        DB = make_db(config.url, config)
     return DB
+
+
+def init_replicas() -> List[Postgres]:
+    """
+    Checks if the read replicas are initialized and initializes them if they
+    haven't been
+
+    returns:
+        List of a Postgres db instance for every url in PG_REPLICA_CONNS
+    """
+    global REPLICAS
+
+    if REPLICAS is None:
+        init_db()
+        config: DbConfig = get_db_config()
+        REPLICAS = [make_db(url, config) for url in config.replica_urls]
+    return REPLICAS
+
+
+def init_read_db(primary: bool = False) -> Postgres:
+    """
+    Picks the database for a read-only query. Use this instead of init_db at the
+    start of read-only helpers, writes always go to init_db
+
+    primary:
+        read from the primary anyway, for reads that have to see the caller's own
+        writes. Replicas apply them with some lag
+
+    returns:
+        Postgres db instance of a replica, PG_REPLICA_SELECTION picks which, or of
+        the primary when there are no replicas
+    """
+    if primary:
+        return init_db()
+    replicas: List[Postgres] = init_replicas()
+    if len(replicas) == 0:
+        return init_db()
+    # NOTE: least_busy starts from the round robin turn too, so ties rotate
+    turn: int = next(REPLICA_TURN) % len(replicas)
+    if get_db_config().replica_selection == "least_busy":
+        return min(
+            replicas[turn:] + replicas[:turn],
+            key=lambda replica: len(replica.pool.connections_in_use),
+        )
+    return replicas[turn]
+
+
+@contextmanager
+def transaction() -> Iterator[Any]:
+    """
+    A unit of work. Pass the cursor it yields as the cursor argument of the
+    db_user and db_org helpers to run them on one primary connection in one
+    transaction. It commits when the block ends and rolls back if it raises
+
+        with transaction() as cursor:
+            _, org = create_org("org", cursor=cursor)
+            create_user(..., org_id=org["id"], cursor=cursor)
+
+    returns:
+        Iterator yielding the cursor of the transaction
+    """
+    callbacks: List[Callable[[], None]] = []
+    with init_db().get_cursor() as cursor:
+        cursor.illu_after_commit = callbacks
+        yield cursor
+    # NOTE: only reached once the cursor's context manager has committed
+    for callback in callbacks:
+        callback()
+
+
+def after_commit(cursor: Optional[Any], callback: Callable[[], None]) -> None:
+    """
+    Runs callback once the caller's writes are committed, e.g. to invalidate
+    caches. Helpers that take a cursor call this after their with block
+
+    cursor:
+        the cursor argument of the helper. With a cursor from transaction() the
+        callback waits for the commit at the end of the transaction, otherwise
+        the helper committed its own transaction and the callback runs right away
+    """
+    callbacks: Optional[List[Callable[[], None]]] = getattr(
+        cursor, "illu_after_commit", None
+    )
+    if callbacks is None:
+        callback()
+    else:
+        callbacks.append(callback)
+
+
+def warm_db(count: Optional[int] = None) -> int:
+    """
+    Opens and checks connections before the first request needs them.
+    Call this from the app's startup event
+
+    count:
+        how many connections to have open. Defaults to the pool's minconn
+
+    returns:
+        the number of connections that were checked
+    """
+    # NOTE: replica pools open their minconn connections when they are created
+    init_replicas()
+    db: Postgres = init_db()
+    if count is None:
+        count = db.pool.minconn
+
+    # NOTE: hold them all at once, otherwise the pool hands back the same connection
+    connections: List[Any] = []
+    try:
+        for _ in range(min(count, db.pool.maxconn)):
+            connections.append(db.pool.getconn())
+        for conn in connections:
+            with conn.cursor() as cursor:
+                cursor.run("SELECT 1")
+            conn.rollback()
+    finally:
+        for conn in connections:
+            db.pool.putconn(conn)
+    return len(connections)
+
+
+def get_pool_stats() -> Dict[str, float]:
+    """
+    returns:
+        the connection pool stats, see IlluConnectionPool.stats
+    """
+    return init_db().pool.stats()
+
+
+def get_replica_pool_stats() -> List[Dict[str, float]]:
+    """
+    returns:
+        List of the pool stats of every replica, see IlluConnectionPool.stats
+    """
+    return [replica.pool.stats() for replica in init_replicas()]
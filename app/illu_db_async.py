@@ -0,0 +1,263 @@
+import itertools
+import os
+from contextlib import asynccontextmanager
+from time import perf_counter
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Union
+
+import asyncpg
+
+from illu_db import DbConfig, get_db_config, INHERITED_POOLS
+from illu_query_stats import record_query
+from illu_timing import record_phase
+
+ASYNC_DB: Optional[asyncpg.Pool] = None
+# NOTE: the asyncio pools of the read replicas, see illu_db.init_replicas
+ASYNC_REPLICAS: Optional[List[asyncpg.Pool]] = None
+ASYNC_REPLICA_TURN: Iterator[int] = itertools.count()
+# NOTE: the after_commit callbacks of every open async_transaction, by the id of
+# its connection. Pooled connections outlive the transaction, so nothing is
+# stored on them
+TRANSACTION_CALLBACKS: Dict[int, List[Callable[[], None]]] = {}
+
+
+class TimedConnection(asyncpg.Connection):
+    """
+    The connection class of the asyncio pools. Times every statement and records
+    it with record_query while the request that ran it is still being handled,
+    which asyncpg's query loggers don't, they are called later on the event loop.
+    cursor() and the copy_* methods aren't timed, the helpers don't use them
+    """
+
+    async def _timed(self, method: Any, query: str, *args: Any, **kwargs: Any) -> Any:
+        failed: bool = True
+        start: float = perf_counter()
+        try:
+            result: Any = await method(query, *args, **kwargs)
+            failed = False
+            return result
+        finally:
+            record_query(query, [], perf_counter() - start, failed)
+
+    async def execute(self, query: str, *args: Any, **kwargs: Any) -> Any:
+        return await self._timed(super().execute, query, *args, **kwargs)
+
+    async def fetch(self, query: str, *args: Any, **kwargs: Any) -> Any:
+        return await self._timed(super().fetch, query, *args, **kwargs)
+
+    async def fetchrow(self, query: str, *args: Any, **kwargs: Any) -> Any:
+        return await self._timed(super().fetchrow, query, *args, **kwargs)
+
+    async def fetchval(self, query: str, *args: Any, **kwargs: Any) -> Any:
+        return await self._timed(super().fetchval, query, *args, **kwargs)
+
+    async def executemany(self, command: str, args: Any, **kwargs: Any) -> Any:
+        return await self._timed(super().executemany, command, args, **kwargs)
+
+
+@asynccontextmanager
+async def acquire(
+    db: Union[asyncpg.Pool, asyncpg.Connection],
+) -> AsyncIterator[asyncpg.Connection]:
+    """
+    Checks a connection out of a pool and adds the wait to the db_checkout time of
+    the request being handled. Use this instead of the pool's fetch and execute
+    shortcuts, which aren't timed
+
+    db:
+        a pool, or a connection, e.g. from async_transaction, which is used as is
+
+    returns:
+        AsyncIterator yielding the connection
+    """
+    if not isinstance(db, asyncpg.Pool):
+        yield db
+        return
+    start: float = perf_counter()
+    async with db.acquire() as connection:
+        record_phase("db_checkout", perf_counter() - start)
+        yield connection
+
+
+def reset_async_after_fork() -> None:
+    """
+    Runs in the child after every fork, see illu_db.reset_after_fork. The pool
+    also belongs to the parent's event loop, the child's loop opens its own
+    """
+    global ASYNC_DB, ASYNC_REPLICAS
+
+    if ASYNC_DB is not None:
+        INHERITED_POOLS.append(ASYNC_DB)
+        ASYNC_DB = None
+    if ASYNC_REPLICAS is not None:
+        INHERITED_POOLS.extend(ASYNC_REPLICAS)
+        ASYNC_REPLICAS = None
+
+
+os.register_at_fork(after_in_child=reset_async_after_fork)
+
+
+async def make_async_db(url: str, config: DbConfig) -> asyncpg.Pool:
+    """
+    url:
+        the connection url of the primary or of a replica
+
+    config:
+        the pool settings
+
+    returns:
+        asyncpg connection pool
+    """
+    # NOTE: asyncpg opens min_size connections while creating the pool
+    return await asyncpg.create_pool(
+        url,
+        min_size=config.minconn,
+        max_size=config.maxconn,
+        max_inactive_connection_lifetime=config.idle_timeout,
+        connection_class=TimedConnection,
+    )
+
+
+async def init_async_db() -> asyncpg.Pool:
+    """
+    Checks if the asyncio connection pool is initialized and initializes it if it
+    hasn't been. Use this at the start of each of your async db queries
+
+    returns:
+        asyncpg connection pool
+    """
+    global ASYNC_DB
+
+    if ASYNC_DB is None:
+        config: DbConfig = get_db_config()
+        ASYNC_DB = await make_async_db(config.url, config)
+    return ASYNC_DB
+
+
+async def init_async_replicas() -> List[asyncpg.Pool]:
+    """
+    Checks if the asyncio pools of the read replicas are initialized and
+    initializes them if they haven't been
+
+    returns:
+        List of an asyncpg connection pool for every url in PG_REPLICA_CONNS
+    """
+    global ASYNC_REPLICAS
+
+    if ASYNC_REPLICAS is None:
+        config: DbConfig = get_db_config()
+        ASYNC_REPLICAS = [
+            await make_async_db(url, config) for url in config.replica_urls
+        ]
+    return ASYNC_REPLICAS
+
+
+async def init_async_read_db(primary: bool = False) -> asyncpg.Pool:
+    """
+    asyncio counterpart of illu_db.init_read_db, takes the same arguments
+
+    returns:
+        asyncpg connection pool of a replica, or of the primary when there are no
+        replicas
+    """
+    if primary:
+        return await init_async_db()
+    replicas: List[asyncpg.Pool] = await init_async_replicas()
+    if len(replicas) == 0:
+        return await init_async_db()
+    turn: int = next(ASYNC_REPLICA_TURN) % len(replicas)
+    if get_db_config().replica_selection == "least_busy":
+        return min(
+            replicas[turn:] + replicas[:turn],
+            key=lambda replica: replica.get_size() - replica.get_idle_size(),
+        )
+    return replicas[turn]
+
+
+@asynccontextmanager
+async def async_transaction() -> AsyncIterator[asyncpg.Connection]:
+    """
+    asyncio counterpart of illu_db.transaction. Pass the connection it yields as
+    the connection argument of the db_user_async and db_org_async helpers
+
+    returns:
+        AsyncIterator yielding the connection of the transaction
+    """
+    db: asyncpg.Pool = await init_async_db()
+    callbacks: List[Callable[[], None]] = []
+    async with acquire(db) as connection:
+        TRANSACTION_CALLBACKS[id(connection)] = callbacks
+        try:
+            async with connection.transaction():
+                yield connection
+        finally:
+            del TRANSACTION_CALLBACKS[id(connection)]
+    # NOTE: only reached once the transaction has committed
+    for callback in callbacks:
+        callback()
+
+
+def async_after_commit(
+    connection: Optional[asyncpg.Connection], callback: Callable[[], None]
+) -> None:
+    """
+    asyncio counterpart of illu_db.after_commit, for helpers that take a
+    connection from async_transaction
+    """
+    callbacks: Optional[List[Callable[[], None]]] = None
+    if connection is not None:
+        callbacks = TRANSACTION_CALLBACKS.get(id(connection))
+    if callbacks is None:
+        callback()
+    else:
+        callbacks.append(callback)
+
+
+async def close_async_db() -> None:
+    """
+    Closes the asyncio connection pools if they were initialized
+    """
+    global ASYNC_DB, ASYNC_REPLICAS
+
+    if ASYNC_DB is not None:
+        await ASYNC_DB.close()
+        ASYNC_DB = None
+    if ASYNC_REPLICAS is not None:
+        for replica in ASYNC_REPLICAS:
+            await replica.close()
+        ASYNC_REPLICAS = None
+
+
+def make_async_pool_stats(pool: Optional[asyncpg.Pool]) -> Dict[str, float]:
+    """
+    pool:
+        an asyncio pool, None if it isn't initialized
+
+    returns:
+        Dictionary containing the in_use and idle connection counts and the
+        maxconn limit of the pool, all 0 if it isn't initialized
+    """
+    if pool is None:
+        return {"in_use": 0, "idle": 0, "maxconn": 0}
+    idle: int = pool.get_idle_size()
+    return {
+        "in_use": pool.get_size() - idle,
+        "idle": idle,
+        "maxconn": pool.get_max_size(),
+    }
+
+
+def get_async_pool_stats() -> Dict[str, float]:
+    """
+    returns:
+        the stats of the asyncio pool of the primary, see make_async_pool_stats
+    """
+    return make_async_pool_stats(ASYNC_DB)
+
+
+def get_async_replica_pool_stats() -> List[Dict[str, float]]:
+    """
+    returns:
+        List of the stats of the asyncio pool of every replica, empty if they
+        aren't initialized
+    """
+    return [make_async_pool_stats(replica) for replica in ASYNC_REPLICAS or []]
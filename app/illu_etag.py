@@ -0,0 +1,48 @@
+import hashlib
+from typing import Any, Dict, List, Optional
+
+
+def make_etag(rows: List[Dict[str, Any]]) -> str:
+    """
+    makes a weak ETag from the id and version of every row. The version goes up on
+    every update, and inserted or deleted rows change the set of ids, so the ETag
+    changes whenever the rows do. Order is ignored, unpaginated reads aren't sorted
+
+    rows:
+        the rows of a read, or only their id and version
+
+    returns:
+        the ETag, e.g. W/"9f86d081884c7d659a2feaa0c55ad015"
+    """
+    versions: List[str] = sorted(f"{row['id']}:{row['version']}" for row in rows)
+    digest: str = hashlib.blake2b(
+        ",".join(versions).encode(), digest_size=16
+    ).hexdigest()
+    return f'W/"{digest}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    the weak comparison that If-None-Match uses
+
+    if_none_match:
+        the request's If-None-Match header, None if it had none
+
+    etag:
+        the ETag of the current rows
+
+    returns:
+        whether the client's copy is current and a 304 can be sent
+    """
+    if if_none_match is None:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque: str = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
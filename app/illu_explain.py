@@ -0,0 +1,332 @@
+import re
+from itertools import combinations
+from typing import Any, Dict, List, Optional, Tuple
+
+from db_org import ORG_COLS, SELECT_ORG_WITH_MEMBERS
+from db_user import (
+    make_select_user_sql,
+    make_user_update_args,
+    SELECT_USER,
+    SELECT_USERS_BY_PHONES,
+    USER_COL_TYPES,
+    USER_COLS,
+)
+from make_sql import (
+    make_bulk_update_sql,
+    make_update_sql,
+    make_upsert_sql,
+    make_where_sql_col,
+    SqlParam,
+)
+
+# NOTE: sample values for the get_user filters. They only need the right types,
+# the plans are estimated from the table statistics
+SAMPLE_FILTERS: Dict[str, Any] = {
+    "id": 1,
+    "phone_prefix": "+1",
+    "phone": "5550001",
+    "user_name": "sample user",
+    "org_id": 1,
+}
+# NOTE: plan nodes that read a whole relation
+SCAN_NODES: Tuple[str, ...] = ("Seq Scan", "Index Scan", "Index Only Scan")
+# NOTE: plan nodes with an "Index Cond" on the index in "Index Name"
+INDEX_NODES: Tuple[str, ...] = ("Index Scan", "Index Only Scan", "Bitmap Index Scan")
+SELECT_LEADING_COLUMNS: str = """
+    SELECT index_class.relname AS index_name, attribute.attname AS column_name
+    FROM pg_index
+    JOIN pg_class index_class ON index_class.oid = pg_index.indexrelid
+    JOIN pg_namespace ON pg_namespace.oid = index_class.relnamespace
+    JOIN pg_attribute attribute ON attribute.attrelid = pg_index.indrelid
+        AND attribute.attnum = pg_index.indkey[0]
+    WHERE pg_namespace.nspname = 'my_schema'
+"""
+
+
+class QueryShape:
+    name: str
+    sql: str
+    params: Dict[str, Any]
+
+    def __init__(self, name: str, sql: str, params: Dict[str, Any]):
+        """
+        name:
+            what issues the query and which filters it uses
+        sql:
+            the statement, as the app generates it
+        params:
+            sample values for its placeholders
+        """
+        self.name = name
+        self.sql = sql
+        self.params = params
+
+
+class PlanReport:
+    shape: QueryShape
+    total_cost: float
+    full_scans: List[str]
+
+    def __init__(self, shape: QueryShape, total_cost: float, full_scans: List[str]):
+        """
+        shape:
+            the explained query
+        total_cost:
+            the planner's cost estimate for the whole statement
+        full_scans:
+            the relations the plan reads in full, e.g. "Seq Scan on illu_user"
+        """
+        self.shape = shape
+        self.total_cost = total_cost
+        self.full_scans = full_scans
+
+
+def get_user_shapes() -> List[QueryShape]:
+    """
+    every combination of get_user and iter_users filters, each unpaged and with
+    keyset pagination
+
+    returns:
+        List of the select shapes
+    """
+    shapes: List[QueryShape] = []
+    for count in range(len(SAMPLE_FILTERS) + 1):
+        for used in combinations(SAMPLE_FILTERS, count):
+            params: Dict[str, Any] = {
+                key: value if key in used else None
+                for key, value in SAMPLE_FILTERS.items()
+            }
+            name: str = " ".join(used) or "all"
+            param_dict: Dict[str, Any] = {}
+            shapes.append(
+                QueryShape(
+                    f"get_user {name}",
+                    make_select_user_sql(param_dict, params),
+                    param_dict,
+                )
+            )
+            param_dict = {}
+            shapes.append(
+                QueryShape(
+                    f"get_user {name} paged",
+                    make_select_user_sql(param_dict, params, after_id=1, limit=50),
+                    param_dict,
+                )
+            )
+    return shapes
+
+
+def write_shapes() -> List[QueryShape]:
+    """
+    the user and org statements that find rows by something other than a get_user
+    filter
+
+    returns:
+        List of the shapes
+    """
+    shapes: List[QueryShape] = []
+
+    param_dict: Dict[str, Any] = {}
+    select_sql: str = SELECT_USER + make_where_sql_col(
+        param_dict,
+        [SqlParam(col_name="id", value=[1, 2], param_key="ids", comparison="= ANY")],
+        "AND",
+    )
+    shapes.append(QueryShape("get_users_by_ids", select_sql, param_dict))
+    shapes.append(
+        QueryShape(
+            "get_users_by_phones",
+            SELECT_USERS_BY_PHONES,
+            {"phone_prefixes": ["+1", "+1"], "phones": ["5550001", "5550002"]},
+        )
+    )
+
+    update_args: List[SqlParam]
+    where_args: List[SqlParam]
+    update_args, where_args = make_user_update_args("+1", "5550001", user_name="x")
+    param_dict = {}
+    update_sql: str = make_update_sql(
+        param_dict, "my_schema.illu_user", update_args, where_args, "AND"
+    )
+    shapes.append(QueryShape("update_user", update_sql, param_dict))
+    param_dict = {}
+    update_sql = make_bulk_update_sql(
+        param_dict,
+        "my_schema.illu_user",
+        [
+            make_user_update_args("+1", "5550001", user_name="x"),
+            make_user_update_args("+1", "5550002", org_id=1),
+        ],
+        USER_COL_TYPES,
+        ["t.id"],
+    )
+    shapes.append(QueryShape("bulk_update_users", update_sql, param_dict))
+    shapes.append(
+        QueryShape(
+            "delete_user",
+            "DELETE FROM my_schema.illu_user "
+            "WHERE phone_prefix=%(phone_prefix)s AND phone=%(phone)s",
+            {"phone_prefix": "+1", "phone": "5550001"},
+        )
+    )
+
+    param_dict = {}
+    upsert_sql: str = make_upsert_sql(
+        param_dict,
+        "my_schema.illu_user",
+        [
+            SqlParam(col_name="phone_prefix", value="+1"),
+            SqlParam(col_name="phone", value="5550001"),
+            SqlParam(col_name="user_name", value="x"),
+            SqlParam(col_name="pw_hash", value="x"),
+        ],
+        ["phone_prefix", "phone"],
+        "existing",
+        USER_COLS,
+    )
+    shapes.append(QueryShape("upsert_user existing", upsert_sql, param_dict))
+    param_dict = {}
+    upsert_sql = make_upsert_sql(
+        param_dict,
+        "my_schema.organization",
+        [SqlParam(col_name="org_name", value="x")],
+        ["org_name"],
+        "existing",
+        ORG_COLS,
+    )
+    shapes.append(QueryShape("upsert_org existing", upsert_sql, param_dict))
+    shapes.append(
+        QueryShape(
+            "delete_org",
+            "DELETE FROM my_schema.organization WHERE org_name=%(org_name)s",
+            {"org_name": "x"},
+        )
+    )
+    # NOTE: EXPLAIN doesn't show the foreign key triggers, so this is the check
+    # postgres runs on illu_user for every deleted organization
+    shapes.append(
+        QueryShape(
+            "delete_org fk_org check",
+            "SELECT 1 FROM ONLY my_schema.illu_user x WHERE org_id=%(org_id)s "
+            "FOR KEY SHARE OF x",
+            {"org_id": 1},
+        )
+    )
+    shapes.append(
+        QueryShape(
+            "get_org_with_members",
+            SELECT_ORG_WITH_MEMBERS,
+            {"org_name": "x", "after_id": 0, "limit": 100},
+        )
+    )
+    return shapes
+
+
+def query_shapes() -> List[QueryShape]:
+    """
+    every query shape the db helpers can issue
+
+    returns:
+        List of the shapes
+    """
+    return get_user_shapes() + write_shapes()
+
+
+def get_leading_columns(cursor: Any) -> Dict[str, str]:
+    """
+    cursor:
+        a cursor of the database to plan against
+
+    returns:
+        Dictionary of the first column of every my_schema index by index name.
+        Expression indexes are left out
+    """
+    return {
+        row["index_name"]: row["column_name"]
+        for row in cursor.all(SELECT_LEADING_COLUMNS, back_as=dict)
+    }
+
+
+def constrains_column(index_cond: str, column: str) -> bool:
+    """
+    whether an "Index Cond" compares a column of the scanned index. postgres
+    qualifies the columns of other relations, e.g. "(org_id = organization.id)",
+    so an unqualified name is one of the index's
+
+    index_cond:
+        the "Index Cond" of a plan node
+    column:
+        the column name
+
+    returns:
+        True if the condition names the column
+    """
+    pattern: str = r'(?<![\w."])"?' + re.escape(column) + r'"?(?![\w"])'
+    return re.search(pattern, index_cond) is not None
+
+
+def find_full_scans(
+    plan: Dict[str, Any], leading_columns: Optional[Dict[str, str]] = None
+) -> List[str]:
+    """
+    finds the nodes of an EXPLAIN (FORMAT JSON) plan that read a whole relation.
+    An index scan without an index condition also reads the whole index, and so
+    does one whose condition leaves out the index's leading column
+
+    plan:
+        a plan node, e.g. the "Plan" of the EXPLAIN output
+    leading_columns:
+        the first column of each index by name, see get_leading_columns. Without
+        it only scans without an index condition are found
+
+    returns:
+        List of the full scans, e.g. "Seq Scan on illu_user" or
+        "Index Scan on illu_user using illu_user_phone_prefix_phone_key"
+    """
+    if leading_columns is None:
+        leading_columns = {}
+    result: List[str] = []
+    node_type: str = plan["Node Type"]
+    if node_type in SCAN_NODES and "Index Cond" not in plan:
+        result.append(f"{node_type} on {plan['Relation Name']}")
+    elif node_type in INDEX_NODES and "Index Cond" in plan:
+        index_name: str = plan.get("Index Name", "")
+        leading_column: Optional[str] = leading_columns.get(index_name)
+        if leading_column is not None and not constrains_column(
+            plan["Index Cond"], leading_column
+        ):
+            # NOTE: a Bitmap Index Scan has no "Relation Name"
+            relation: str = plan.get("Relation Name", index_name)
+            result.append(f"{node_type} on {relation} using {index_name}")
+    for child in plan.get("Plans", []):
+        result += find_full_scans(child, leading_columns)
+    return result
+
+
+def explain_shape(
+    cursor: Any,
+    shape: QueryShape,
+    leading_columns: Optional[Dict[str, str]] = None,
+) -> PlanReport:
+    """
+    plans a query shape without running it
+
+    cursor:
+        a cursor of the database to plan against
+    shape:
+        the query to plan
+    leading_columns:
+        the result of get_leading_columns, so it can be looked up once for many
+        shapes. It is looked up with the cursor when not given
+
+    returns:
+        the report of the plan
+    """
+    if leading_columns is None:
+        leading_columns = get_leading_columns(cursor)
+    explain_rows: Optional[List[Any]] = cursor.one(
+        "EXPLAIN (FORMAT JSON) " + shape.sql, shape.params
+    )
+    assert explain_rows is not None
+    plan: Dict[str, Any] = explain_rows[0]["Plan"]
+    return PlanReport(shape, plan["Total Cost"], find_full_scans(plan, leading_columns))
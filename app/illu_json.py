@@ -0,0 +1,34 @@
+from typing import Any
+
+import orjson
+from starlette.responses import JSONResponse
+
+# NOTE: the score endpoint returns a dict with int keys, which the stdlib json
+# module turns into strings and orjson only does with this option
+ORJSON_OPTIONS: int = orjson.OPT_NON_STR_KEYS
+
+
+def dumps(content: Any) -> bytes:
+    """
+    serializes to compact utf-8 JSON, the same output as starlette's JSONResponse
+
+    content:
+        JSON types, plus anything else orjson serializes natively
+
+    returns:
+        the JSON document
+    """
+    return orjson.dumps(content, option=ORJSON_OPTIONS)
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSONResponse rendered with orjson. It is the app's default response class, so
+    everything the endpoints return is still run through jsonable_encoder first.
+    Endpoints that return rows from the db helpers, which are already JSON types,
+    can return a FastJSONResponse themselves to skip jsonable_encoder and any
+    response_model validation
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -0,0 +1,281 @@
+from time import perf_counter
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+# NOTE: the prometheus client's default latency buckets, in seconds
+DURATION_BUCKETS: Tuple[float, ...] = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+# NOTE: requests that didn't match a route share one label so scanners probing
+# random paths can't grow the metrics without bound
+UNMATCHED_ROUTE: str = "unmatched"
+CONTENT_TYPE: str = "text/plain; version=0.0.4; charset=utf-8"
+
+Scope = Dict[str, Any]
+Message = Dict[str, Any]
+Receive = Callable[[], Awaitable[Message]]
+Send = Callable[[Message], Awaitable[None]]
+ASGIApp = Callable[[Scope, Receive, Send], Awaitable[None]]
+
+
+class RequestMetrics:
+    """
+    Request counts and latency histograms per (method, route, status)
+
+    Everything is recorded from the middleware, which only runs on the event loop
+    thread, and no await happens between reading and writing a counter, so the
+    counters need no lock
+    """
+
+    def __init__(self) -> None:
+        # NOTE: [count of each bucket..., count above the last bucket, seconds sum]
+        self.durations: Dict[Tuple[str, str, str], List[float]] = {}
+        self.in_flight: int = 0
+
+    def record(self, method: str, route: str, status: int, seconds: float) -> None:
+        """
+        method:
+            the request method
+        route:
+            the route's path template, e.g. /info/{name}
+        status:
+            the response status code
+        seconds:
+            how long the request took
+        """
+        key: Tuple[str, str, str] = (method, route, str(status))
+        counts: Optional[List[float]] = self.durations.get(key)
+        if counts is None:
+            counts = [0.0] * (len(DURATION_BUCKETS) + 2)
+            self.durations[key] = counts
+        index: int = 0
+        while index < len(DURATION_BUCKETS) and seconds > DURATION_BUCKETS[index]:
+            index += 1
+        counts[index] += 1
+        counts[-1] += seconds
+
+    def clear(self) -> None:
+        """
+        drops every recorded request
+        """
+        self.durations.clear()
+
+
+REQUEST_METRICS: RequestMetrics = RequestMetrics()
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware that records every http request in REQUEST_METRICS,
+    labelled with the route template instead of the raw path
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self.routes: Dict[Any, str] = {}
+
+    def route_path(self, scope: Scope) -> str:
+        """
+        the path template of the route the router matched, from the endpoint it
+        put in the scope
+        """
+        endpoint: Any = scope.get("endpoint")
+        if endpoint is None:
+            return UNMATCHED_ROUTE
+        path: Optional[str] = self.routes.get(endpoint)
+        if path is None:
+            for route in scope["app"].routes:
+                if getattr(route, "endpoint", None) is endpoint:
+                    path = route.path
+                    break
+            path = path or UNMATCHED_ROUTE
+            self.routes[endpoint] = path
+        return path
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status: int = 500
+        start: float = perf_counter()
+
+        async def send_status(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        REQUEST_METRICS.in_flight += 1
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            REQUEST_METRICS.in_flight -= 1
+            REQUEST_METRICS.record(
+                scope["method"],
+                self.route_path(scope),
+                status,
+                perf_counter() - start,
+            )
+
+
+def escape_label(value: str) -> str:
+    """
+    escapes a label value for the prometheus text format
+    """
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(labels: Dict[str, str]) -> str:
+    """
+    returns:
+        the labels in the prometheus text format, e.g. {method="GET",route="/"}
+    """
+    if len(labels) == 0:
+        return ""
+    return (
+        "{"
+        + ",".join(f'{key}="{escape_label(value)}"' for key, value in labels.items())
+        + "}"
+    )
+
+
+class MetricsWriter:
+    """
+    Builds a prometheus text format exposition one metric family at a time
+    """
+
+    def __init__(self) -> None:
+        self.lines: List[str] = []
+
+    def family(self, name: str, metric_type: str, help_text: str) -> None:
+        """
+        starts a metric family, its samples have to follow right after
+        """
+        self.lines.append(f"# HELP {name} {help_text}")
+        self.lines.append(f"# TYPE {name} {metric_type}")
+
+    def sample(self, name: str, labels: Dict[str, str], value: float) -> None:
+        """
+        adds one sample of the current metric family
+        """
+        self.lines.append(f"{name}{format_labels(labels)} {value:g}")
+
+    def text(self) -> str:
+        """
+        returns:
+            the exposition, ending with a newline
+        """
+        return "\n".join(self.lines) + "\n"
+
+
+def render_metrics() -> str:
+    """
+    the request, connection pool and query shape metrics, read at scrape time
+
+    returns:
+        the metrics in the prometheus text format
+    """
+    # NOTE: imported here so importing the app doesn't load the db drivers
+    from illu_db import get_pool_stats, get_replica_pool_stats
+    from illu_db_async import get_async_pool_stats, get_async_replica_pool_stats
+    from illu_query_stats import get_query_stats
+
+    writer: MetricsWriter = MetricsWriter()
+
+    writer.family(
+        "illu_http_requests_in_flight", "gauge", "Requests currently being handled."
+    )
+    writer.sample("illu_http_requests_in_flight", {}, REQUEST_METRICS.in_flight)
+
+    name: str = "illu_http_request_duration_seconds"
+    writer.family(name, "histogram", "Request latency by route and status.")
+    for (method, route, status), counts in sorted(REQUEST_METRICS.durations.items()):
+        labels: Dict[str, str] = {"method": method, "route": route, "status": status}
+        cumulative: float = 0
+        for bound, count in zip(DURATION_BUCKETS, counts):
+            cumulative += count
+            writer.sample(f"{name}_bucket", dict(labels, le=f"{bound:g}"), cumulative)
+        total: float = cumulative + counts[len(DURATION_BUCKETS)]
+        writer.sample(f"{name}_bucket", dict(labels, le="+Inf"), total)
+        writer.sample(f"{name}_sum", labels, counts[-1])
+        writer.sample(f"{name}_count", labels, total)
+
+    pools: Dict[str, Dict[str, float]] = {
+        "sync": get_pool_stats(),
+        "async": get_async_pool_stats(),
+    }
+    for index, stats in enumerate(get_replica_pool_stats()):
+        pools[f"sync_replica_{index}"] = stats
+    for index, stats in enumerate(get_async_replica_pool_stats()):
+        pools[f"async_replica_{index}"] = stats
+    writer.family("illu_db_pool_connections", "gauge", "Pooled connections by state.")
+    for pool, stats in pools.items():
+        for state in ("in_use", "idle"):
+            writer.sample(
+                "illu_db_pool_connections", {"pool": pool, "state": state}, stats[state]
+            )
+    writer.family("illu_db_pool_max_connections", "gauge", "Pool connection limit.")
+    for pool, stats in pools.items():
+        writer.sample("illu_db_pool_max_connections", {"pool": pool}, stats["maxconn"])
+    sync_pool: Dict[str, float] = pools["sync"]
+    writer.family(
+        "illu_db_pool_waiting", "gauge", "Threads waiting for a sync pool connection."
+    )
+    writer.sample("illu_db_pool_waiting", {}, sync_pool["waiting"])
+    writer.family(
+        "illu_db_pool_timeouts_total", "counter", "Sync pool acquires that timed out."
+    )
+    writer.sample("illu_db_pool_timeouts_total", {}, sync_pool["timeouts"])
+
+    query_stats: Dict[str, Dict[str, Dict[str, float]]] = get_query_stats()
+    checkout: Dict[str, float] = query_stats["checkout"].get("pool", {})
+    writer.family(
+        "illu_db_checkout_seconds_total",
+        "counter",
+        "Time spent checking connections out of the sync pool.",
+    )
+    writer.sample(
+        "illu_db_checkout_seconds_total", {}, checkout.get("seconds_total", 0.0)
+    )
+    writer.family(
+        "illu_db_checkouts_total", "counter", "Connections checked out of the pool."
+    )
+    writer.sample("illu_db_checkouts_total", {}, checkout.get("count", 0))
+
+    queries: List[Tuple[str, Dict[str, float]]] = sorted(query_stats["queries"].items())
+    for metric, key, metric_type, help_text in (
+        ("illu_db_queries_total", "count", "counter", "Statements by query shape."),
+        (
+            "illu_db_query_errors_total",
+            "errors",
+            "counter",
+            "Statements that raised, by query shape.",
+        ),
+        (
+            "illu_db_query_seconds_total",
+            "seconds_total",
+            "counter",
+            "Time spent in statements, by query shape.",
+        ),
+        (
+            "illu_db_query_seconds_max",
+            "seconds_max",
+            "gauge",
+            "Slowest statement of each query shape.",
+        ),
+    ):
+        writer.family(metric, metric_type, help_text)
+        for shape, stats in queries:
+            writer.sample(metric, {"shape": shape}, stats[key])
+
+    return writer.text()
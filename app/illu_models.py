@@ -1,3 +1,5 @@
+from typing import List, Optional
+
 from pydantic import BaseModel
 
 
@@ -11,3 +13,42 @@ class Student(BaseModel):
 class Org(BaseModel):
     id: int
     org_name: str
+
+
+class User(BaseModel):
+    id: int
+    phone_prefix: str
+    phone: str
+    user_name: str
+    org_id: Optional[int] = None
+    version: int
+
+
+class OrgMembers(Org):
+    members: List[User]
+    # NOTE: the after_id of the next page, None on the last page
+    next_after_id: Optional[int] = None
+
+
+class OrgCreate(BaseModel):
+    org_name: str
+
+
+class UserCreate(BaseModel):
+    phone_prefix: str
+    phone: str
+    user_name: str
+    pw_hash: str
+    jwt: Optional[str] = None
+    org_id: Optional[int] = None
+
+
+class UserUpdate(BaseModel):
+    phone_prefix: str
+    phone: str
+    new_phone_prefix: Optional[str] = None
+    new_phone: Optional[str] = None
+    user_name: Optional[str] = None
+    pw_hash: Optional[str] = None
+    jwt: Optional[str] = None
+    org_id: Optional[int] = None
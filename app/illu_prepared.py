@@ -0,0 +1,94 @@
+import threading
+from typing import Any, Dict, List, Optional, Set
+from weakref import WeakKeyDictionary
+
+import illu_db
+from make_sql import make_numbered_sql
+
+
+class PreparedStatement:
+    """
+    A server-side prepared statement made from a pyformat sql string
+    """
+
+    name: str
+    sql: str
+    prepare_sql: str
+    execute_sql: str
+
+    def __init__(self, name: str, sql: str):
+        """
+        name:
+            the session wide name of the statement
+        sql:
+            the statement with %(key)s placeholders
+        """
+        self.name = name
+        self.sql = sql
+        body: str
+        param_keys: List[str]
+        body, param_keys = make_numbered_sql(sql)
+        self.prepare_sql = f"PREPARE {name} AS {body}"
+        self.execute_sql = f"EXECUTE {name}"
+        if len(param_keys) > 0:
+            self.execute_sql += (
+                "(" + ", ".join(f"%({key})s" for key in param_keys) + ")"
+            )
+
+
+STATEMENTS: Dict[str, PreparedStatement] = {}
+# NOTE: prepared statements live as long as the server session, which is as long as
+# the connection object. A reconnect hands out a new connection with an empty set
+PREPARED: "WeakKeyDictionary[Any, Set[str]]" = WeakKeyDictionary()
+LOCK = threading.Lock()
+
+
+def prepared_names(connection: Any) -> Set[str]:
+    """
+    connection:
+        a pooled connection
+
+    returns:
+        the names of the statements prepared on that connection so far
+    """
+    with LOCK:
+        return set(PREPARED.get(connection, set()))
+
+
+def prepared_sql(cursor: Any, name: str, sql: str) -> str:
+    """
+    Use this in place of fixed sql text in db helpers. If prepared statements are
+    enabled, the statement is PREPAREd the first time the cursor's connection sees
+    it and the returned EXECUTE text is run from then on
+
+    cursor:
+        the cursor the statement is about to run on
+    name:
+        the session wide name of the statement, one per distinct sql text.
+        Reusing a name for other sql raises a ValueError
+    sql:
+        the statement with %(key)s placeholders
+
+    returns:
+        the sql to run with the usual parameters
+    """
+    if not illu_db.PREPARED_STATEMENTS:
+        return sql
+
+    with LOCK:
+        statement: Optional[PreparedStatement] = STATEMENTS.get(name)
+        if statement is None:
+            statement = PreparedStatement(name, sql)
+            STATEMENTS[name] = statement
+        elif statement.sql != sql:
+            # NOTE: running the EXECUTE of the first text would run the wrong query
+            raise ValueError(f"prepared statement {name} was made from other sql")
+        prepared: Set[str] = PREPARED.setdefault(cursor.connection, set())
+        is_prepared: bool = name in prepared
+
+    if not is_prepared:
+        # NOTE: PREPARE isn't undone if the surrounding transaction rolls back
+        cursor.run(statement.prepare_sql)
+        with LOCK:
+            prepared.add(name)
+    return statement.execute_sql
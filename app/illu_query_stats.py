@@ -0,0 +1,264 @@
+import json
+import logging
+import os
+import re
+import threading
+from time import perf_counter
+from typing import Any, Dict, List, Optional
+
+from postgres.cursors import SimpleNamedTupleCursor
+
+from illu_timing import record_phase
+from make_sql import SqlCache
+
+# NOTE: statements that take at least this long are written to SLOW_QUERY_LOG,
+# -1 turns the log off and 0 logs every statement like postgres'
+# log_min_duration_statement. init_db sets it from PG_SLOW_QUERY_MS
+SLOW_QUERY_MS: float = 200
+SLOW_QUERY_LOG: logging.Logger = logging.getLogger("illu_db.slow_query")
+# NOTE: the row index suffix of make_insert_many_sql / make_bulk_update_sql keys
+ROW_KEY_PATTERN = re.compile(r"%\((\w+?)_\d+\)s")
+# NOTE: a parenthesized row repeated right after itself, i.e. a VALUES list
+REPEATED_ROW_PATTERN = re.compile(r"(\((?:%\(\w+\)s|[^()])*\))(?:, \1)+")
+WHITESPACE_PATTERN = re.compile(r"\s+")
+# NOTE: normalizing is regex work, so remember the shape of each statement text.
+# Longer texts are mostly multi-row batches, a distinct text per batch size, so
+# they are normalized every time instead of filling the cache
+SHAPE_CACHE: SqlCache = SqlCache(maxsize=1024)
+SHAPE_CACHE_MAX_SQL: int = 2048
+
+
+def normalize_sql(sql: str) -> str:
+    """
+    the query shape of a statement: whitespace collapsed, and multi-row VALUES
+    lists folded so every batch size above one of the same statement has one shape
+
+    sql:
+        the statement with pyformat placeholders, before binding
+
+    returns:
+        the query shape, e.g.
+        INSERT INTO t(a) VALUES(%(a_N)s), ... ON CONFLICT (a) DO NOTHING
+    """
+
+    def build() -> str:
+        result: str = WHITESPACE_PATTERN.sub(" ", sql).strip()
+        result = ROW_KEY_PATTERN.sub(r"%(\1_N)s", result)
+        return REPEATED_ROW_PATTERN.sub(r"\1, ...", result)
+
+    if len(sql) > SHAPE_CACHE_MAX_SQL:
+        return build()
+    return SHAPE_CACHE.get_or_build(sql, build)
+
+
+class QueryStats:
+    """
+    Per query shape statement counters. Every thread counts into its own
+    dictionaries so recording never takes a lock, the threads' counters are
+    summed when they are read
+    """
+
+    def __init__(self) -> None:
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._threads: List[Dict[str, Dict[str, List[float]]]] = []
+
+    def _counters(self) -> Dict[str, Dict[str, List[float]]]:
+        counters: Optional[Dict[str, Dict[str, List[float]]]] = getattr(
+            self._local, "counters", None
+        )
+        if counters is None:
+            counters = {"queries": {}, "checkout": {}}
+            self._local.counters = counters
+            with self._lock:
+                self._threads.append(counters)
+        return counters
+
+    def record_query(self, shape: str, seconds: float, failed: bool) -> None:
+        """
+        shape:
+            the normalized statement, see normalize_sql
+        seconds:
+            how long the statement took
+        failed:
+            whether it raised
+        """
+        queries: Dict[str, List[float]] = self._counters()["queries"]
+        # NOTE: [count, seconds total, seconds max, errors]
+        counter: Optional[List[float]] = queries.get(shape)
+        if counter is None:
+            counter = [0, 0.0, 0.0, 0]
+            queries[shape] = counter
+        counter[0] += 1
+        counter[1] += seconds
+        counter[2] = max(counter[2], seconds)
+        counter[3] += failed
+
+    def record_checkout(self, seconds: float) -> None:
+        """
+        seconds:
+            how long getting a connection from the pool took
+        """
+        checkout: Dict[str, List[float]] = self._counters()["checkout"]
+        counter: Optional[List[float]] = checkout.get("pool")
+        if counter is None:
+            counter = [0, 0.0, 0.0, 0]
+            checkout["pool"] = counter
+        counter[0] += 1
+        counter[1] += seconds
+        counter[2] = max(counter[2], seconds)
+
+    def snapshot(self) -> Dict[str, Dict[str, Dict[str, float]]]:
+        """
+        returns:
+            Dictionary containing...
+            queries: the stats of every query shape
+            checkout: the stats of connection checkouts under the key "pool"
+            where the stats are count, errors, seconds_total, seconds_max and
+            seconds_avg
+        """
+        with self._lock:
+            threads: List[Dict[str, Dict[str, List[float]]]] = list(self._threads)
+        result: Dict[str, Dict[str, Dict[str, float]]] = {"queries": {}, "checkout": {}}
+        for counters in threads:
+            for kind, totals in result.items():
+                # NOTE: list() copies in one step, the owning thread may be adding
+                for key, counter in list(counters[kind].items()):
+                    total: Dict[str, float] = totals.setdefault(
+                        key,
+                        {
+                            "count": 0,
+                            "errors": 0,
+                            "seconds_total": 0.0,
+                            "seconds_max": 0.0,
+                        },
+                    )
+                    total["count"] += counter[0]
+                    total["seconds_total"] += counter[1]
+                    total["seconds_max"] = max(total["seconds_max"], counter[2])
+                    total["errors"] += counter[3]
+        for totals in result.values():
+            for total in totals.values():
+                total["seconds_avg"] = (
+                    total["seconds_total"] / total["count"] if total["count"] else 0.0
+                )
+        return result
+
+    def reset_after_fork(self) -> None:
+        """
+        starts over in a forked child. Only the forking thread survives a fork,
+        and the lock may have been held by one that didn't
+        """
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def clear(self) -> None:
+        """
+        resets every thread's counters
+        """
+        with self._lock:
+            for counters in self._threads:
+                for kind in counters.values():
+                    kind.clear()
+
+
+QUERY_STATS: QueryStats = QueryStats()
+os.register_at_fork(after_in_child=QUERY_STATS.reset_after_fork)
+
+
+def record_query(sql: str, param_keys: List[str], seconds: float, failed: bool) -> None:
+    """
+    counts a statement under its query shape, adds it to the db time of the request
+    being handled and writes it to the slow query log when it took at least
+    SLOW_QUERY_MS
+
+    sql:
+        the statement before binding
+    param_keys:
+        the keys of the bound parameters. Values aren't logged, they can be secrets
+    seconds:
+        how long the statement took
+    failed:
+        whether it raised
+    """
+    shape: str = normalize_sql(sql)
+    QUERY_STATS.record_query(shape, seconds, failed)
+    record_phase("db", seconds)
+    if 0 <= SLOW_QUERY_MS <= seconds * 1000:
+        SLOW_QUERY_LOG.warning(
+            json.dumps(
+                {
+                    "event": "slow_query",
+                    "shape": shape,
+                    "duration_ms": round(seconds * 1000, 3),
+                    "threshold_ms": SLOW_QUERY_MS,
+                    "failed": failed,
+                    "param_keys": param_keys,
+                }
+            )
+        )
+
+
+def record_checkout(seconds: float) -> None:
+    """
+    counts a connection checkout of the sync pool and adds it to the db_checkout
+    time of the request being handled
+
+    seconds:
+        how long getting a connection from the pool took
+    """
+    QUERY_STATS.record_checkout(seconds)
+    record_phase("db_checkout", seconds)
+
+
+class InstrumentedCursor(SimpleNamedTupleCursor):
+    """
+    The default cursor of init_db. Times every run/one/all/copy_expert call and
+    records it with record_query
+    """
+
+    # NOTE: one and all call run, only the outermost call is recorded
+    _depth: int = 0
+    # NOTE: keyword arguments of one and all that aren't bind parameters
+    OPTIONS = frozenset(["back_as", "default", "max_age"])
+
+    def _timed(self, method: Any, sql: Any, parameters: Any, *args: Any, **kw: Any):
+        if self._depth > 0:
+            return method(sql, parameters, *args, **kw)
+        self._depth += 1
+        failed: bool = True
+        start: float = perf_counter()
+        try:
+            result: Any = method(sql, parameters, *args, **kw)
+            failed = False
+            return result
+        finally:
+            self._depth -= 1
+            param_keys: List[str] = sorted(
+                (set(parameters) if isinstance(parameters, dict) else set())
+                | (set(kw) - self.OPTIONS)
+            )
+            if isinstance(sql, bytes):
+                sql = sql.decode()
+            record_query(str(sql), param_keys, perf_counter() - start, failed)
+
+    def run(self, sql: Any, parameters: Any = None, **kw: Any) -> Any:
+        return self._timed(super().run, sql, parameters, **kw)
+
+    def one(self, sql: Any, parameters: Any = None, *args: Any, **kw: Any) -> Any:
+        return self._timed(super().one, sql, parameters, *args, **kw)
+
+    def all(self, sql: Any, parameters: Any = None, *args: Any, **kw: Any) -> Any:
+        return self._timed(super().all, sql, parameters, *args, **kw)
+
+    def copy_expert(self, sql: Any, file: Any, *args: Any) -> Any:
+        return self._timed(super().copy_expert, sql, file, *args)
+
+
+def get_query_stats() -> Dict[str, Dict[str, Dict[str, float]]]:
+    """
+    returns:
+        the statement and connection checkout stats, see QueryStats.snapshot
+    """
+    return QUERY_STATS.snapshot()
@@ -0,0 +1,144 @@
+import json
+import os
+import re
+import subprocess
+import sys
+from typing import Any, Dict, List
+
+APP_DIR: str = os.path.dirname(os.path.abspath(__file__))
+# NOTE: a line of python -X importtime, e.g.
+# "import time:       434 |     231909 |   fastapi"
+IMPORT_TIME_PATTERN = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+# NOTE: run in a fresh interpreter by time_startup, prints the timings as JSON.
+# httpx is imported before the clock starts, the app doesn't need it
+STARTUP_SCRIPT: str = """
+import asyncio
+import json
+import sys
+import time
+
+import httpx
+
+start = time.perf_counter()
+import main
+
+imported = time.perf_counter()
+
+
+async def first_request():
+    await main.app.router.startup()
+    started = time.perf_counter()
+    try:
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://startup"
+        ) as client:
+            response = await client.get(sys.argv[1])
+        return started, time.perf_counter(), response.status_code
+    finally:
+        await main.app.router.shutdown()
+
+
+started, ready, status = asyncio.run(first_request())
+print(
+    json.dumps(
+        {
+            "import_ms": (imported - start) * 1000,
+            "startup_ms": (started - imported) * 1000,
+            "first_request_ms": (ready - started) * 1000,
+            "total_ms": (ready - start) * 1000,
+            "status": status,
+        }
+    )
+)
+"""
+
+
+class ImportTime:
+    module: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+    def __init__(self, module: str, self_us: int, cumulative_us: int, depth: int):
+        """
+        module:
+            the imported module's name
+        self_us:
+            microseconds spent running the module itself
+        cumulative_us:
+            microseconds including the modules it imported first
+        depth:
+            0 for top level imports like the profiled module, 1 for the modules
+            those imported, and so on
+        """
+        self.module = module
+        self.self_us = self_us
+        self.cumulative_us = cumulative_us
+        self.depth = depth
+
+
+def parse_import_times(output: str) -> List[ImportTime]:
+    """
+    output:
+        the stderr of python -X importtime
+
+    returns:
+        List of every module that was imported, in the order the imports finished
+    """
+    result: List[ImportTime] = []
+    for line in output.splitlines():
+        match = IMPORT_TIME_PATTERN.match(line)
+        if match is not None:
+            result.append(
+                ImportTime(
+                    module=match.group(4),
+                    self_us=int(match.group(1)),
+                    cumulative_us=int(match.group(2)),
+                    depth=(len(match.group(3)) - 1) // 2,
+                )
+            )
+    return result
+
+
+def profile_imports(module: str = "main") -> List[ImportTime]:
+    """
+    imports a module in a fresh interpreter with -X importtime
+
+    module:
+        the app module to import
+
+    returns:
+        List of every module the import loaded, see parse_import_times. Modules
+        the interpreter loads at startup, like site, are included too
+    """
+    completed: subprocess.CompletedProcess = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=APP_DIR,
+        capture_output=True,
+        check=True,
+        text=True,
+    )
+    return parse_import_times(completed.stderr)
+
+
+def time_startup(path: str = "/user?limit=1") -> Dict[str, Any]:
+    """
+    times a cold start of the app in a fresh interpreter: importing main, the
+    startup event that opens the pools, and the first request
+
+    path:
+        the first request to send, one that queries the database
+
+    returns:
+        Dictionary containing import_ms, startup_ms, first_request_ms, total_ms
+        and the status of the first request
+    """
+    completed: subprocess.CompletedProcess = subprocess.run(
+        [sys.executable, "-c", STARTUP_SCRIPT, path],
+        cwd=APP_DIR,
+        capture_output=True,
+        check=True,
+        text=True,
+    )
+    return json.loads(completed.stdout.splitlines()[-1])
@@ -0,0 +1,232 @@
+import asyncio
+import json
+import logging
+import os
+import random
+from contextvars import ContextVar
+from functools import wraps
+from time import perf_counter
+from typing import Any, Callable, Dict, List, Optional
+
+from fastapi.routing import APIRoute
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from illu_config import load_env
+
+ACCESS_LOG: logging.Logger = logging.getLogger("illu_access")
+# NOTE: the fraction of requests written to ACCESS_LOG, read from
+# ACCESS_LOG_SAMPLE_RATE the first time it is needed
+ACCESS_LOG_SAMPLE_RATE: Optional[float] = None
+# NOTE: the Server-Timing order, phases that didn't happen are left out
+PHASES: List[str] = ["validation", "app", "db_checkout", "db", "serialization"]
+
+
+class RequestTiming:
+    """
+    The phase timings of one request. Sync endpoints and helpers run in the
+    threadpool with a copy of the request's context, so they add to the same
+    RequestTiming, one thread at a time
+    """
+
+    start: float
+    # NOTE: phase name -> [count, seconds]
+    phases: Dict[str, List[float]]
+    endpoint_start: Optional[float]
+    endpoint_end: Optional[float]
+
+    def __init__(self) -> None:
+        self.start = perf_counter()
+        self.phases = {}
+        self.endpoint_start = None
+        self.endpoint_end = None
+
+    def add(self, phase: str, seconds: float) -> None:
+        """
+        phase:
+            e.g. "db" for a statement or "db_checkout" for a pool checkout
+        seconds:
+            how long it took
+        """
+        counter: Optional[List[float]] = self.phases.get(phase)
+        if counter is None:
+            counter = [0, 0.0]
+            self.phases[phase] = counter
+        counter[0] += 1
+        counter[1] += seconds
+
+    def header(self) -> str:
+        """
+        returns:
+            the Server-Timing header value, durations in ms, e.g.
+            validation;dur=0.120, db;dur=1.403;desc="2 statements", total;dur=2.011
+        """
+        metrics: List[str] = []
+        for phase in PHASES:
+            counter: Optional[List[float]] = self.phases.get(phase)
+            if counter is None:
+                continue
+            metric: str = f"{phase};dur={counter[1] * 1000:.3f}"
+            if phase == "db":
+                metric += f';desc="{counter[0]:g} statements"'
+            metrics.append(metric)
+        metrics.append(f"total;dur={(perf_counter() - self.start) * 1000:.3f}")
+        return ", ".join(metrics)
+
+
+REQUEST_TIMING: ContextVar[Optional[RequestTiming]] = ContextVar(
+    "REQUEST_TIMING", default=None
+)
+
+
+def record_phase(phase: str, seconds: float) -> None:
+    """
+    adds to the timing of the request being handled, if any. The db helpers call
+    this through illu_query_stats and the pools, outside of a request it does
+    nothing
+    """
+    timing: Optional[RequestTiming] = REQUEST_TIMING.get()
+    if timing is not None:
+        timing.add(phase, seconds)
+
+
+def get_sample_rate() -> float:
+    """
+    returns:
+        the fraction of requests to write to the access log, ACCESS_LOG_SAMPLE_RATE
+        from .env (default 0.01)
+    """
+    global ACCESS_LOG_SAMPLE_RATE
+
+    if ACCESS_LOG_SAMPLE_RATE is None:
+        load_env()
+        ACCESS_LOG_SAMPLE_RATE = float(os.environ.get("ACCESS_LOG_SAMPLE_RATE", "0.01"))
+    return ACCESS_LOG_SAMPLE_RATE
+
+
+class TimedRoute(APIRoute):
+    """
+    Route class that splits the request handler's time into validation (reading
+    and validating the request), app (the endpoint) and serialization (validating
+    and rendering the response)
+    """
+
+    def get_route_handler(self) -> Callable:
+        call: Optional[Callable] = self.dependant.call
+        assert call is not None
+
+        # NOTE: the handler picks the threadpool for sync endpoints by checking
+        # the call, so the wrapper has to stay a coroutine function if it was one
+        if asyncio.iscoroutinefunction(call):
+
+            @wraps(call)
+            async def timed_call(**values: Any) -> Any:
+                timing: Optional[RequestTiming] = REQUEST_TIMING.get()
+                if timing is not None:
+                    timing.endpoint_start = perf_counter()
+                try:
+                    return await call(**values)  # type: ignore
+                finally:
+                    if timing is not None:
+                        timing.endpoint_end = perf_counter()
+
+        else:
+
+            @wraps(call)
+            def timed_call(**values: Any) -> Any:
+                timing: Optional[RequestTiming] = REQUEST_TIMING.get()
+                if timing is not None:
+                    timing.endpoint_start = perf_counter()
+                try:
+                    return call(**values)  # type: ignore
+                finally:
+                    if timing is not None:
+                        timing.endpoint_end = perf_counter()
+
+        self.dependant.call = timed_call
+        handler: Callable = super().get_route_handler()
+
+        async def timed_handler(request: Any) -> Any:
+            timing: Optional[RequestTiming] = REQUEST_TIMING.get()
+            if timing is None:
+                return await handler(request)
+            start: float = perf_counter()
+            try:
+                return await handler(request)
+            finally:
+                end: float = perf_counter()
+                if timing.endpoint_start is None or timing.endpoint_end is None:
+                    # NOTE: the request was rejected before the endpoint ran
+                    timing.add("validation", end - start)
+                else:
+                    timing.add("validation", timing.endpoint_start - start)
+                    timing.add("app", timing.endpoint_end - timing.endpoint_start)
+                    timing.add("serialization", end - timing.endpoint_end)
+
+        return timed_handler
+
+
+class TimingMiddleware:
+    """
+    Pure ASGI middleware that times every http request, returns the phases in a
+    Server-Timing header and writes a sample of requests to ACCESS_LOG as JSON
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timing: RequestTiming = RequestTiming()
+        status: int = 500
+
+        async def send_timing(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                # NOTE: a streamed body is still being produced here, so the header
+                # only covers the work done before the first chunk
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"server-timing", timing.header().encode("latin-1"))
+                ]
+            await send(message)
+
+        token: Any = REQUEST_TIMING.set(timing)
+        try:
+            await self.app(scope, receive, send_timing)
+        finally:
+            REQUEST_TIMING.reset(token)
+            if random.random() < get_sample_rate():
+                log_access(scope, status, timing)
+
+
+def log_access(scope: Scope, status: int, timing: RequestTiming) -> None:
+    """
+    writes a request's timings to ACCESS_LOG. The query string isn't logged, it
+    can hold phone numbers
+
+    scope:
+        the request's ASGI scope
+    status:
+        the response status code
+    timing:
+        the request's finished timing
+    """
+    phases: Dict[str, float] = {
+        phase: round(counter[1] * 1000, 3) for phase, counter in timing.phases.items()
+    }
+    ACCESS_LOG.info(
+        json.dumps(
+            {
+                "event": "access",
+                "method": scope["method"],
+                "path": scope["path"],
+                "status": status,
+                "duration_ms": round((perf_counter() - timing.start) * 1000, 3),
+                "phases_ms": phases,
+                "statements": timing.phases.get("db", [0, 0.0])[0],
+            }
+        )
+    )
@@ -1,21 +1,55 @@
-from typing import Dict, Set
+import asyncio
+import json
+from typing import Any, Dict, Iterator, List, Optional, Set
 
-from fastapi import FastAPI
-from dotenv import load_dotenv
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
 
-from illu_db import init_db
-from illu_models import Student
+# NOTE: the db modules pull in asyncpg and psycopg2, so they are imported by the
+# functions that use them and importing the app stays fast. See bench/profile_startup.py
+from illu_etag import etag_matches, make_etag
+from illu_json import FastJSONResponse
+from illu_metrics import CONTENT_TYPE, MetricsMiddleware, render_metrics
+from illu_models import OrgCreate, OrgMembers, Student, UserCreate, UserUpdate
+from illu_timing import TimedRoute, TimingMiddleware
 
-app = FastAPI()
+app = FastAPI(default_response_class=FastJSONResponse)
+# NOTE: has to be set before the routes are added
+app.router.route_class = TimedRoute
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(TimingMiddleware)
 
 
 @app.on_event("startup")
 async def startup() -> None:  # pragma no cover
     """
-    Setup Postgres DB connection
+    Setup Postgres DB connection pools and open their minimum connections.
+    The sync pool is warmed in the threadpool while the asyncio pool connects
     """
-    load_dotenv()
-    init_db()
+    from illu_db import warm_db
+    from illu_db_async import init_async_db
+
+    await asyncio.gather(run_in_threadpool(warm_db), init_async_db())
+
+
+@app.on_event("shutdown")
+async def shutdown() -> None:  # pragma no cover
+    """
+    Close the asyncio Postgres connection pool
+    """
+    from illu_db_async import close_async_db
+
+    await close_async_db()
+
+
+@app.get("/metrics")
+async def metrics() -> PlainTextResponse:
+    """
+    Request, connection pool and query metrics in the prometheus text format.
+    Async so it reads the request metrics on the event loop thread that writes them
+    """
+    return PlainTextResponse(render_metrics(), media_type=CONTENT_TYPE)
 
 
 @app.get("/")
@@ -47,3 +81,173 @@ def display(name: str) -> Dict[str, str]:
 @app.get("/info/{user_id}/score")
 def score(user_id: int) -> Dict[int, Set[str]]:
     return {user_id: {"87", "91"}}
+
+
+@app.post("/user")
+async def create_user(request: UserCreate) -> Dict[str, Any]:
+    import db_user_async
+
+    success: bool
+    user: Dict[str, Any]
+    success, user = await db_user_async.create_user(**request.dict())
+    if not success:
+        raise HTTPException(status_code=409, detail="user already exists")
+    return user
+
+
+@app.get("/user")
+async def get_user(
+    request: Request,
+    user_id: Optional[int] = None,
+    phone_prefix: Optional[str] = None,
+    phone: Optional[str] = None,
+    user_name: Optional[str] = None,
+    org_id: Optional[int] = None,
+    after_id: Optional[int] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    descending: bool = False,
+) -> Response:
+    """
+    Finds users by any of their columns, see db_user.get_user. Answers
+    If-None-Match with a 304 after checking only the users' versions. Returns one
+    page of at most limit users, GET /user/export streams all of them
+    """
+    import db_user_async
+
+    filters: Dict[str, Any] = {
+        "user_id": user_id,
+        "phone_prefix": phone_prefix,
+        "phone": phone,
+        "user_name": user_name,
+        "org_id": org_id,
+        "after_id": after_id,
+        "limit": limit,
+        "descending": descending,
+    }
+    users: List[Dict[str, Any]]
+    if_none_match: Optional[str] = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        _, users = await db_user_async.get_user(**filters, version_only=True)
+        # NOTE: no matching users is no representation, so "*" doesn't match it
+        if users:
+            etag: str = make_etag(users)
+            if etag_matches(if_none_match, etag):
+                return Response(status_code=304, headers={"ETag": etag})
+
+    _, users = await db_user_async.get_user(**filters)
+    # NOTE: the rows are JSON types already, so this skips jsonable_encoder
+    return FastJSONResponse(users, headers={"ETag": make_etag(users)})
+
+
+def ndjson_users(org_id: Optional[int], chunk_size: int) -> Iterator[str]:
+    """
+    Serializes users as newline delimited json, chunk_size lines per chunk.
+    Rows are pulled from a server-side cursor as the chunks are sent, so memory
+    stays flat no matter how many users there are
+
+    org_id:
+        only export this org's users, all users if None
+    chunk_size:
+        the number of users per chunk and per fetch from the database
+    """
+    from db_user import iter_users
+
+    lines: List[str] = []
+    for user in iter_users(org_id=org_id, fetch_size=chunk_size):
+        lines.append(json.dumps(user))
+        if len(lines) == chunk_size:
+            yield "\n".join(lines) + "\n"
+            lines = []
+    if len(lines) > 0:
+        yield "\n".join(lines) + "\n"
+
+
+@app.get("/user/export")
+def export_users(
+    org_id: Optional[int] = None, chunk_size: int = Query(1000, ge=1)
+) -> StreamingResponse:
+    """
+    Streams all users, or all users of one org, as newline delimited json
+    """
+    # NOTE: the sync generator runs in the threadpool one chunk at a time and the
+    # next chunk isn't fetched until the previous one was sent
+    return StreamingResponse(
+        ndjson_users(org_id, chunk_size), media_type="application/x-ndjson"
+    )
+
+
+@app.patch("/user")
+async def update_user(request: UserUpdate) -> Dict[str, bool]:
+    import db_user_async
+
+    return {"success": await db_user_async.update_user(**request.dict())}
+
+
+@app.delete("/user")
+async def delete_user(phone_prefix: str, phone: str) -> Dict[str, bool]:
+    import db_user_async
+
+    return {"success": await db_user_async.delete_user(phone_prefix, phone)}
+
+
+@app.post("/org")
+async def create_org(request: OrgCreate) -> Dict[str, Any]:
+    import db_org_async
+
+    success: bool
+    org: Dict[str, Any]
+    success, org = await db_org_async.create_org(request.org_name)
+    if not success:
+        raise HTTPException(status_code=409, detail="organization already exists")
+    return org
+
+
+@app.get("/org/{name}")
+async def get_org(request: Request, name: str) -> Response:
+    """
+    Gets an organization by name. Answers If-None-Match with a 304 after checking
+    only the org's version
+    """
+    import db_org_async
+
+    org: Dict[str, Any]
+    if_none_match: Optional[str] = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        _, org = await db_org_async.get_org(name, version_only=True)
+        if org:
+            etag: str = make_etag([org])
+            if etag_matches(if_none_match, etag):
+                return Response(status_code=304, headers={"ETag": etag})
+
+    _, org = await db_org_async.get_org(name)
+    if not org:
+        raise HTTPException(status_code=404, detail="organization not found")
+    return FastJSONResponse(org, headers={"ETag": make_etag([org])})
+
+
+@app.get("/org/{name}/members", response_model=OrgMembers)
+async def get_org_members(
+    name: str,
+    after_id: Optional[int] = None,
+    limit: int = Query(100, ge=1, le=1000),
+) -> Dict[str, Any]:
+    """
+    Gets an organization by name and one page of its members, sorted by id, with
+    one query. Pass next_after_id as after_id to get the next page
+    """
+    import db_org_async
+
+    org: Dict[str, Any]
+    _, org = await db_org_async.get_org_with_members(name, after_id, limit)
+    if not org:
+        raise HTTPException(status_code=404, detail="organization not found")
+    if len(org["members"]) == limit:
+        org["next_after_id"] = org["members"][-1]["id"]
+    return org
+
+
+@app.delete("/org/{name}")
+async def delete_org(name: str) -> Dict[str, bool]:
+    import db_org_async
+
+    return {"success": await db_org_async.delete_org(name)}
@@ -1,22 +1,158 @@
-from typing import Any, Dict, List, Literal, Optional
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Literal, Optional, Tuple
 
 BOOL_OPERATOR = Literal["AND", "OR"]
+# NOTE: "= ANY" compares against each element of a list value
+COMPARISON = Literal["=", "<>", "<", "<=", ">", ">=", "= ANY"]
+# NOTE: what an upsert does when the row already exists
+ON_CONFLICT = Literal["nothing", "update", "existing"]
+# NOTE: what an upsert did, "skipped" when on_conflict="nothing" hit an existing row
+UPSERT_OUTCOME = Literal["inserted", "updated", "existing", "skipped"]
+# NOTE: the extra column upsert statements return the outcome in
+UPSERT_OUTCOME_COL: str = "upsert_outcome"
+# NOTE: (col_name, param_key, comparison) triples. This is all the generated sql text
+# depends on
+SqlShape = Tuple[Tuple[str, str, str], ...]
+# NOTE: matches the pyformat placeholders that the builders generate, e.g. %(phone)s
+PARAM_PATTERN = re.compile(r"%\((\w+)\)s")
 
 
 class SqlParam:
     param_key: str
     col_name: str
     value: Any
+    comparison: COMPARISON
 
-    def __init__(self, col_name: str, value: Any, param_key: Optional[str] = None):
+    def __init__(
+        self,
+        col_name: str,
+        value: Any,
+        param_key: Optional[str] = None,
+        comparison: COMPARISON = "=",
+    ):
+        """
+        col_name:
+            the column the value is for
+        value:
+            the value to bind
+        param_key:
+            the key of the value in param_dict, defaults to col_name
+        comparison:
+            the operator between the column and the value in where expressions.
+            Ignored for SET and INSERT columns
+        """
         self.col_name = col_name
         self.value = value
+        self.comparison = comparison
         if param_key is None:
             self.param_key = self.col_name
         else:
             self.param_key = param_key
 
 
+class SqlCache:
+    """
+    Bounded LRU of generated sql text keyed by query shape
+
+    Only a handful of shapes exist (table, non-None columns, operator), so once a
+    shape has been built the builders only have to bind parameters
+    """
+
+    maxsize: int
+    hits: int
+    misses: int
+
+    def __init__(self, maxsize: int = 256):
+        """
+        maxsize:
+            the number of shapes to keep before evicting the least recently used
+        """
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Hashable, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_build(self, key: Hashable, build: Callable[[], str]) -> str:
+        """
+        key:
+            the query shape
+        build:
+            makes the sql text for the shape on a miss
+
+        returns:
+            the sql text for the shape
+        """
+        with self._lock:
+            sql: Optional[str] = self._entries.get(key)
+            if sql is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return sql
+            self.misses += 1
+
+        sql = build()
+        with self._lock:
+            self._entries[key] = sql
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return sql
+
+    def hit_rate(self) -> float:
+        """
+        returns:
+            fraction of lookups that were hits, 0 before the first lookup
+        """
+        lookups: int = self.hits + self.misses
+        return self.hits / lookups if lookups > 0 else 0.0
+
+    def clear(self) -> None:
+        """
+        drops all cached sql and resets the counters
+        """
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+SQL_CACHE: SqlCache = SqlCache()
+
+
+def _bind_args(param_dict: Dict[str, Any], args: List[SqlParam]) -> SqlShape:
+    """
+    adds the non-None args to param_dict
+
+    returns:
+    the shape of the non-None args
+    """
+    shape: List[Tuple[str, str, str]] = []
+    for arg in args:
+        if not (arg.value is None):
+            shape.append((arg.col_name, arg.param_key, arg.comparison))
+            param_dict[arg.param_key] = arg.value
+    return tuple(shape)
+
+
+def _build_comparison(col_name: str, param_key: str, comparison: str) -> str:
+    if comparison == "= ANY":
+        return f"{col_name}=ANY(%({param_key})s)"
+    return f"{col_name}{comparison}%({param_key})s"
+
+
+def _build_where(shape: SqlShape, where_operator: BOOL_OPERATOR) -> str:
+    return "WHERE " + f" {where_operator} ".join(
+        _build_comparison(col_name, param_key, comparison)
+        for col_name, param_key, comparison in shape
+    )
+
+
 def make_where_sql_col(
     param_dict: Dict[str, Any],
     where_args: List[SqlParam],
@@ -37,32 +173,25 @@ def make_where_sql_col(
     returns:
     string of the where expression
     """
-    result = ""
-    if len(where_args) > 0:
-        # NOTE: remove None valued where args first
-        valid_where_args: List[SqlParam] = []
-        for arg in where_args:
-            if not (arg.value is None):
-                valid_where_args.append(arg)
-                param_dict[arg.param_key] = arg.value
-
-        if len(valid_where_args) > 0:
-            result += "WHERE "
-            for index in range(len(valid_where_args) - 1):
-                arg = valid_where_args[index]
-                result += f"{arg.col_name}=%({arg.param_key})s {where_operator} "
-            arg = valid_where_args[-1]
-            result += f"{arg.col_name}=%({arg.param_key})s"
-
-    return result
+    # NOTE: None valued where args are left out of the expression
+    shape: SqlShape = _bind_args(param_dict, where_args)
+    if len(shape) == 0:
+        return ""
+    return SQL_CACHE.get_or_build(
+        ("WHERE", where_operator, shape), lambda: _build_where(shape, where_operator)
+    )
 
 
 def make_where_sql(where_dict: Dict[str, Any], where_operator: BOOL_OPERATOR):
     """ """
-    where_args: List[SqlParam] = []
-    for key, value in where_dict.items():
-        where_args.append(SqlParam(param_key=key, col_name=key, value=value))
-    return make_where_sql_col({}, where_args, where_operator)
+    shape: SqlShape = tuple(
+        (key, key, "=") for key, value in where_dict.items() if not (value is None)
+    )
+    if len(shape) == 0:
+        return ""
+    return SQL_CACHE.get_or_build(
+        ("WHERE", where_operator, shape), lambda: _build_where(shape, where_operator)
+    )
 
 
 def make_update_sql(
@@ -80,29 +209,388 @@ def make_update_sql(
     where_operator:
     returns:
     """
+    # NOTE: remove the None valued args first so we don't prepend string unnecessarily
+    update_shape: SqlShape = _bind_args(param_dict, update_args)
+    if len(update_shape) == 0:
+        return ""
+    where_shape: SqlShape = _bind_args(param_dict, where_args)
+
+    def build() -> str:
+        result: str = f"UPDATE {table_name} SET " + ", ".join(
+            f"{col_name}=%({param_key})s" for col_name, param_key, _ in update_shape
+        )
+        if len(where_shape) > 0:
+            result += " " + _build_where(where_shape, where_operator)
+        return result
+
+    return SQL_CACHE.get_or_build(
+        ("UPDATE", table_name, update_shape, where_shape, where_operator), build
+    )
+
+
+def make_insert_sql(
+    param_dict: Dict[str, Any],
+    table_name: str,
+    insert_args: List[SqlParam],
+    returning_cols: Optional[List[str]] = None,
+) -> str:
+    """
+    make an INSERT statement that optionally returns the inserted row
+
+    param_dict:
+    The mutable param_dict that will be passed into the db 'run' function
+
+    table_name:
+    the schema qualified table to insert into
+
+    insert_args:
+    the column, value pairs for the new row. None values are inserted as NULL
+
+    returning_cols:
+    the columns to return from the inserted row. No RETURNING clause if empty
+
+    returns:
+    string of the insert statement
+    """
+    if len(insert_args) == 0:
+        return ""
+    shape: List[Tuple[str, str]] = []
+    for arg in insert_args:
+        shape.append((arg.col_name, arg.param_key))
+        param_dict[arg.param_key] = arg.value
+    returning: Tuple[str, ...] = tuple(returning_cols or [])
+
+    def build() -> str:
+        result: str = (
+            f"INSERT INTO {table_name}({', '.join(col for col, _ in shape)}) "
+            f"VALUES({', '.join(f'%({key})s' for _, key in shape)})"
+        )
+        if returning:
+            result += " RETURNING " + ", ".join(returning)
+        return result
+
+    return SQL_CACHE.get_or_build(
+        ("INSERT", table_name, tuple(shape), returning), build
+    )
+
+
+def make_upsert_sql(
+    param_dict: Dict[str, Any],
+    table_name: str,
+    insert_args: List[SqlParam],
+    conflict_cols: List[str],
+    on_conflict: ON_CONFLICT,
+    returning_cols: List[str],
+) -> str:
+    """
+    make an INSERT ... ON CONFLICT statement that reports what it did in an extra
+    upsert_outcome column instead of raising on a duplicate
+
+    param_dict:
+    The mutable param_dict that will be passed into the db 'run' function
+
+    table_name:
+    the schema qualified table to insert into
+
+    insert_args:
+    the column, value pairs for the new row. None values are inserted as NULL
+
+    conflict_cols:
+    the columns of the unique constraint that duplicates collide on. They must
+    be among the insert_args
+
+    on_conflict:
+    "nothing" returns no row for a duplicate,
+    "update" sets the existing row's other non-None columns and returns it,
+    "existing" returns the existing row untouched. "update" acts like "existing"
+    when there are no other non-None columns
+
+    returning_cols:
+    the columns to return from the inserted, updated or existing row
+
+    returns:
+    string of the upsert statement
+    """
+    if len(insert_args) == 0:
+        return ""
+    shape: List[Tuple[str, str, bool]] = []
+    for arg in insert_args:
+        shape.append((arg.col_name, arg.param_key, arg.value is None))
+        param_dict[arg.param_key] = arg.value
+    conflict: Tuple[str, ...] = tuple(conflict_cols)
+    returning: Tuple[str, ...] = tuple(returning_cols)
+
+    def build() -> str:
+        insert: str = (
+            f"INSERT INTO {table_name}({', '.join(col for col, _, _ in shape)}) "
+            f"VALUES({', '.join(f'%({key})s' for _, key, _ in shape)}) "
+            f"ON CONFLICT ({', '.join(conflict)}) "
+        )
+        update_cols: List[str] = [
+            col for col, _, is_none in shape if not is_none and col not in conflict
+        ]
+        if on_conflict == "update" and len(update_cols) > 0:
+            # NOTE: xmax is only 0 for a row version that this statement inserted
+            return (
+                insert
+                + "DO UPDATE SET "
+                + ", ".join(f"{col}=EXCLUDED.{col}" for col in update_cols)
+                + f" RETURNING {', '.join(returning)}, "
+                + "CASE WHEN xmax = 0 THEN 'inserted' ELSE 'updated' END "
+                + f"AS {UPSERT_OUTCOME_COL}"
+            )
+        if on_conflict != "nothing":
+            # NOTE: the existing row is read in the same statement. A row committed
+            # by a concurrent transaction after the statement started isn't visible
+            # to it, so that rare case comes back as "skipped"
+            keys: Dict[str, str] = {col: key for col, key, _ in shape}
+            return (
+                f"WITH inserted AS ({insert}DO NOTHING "
+                f"RETURNING {', '.join(returning)}) "
+                f"SELECT *, 'inserted' AS {UPSERT_OUTCOME_COL} FROM inserted "
+                f"UNION ALL SELECT {', '.join(returning)}, "
+                f"'existing' AS {UPSERT_OUTCOME_COL} FROM {table_name} WHERE "
+                + " AND ".join(f"{col}=%({keys[col]})s" for col in conflict)
+                + " AND NOT EXISTS (SELECT 1 FROM inserted)"
+            )
+        return (
+            insert
+            + f"DO NOTHING RETURNING {', '.join(returning)}, "
+            + f"'inserted' AS {UPSERT_OUTCOME_COL}"
+        )
+
+    return SQL_CACHE.get_or_build(
+        ("UPSERT", table_name, tuple(shape), conflict, on_conflict, returning), build
+    )
+
+
+def split_upsert_row(
+    row: Optional[Dict[str, Any]],
+) -> Tuple[UPSERT_OUTCOME, Dict[str, Any]]:
+    """
+    separates the outcome from the row an upsert statement returned
+
+    row:
+        the row returned from the make_upsert_sql statement, None if there was none
+
+    returns:
+        Tuple containing...
+        the outcome of the upsert
+        Dictionary containing the returned columns, empty if the row was skipped
+    """
+    if row is None:
+        return "skipped", {}
+    result: Dict[str, Any] = dict(row)
+    return result.pop(UPSERT_OUTCOME_COL), result
+
+
+def make_insert_many_sql(
+    param_dict: Dict[str, Any],
+    table_name: str,
+    col_names: List[str],
+    rows: List[Dict[str, Any]],
+    returning_cols: Optional[List[str]] = None,
+    conflict_cols: Optional[List[str]] = None,
+) -> str:
+    """
+    make a multi-row INSERT statement
+
+    param_dict:
+    The mutable param_dict that will be passed into the db 'run' function.
+    Each value is keyed by its column name and row index, e.g. phone_3
+
+    table_name:
+    the schema qualified table to insert into
+
+    col_names:
+    the columns to insert. Columns missing from a row are inserted as NULL
+
+    rows:
+    the column name to value mappings of each row to insert
+
+    returning_cols:
+    the columns to return from the inserted rows. No RETURNING clause if empty
+
+    conflict_cols:
+    the columns of a unique constraint. Rows that conflict on it are skipped
+    instead of raising
+
+    returns:
+    string of the insert statement
+    """
     result: str = ""
-    if len(update_args) > 0:
-        # NOTE: remove the None valued where args first so we don't prepend string unnecessarily
-        valid_update_args: List[SqlParam] = []
+    if len(col_names) > 0 and len(rows) > 0:
+        values: List[str] = []
+        for index, row in enumerate(rows):
+            placeholders: List[str] = []
+            for col_name in col_names:
+                param_key: str = f"{col_name}_{index}"
+                placeholders.append(f"%({param_key})s")
+                param_dict[param_key] = row.get(col_name)
+            values.append(f"({', '.join(placeholders)})")
+
+        result = (
+            f"INSERT INTO {table_name}({', '.join(col_names)}) "
+            f"VALUES{', '.join(values)}"
+        )
+        if conflict_cols:
+            result += f" ON CONFLICT ({', '.join(conflict_cols)}) DO NOTHING"
+        if returning_cols:
+            result += " RETURNING " + ", ".join(returning_cols)
+
+    return result
+
+
+def make_bulk_update_sql(
+    param_dict: Dict[str, Any],
+    table_name: str,
+    rows: List[Tuple[List[SqlParam], List[SqlParam]]],
+    col_types: Dict[str, str],
+    returning_cols: Optional[List[str]] = None,
+) -> str:
+    """
+    make one UPDATE ... FROM (VALUES ...) statement that applies different changes
+    to many rows. The target table is aliased t and the VALUES list v. v.ord is
+    each row's index in rows, so RETURNING v.ord tells which rows were applied
+
+    param_dict:
+    The mutable param_dict that will be passed into the db 'run' function.
+    Each value is keyed by its param_key and row index, e.g. phone_3
+
+    table_name:
+    the schema qualified table to update
+
+    rows:
+    one (update_args, where_args) pair per row, like make_update_sql's arguments.
+    A None valued update arg leaves that column of that row unchanged, rows with
+    only None valued update args are left out. Every row must have the same
+    where args, which are ANDed and may not be None
+
+    col_types:
+    the sql type of every column, used to cast the VALUES columns
+
+    returning_cols:
+    the columns to return from the updated rows, e.g. t.id or v.phone.
+    No RETURNING clause if empty
+
+    returns:
+    string of the update statement
+    """
+    changed_rows: List[Tuple[int, List[SqlParam], List[SqlParam]]] = [
+        (row_index, update_args, where_args)
+        for row_index, (update_args, where_args) in enumerate(rows)
+        if any(not (arg.value is None) for arg in update_args)
+    ]
+    if len(changed_rows) == 0:
+        return ""
+
+    # NOTE: only columns that at least one row changes are in the statement
+    update_cols: Dict[str, str] = {}
+    for _, update_args, _ in changed_rows:
         for arg in update_args:
             if not (arg.value is None):
-                valid_update_args.append(arg)
-                param_dict[arg.param_key] = arg.value
+                update_cols.setdefault(arg.param_key, arg.col_name)
+    where_cols: Dict[str, str] = {
+        arg.param_key: arg.col_name for arg in changed_rows[0][2]
+    }
 
-        if len(valid_update_args) > 0:
-            result += f"UPDATE {table_name} SET "
+    values: List[str] = []
+    for index, (row_index, update_args, where_args) in enumerate(changed_rows):
+        row_values: Dict[str, Any] = {"ord": row_index}
+        row_values.update((arg.param_key, arg.value) for arg in where_args)
+        row_values.update((arg.param_key, arg.value) for arg in update_args)
+        placeholders: List[str] = []
+        for param_key in ["ord"] + list(where_cols) + list(update_cols):
+            placeholders.append(f"%({param_key}_{index})s")
+            param_dict[f"{param_key}_{index}"] = row_values.get(param_key)
+        values.append(f"({', '.join(placeholders)})")
 
-            for index in range(len(valid_update_args) - 1):
-                arg = valid_update_args[index]
-                result += f"{arg.col_name}=%({arg.param_key})s, "
-            arg = valid_update_args[-1]
-            result += f"{arg.col_name}=%({arg.param_key})s"
+    result: str = (
+        f"UPDATE {table_name} AS t SET "
+        + ", ".join(
+            f"{col_name}=COALESCE(v.{param_key}::{col_types[col_name]}, t.{col_name})"
+            for param_key, col_name in update_cols.items()
+        )
+        + f" FROM (VALUES{', '.join(values)}) "
+        + f"AS v({', '.join(['ord'] + list(where_cols) + list(update_cols))}) WHERE "
+        + " AND ".join(
+            f"t.{col_name}=v.{param_key}::{col_types[col_name]}"
+            for param_key, col_name in where_cols.items()
+        )
+    )
+    if returning_cols:
+        result += " RETURNING " + ", ".join(returning_cols)
+    return result
+
+
+def make_copy_text(col_names: List[str], rows: List[Dict[str, Any]]) -> str:
+    """
+    make the payload for a COPY ... FROM STDIN in postgres' text format
 
-            if len(where_args) > 0:
-                where_string: str = make_where_sql_col(
-                    param_dict, where_args, where_operator
+    col_names:
+    the columns in the order they are listed in the COPY statement
+
+    rows:
+    the column name to value mappings of each row. Missing and None values
+    are written as NULL
+
+    returns:
+    string with one tab separated line per row
+    """
+    lines: List[str] = []
+    for row in rows:
+        fields: List[str] = []
+        for col_name in col_names:
+            value: Any = row.get(col_name)
+            if value is None:
+                fields.append("\\N")
+            else:
+                fields.append(
+                    str(value)
+                    .replace("\\", "\\\\")
+                    .replace("\t", "\\t")
+                    .replace("\n", "\\n")
+                    .replace("\r", "\\r")
                 )
-                if len(where_string) != 0:
-                    result += " " + where_string
+        lines.append("\t".join(fields))
+    return "".join(line + "\n" for line in lines)
 
-    return result
+
+def make_numbered_sql(sql: str) -> Tuple[str, List[str]]:
+    """
+    convert pyformat placeholders to positional ones, for PREPARE and asyncpg
+
+    sql:
+    the statement with %(key)s placeholders
+
+    returns:
+    Tuple containing...
+    the statement with $1, $2... placeholders. A repeated key reuses its number
+    the param keys in positional order
+    """
+    param_keys: List[str] = []
+
+    def number_param(match: "re.Match[str]") -> str:
+        key: str = match.group(1)
+        if key not in param_keys:
+            param_keys.append(key)
+        return f"${param_keys.index(key) + 1}"
+
+    return PARAM_PATTERN.sub(number_param, sql).replace("%%", "%"), param_keys
+
+
+def make_numbered_args(sql: str, param_dict: Dict[str, Any]) -> Tuple[str, List[Any]]:
+    """
+    sql:
+    the statement with %(key)s placeholders
+
+    param_dict:
+    the values for the placeholders
+
+    returns:
+    Tuple containing...
+    the statement with $1, $2... placeholders
+    the values in positional order
+    """
+    numbered_sql, param_keys = make_numbered_sql(sql)
+    return numbered_sql, [param_dict[key] for key in param_keys]
@@ -0,0 +1,34 @@
+"""
+Runs the app in several uvicorn worker processes. Every worker opens its own
+pools, sized so all of them together stay under PG_MAX_CONNECTIONS.
+
+    python app/serve.py --workers 4 --host 0.0.0.0 --port 8000
+"""
+
+import argparse
+import os
+
+import uvicorn
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=int(os.environ.get("WEB_CONCURRENCY", "1")),
+        help="worker processes, defaults to WEB_CONCURRENCY",
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+
+    # NOTE: the workers inherit the environment and split PG_MAX_CONNECTIONS by it
+    os.environ["WEB_CONCURRENCY"] = str(args.workers)
+    uvicorn.run("main:app", host=args.host, port=args.port, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Compares updating a batch of users with one update_user call per row against a
+single bulk_update_users statement.
+
+Run against a local postgres (see README) with the app directory on the path
+
+    python bench/bench_bulk_update.py --users 1000 --rounds 5
+"""
+
+import argparse
+import statistics
+import time
+from typing import Any, Callable, Dict, List
+
+from postgres import Postgres
+
+from db_user import bulk_update_users, create_users, update_user
+from illu_db import init_db
+
+PHONE_PREFIX: str = "+999"
+
+
+def per_row(rows: List[Dict[str, Any]]) -> None:
+    """
+    the update path before bulk_update_users, one statement and transaction per row
+    """
+    for row in rows:
+        update_user(**row)
+
+
+def bulk(rows: List[Dict[str, Any]]) -> None:
+    """
+    the single statement update path
+    """
+    bulk_update_users(rows)
+
+
+def make_updates(count: int, round_index: int) -> List[Dict[str, Any]]:
+    """
+    makes update rows that change a different mix of columns per row
+
+    count:
+        the number of users to update
+    round_index:
+        keeps the new values of different rounds apart so every row changes
+    """
+    rows: List[Dict[str, Any]] = []
+    for index in range(count):
+        row: Dict[str, Any] = {"phone_prefix": PHONE_PREFIX, "phone": f"{index:06}"}
+        if index % 2 == 0:
+            row["user_name"] = f"bench user {round_index}"
+        if index % 3 == 0:
+            row["jwt"] = f"jwt {round_index} {index}"
+        if index % 2 != 0 and index % 3 != 0:
+            row["pw_hash"] = f"hash {round_index}"
+        rows.append(row)
+    return rows
+
+
+def time_rounds(
+    func: Callable[[List[Dict[str, Any]]], None], count: int, rounds: int
+) -> List[float]:
+    """
+    times each round of updating every user in milliseconds
+
+    func:
+        the update path to time
+    count:
+        the number of users to update per round
+    rounds:
+        how many times to update every user
+
+    returns:
+        list of round latencies in milliseconds
+    """
+    latencies: List[float] = []
+    for round_index in range(rounds):
+        rows: List[Dict[str, Any]] = make_updates(count, round_index)
+        start: float = time.perf_counter()
+        func(rows)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def report(name: str, count: int, latencies: List[float]) -> None:
+    """
+    prints the latency summary for one update path
+    """
+    mean: float = statistics.mean(latencies)
+    print(
+        f"{name:<20} mean={mean:.3f}ms min={min(latencies):.3f}ms "
+        f"per row={mean / count:.4f}ms"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    db: Postgres = init_db()
+    try:
+        create_users(
+            [
+                {
+                    "phone_prefix": PHONE_PREFIX,
+                    "phone": f"{index:06}",
+                    "user_name": "bench user",
+                    "pw_hash": "fakehash",
+                }
+                for index in range(args.users)
+            ]
+        )
+        # NOTE: warm up the pool so the first path doesn't pay for connecting
+        time_rounds(bulk, args.users, 1)
+        report("per row", args.users, time_rounds(per_row, args.users, args.rounds))
+        report("bulk", args.users, time_rounds(bulk, args.users, args.rounds))
+    finally:
+        db.run(
+            "DELETE FROM my_schema.illu_user WHERE phone_prefix=%(phone_prefix)s",
+            phone_prefix=PHONE_PREFIX,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Compares the old INSERT then SELECT create path against the single
+INSERT ... RETURNING statement used by create_user.
+
+Run against a local postgres (see README) with the app directory on the path
+
+    python bench/bench_create.py --iterations 500
+"""
+
+import argparse
+import statistics
+import time
+from typing import Any, Callable, Dict, List
+
+from postgres import Postgres
+
+from db_user import SELECT_USER, create_user
+from illu_db import init_db
+
+PHONE_PREFIX: str = "+999"
+
+
+def insert_then_select(phone: str) -> Dict[str, Any]:
+    """
+    the two round trip create path that create_user used before RETURNING
+
+    phone:
+        the phone number of the user to create
+
+    returns:
+        Dictionary containing the created user
+    """
+    db: Postgres = init_db()
+    with db.get_cursor() as cursor:
+        cursor.run(
+            """
+                INSERT INTO my_schema.illu_user(
+                    phone_prefix, phone, user_name, pw_hash, jwt, org_id
+                )
+                VALUES(
+                    %(phone_prefix)s,
+                    %(phone)s,
+                    %(user_name)s,
+                    %(pw_hash)s,
+                    %(jwt)s,
+                    %(org_id)s
+                )
+            """,
+            phone_prefix=PHONE_PREFIX,
+            phone=phone,
+            user_name="bench user",
+            pw_hash="fakehash",
+            jwt=None,
+            org_id=None,
+        )
+        return cursor.one(
+            SELECT_USER + "WHERE phone_prefix=%(phone_prefix)s AND phone=%(phone)s",
+            phone_prefix=PHONE_PREFIX,
+            phone=phone,
+            back_as=dict,
+        )
+
+
+def insert_returning(phone: str) -> Dict[str, Any]:
+    """
+    the single round trip create path
+
+    phone:
+        the phone number of the user to create
+
+    returns:
+        Dictionary containing the created user
+    """
+    _, result = create_user(
+        phone_prefix=PHONE_PREFIX,
+        phone=phone,
+        user_name="bench user",
+        pw_hash="fakehash",
+    )
+    return result
+
+
+def time_calls(func: Callable[[str], Any], iterations: int, tag: str) -> List[float]:
+    """
+    times each call of func in milliseconds
+
+    func:
+        the create function to call with a unique phone number
+    iterations:
+        how many users to create
+    tag:
+        keeps the phone numbers of different runs apart
+
+    returns:
+        list of call latencies in milliseconds
+    """
+    latencies: List[float] = []
+    for index in range(iterations):
+        start: float = time.perf_counter()
+        func(f"{tag}{index}")
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def report(name: str, latencies: List[float]) -> None:
+    """
+    prints the latency summary for one create path
+    """
+    quantiles: List[float] = statistics.quantiles(latencies, n=100)
+    print(
+        f"{name:<20} mean={statistics.mean(latencies):.3f}ms "
+        f"p50={quantiles[49]:.3f}ms p95={quantiles[94]:.3f}ms"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=500)
+    args = parser.parse_args()
+
+    db: Postgres = init_db()
+    try:
+        # NOTE: warm up the pool so the first path doesn't pay for connecting
+        time_calls(insert_returning, 10, "warm")
+        report("insert + select", time_calls(insert_then_select, args.iterations, "a"))
+        report("insert returning", time_calls(insert_returning, args.iterations, "b"))
+    finally:
+        db.run(
+            "DELETE FROM my_schema.illu_user WHERE phone_prefix=%(phone_prefix)s",
+            phone_prefix=PHONE_PREFIX,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+"""
+Drives every db_user and db_org helper at a configurable concurrency against a
+seeded local postgres and reports throughput and latency percentiles as JSON,
+so runs can be compared across commits.
+
+Run with the app and bench directories on the path
+
+    python bench/bench_db.py --users 100000 --orgs 100 --concurrency 16 \
+        --requests 2000 --output bench_db.json
+
+The user cache is on by default, so lookups by id and by phone mostly measure
+cache hits. Pass --no-cache to measure the database.
+"""
+
+import argparse
+import itertools
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from postgres import Postgres
+
+from db_org import create_org, delete_org
+from db_user import create_user, delete_user, get_user, update_user
+from illu_cache import init_user_cache
+from illu_db import get_pool_stats, init_db, warm_db
+from seed import SEED_PHONE_PREFIX, seed, unseed
+
+PHONE_PREFIX: str = "+996"
+ORG_PREFIX: str = "bench org "
+OPERATIONS: List[str] = [
+    "create_org",
+    "create_user",
+    "get_user_id",
+    "get_user_phone",
+    "get_user_user_name",
+    "get_user_org_id",
+    "update_user",
+    "delete_user",
+    "delete_org",
+]
+
+
+def percentile(latencies: List[float], fraction: float) -> float:
+    """
+    nearest rank percentile
+
+    latencies:
+        the sorted latencies
+    fraction:
+        the percentile as a fraction, e.g. 0.95
+
+    returns:
+        the latency at that percentile, 0 if there are none
+    """
+    if len(latencies) == 0:
+        return 0.0
+    rank: int = max(0, min(len(latencies) - 1, round(fraction * len(latencies)) - 1))
+    return latencies[rank]
+
+
+def run_operation(
+    call: Callable[[int], Any], requests: int, concurrency: int
+) -> Dict[str, Any]:
+    """
+    calls an operation requests times from concurrency threads
+
+    call:
+        the operation, called with the index of the request
+    requests:
+        how many times to call it
+    concurrency:
+        how many calls are in flight at once
+
+    returns:
+        Dictionary of the throughput and latency percentiles in ms of the calls
+        that succeeded, and the number of calls that failed
+    """
+    latencies: List[float] = []
+    errors: List[str] = []
+
+    def timed(index: int) -> None:
+        start: float = time.perf_counter()
+        try:
+            call(index)
+            latencies.append((time.perf_counter() - start) * 1000)
+        except Exception as error:
+            errors.append(repr(error))
+
+    start: float = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(timed, range(requests)))
+    elapsed: float = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "requests": requests,
+        "succeeded": len(latencies),
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+        "seconds": elapsed,
+        # NOTE: failed calls can be much faster than real ones, so they don't count
+        "throughput": len(latencies) / elapsed if elapsed > 0 else 0.0,
+        "mean_ms": statistics.mean(latencies) if latencies else 0.0,
+        "p50_ms": percentile(latencies, 0.50),
+        "p95_ms": percentile(latencies, 0.95),
+        "p99_ms": percentile(latencies, 0.99),
+        "max_ms": latencies[-1] if latencies else 0.0,
+    }
+
+
+def git_commit() -> Optional[str]:
+    """
+    returns:
+        the commit being benchmarked, None outside of a git checkout
+    """
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--users", type=int, default=100000, help="seed users")
+    parser.add_argument("--orgs", type=int, default=100, help="seed orgs")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument(
+        "--requests", type=int, default=1000, help="calls per operation"
+    )
+    parser.add_argument(
+        "--operations", nargs="+", choices=OPERATIONS, default=OPERATIONS
+    )
+    parser.add_argument("--pool-size", type=int, help="overrides PG_POOL_MAX")
+    parser.add_argument("--no-cache", action="store_true", help="turn the cache off")
+    parser.add_argument("--output", help="write the JSON here instead of stdout")
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+    args = parser.parse_args()
+
+    # NOTE: the settings are read when the pool and the cache are first used
+    if args.pool_size:
+        os.environ["PG_POOL_MAX"] = str(args.pool_size)
+    if args.no_cache:
+        os.environ["USER_CACHE_SIZE"] = "0"
+
+    db: Postgres = init_db()
+    rng: random.Random = random.Random(args.seed)
+    results: Dict[str, Dict[str, Any]] = {}
+    try:
+        org_ids: List[int] = seed(args.users, args.orgs)
+        user_ids: List[int] = db.all(
+            "SELECT id FROM my_schema.illu_user WHERE phone_prefix=%(phone_prefix)s",
+            phone_prefix=SEED_PHONE_PREFIX,
+        )
+        warm_db()
+        # NOTE: unique names for the creates, which the deletes then remove
+        run_id: Iterator[int] = itertools.count()
+        created_phones: List[str] = []
+        created_orgs: List[str] = []
+
+        def create_one_user(index: int) -> None:
+            phone: str = f"{next(run_id):09}"
+            create_user(PHONE_PREFIX, phone, "bench user", "fakehash")
+            created_phones.append(phone)
+
+        def create_one_org(index: int) -> None:
+            name: str = f"{ORG_PREFIX}{next(run_id)}"
+            create_org(name)
+            created_orgs.append(name)
+
+        calls: Dict[str, Callable[[int], Any]] = {
+            "create_org": create_one_org,
+            "create_user": create_one_user,
+            "get_user_id": lambda _: get_user(user_id=rng.choice(user_ids)),
+            "get_user_phone": lambda _: get_user(
+                phone_prefix=SEED_PHONE_PREFIX,
+                phone=f"{rng.randrange(args.users):09}",
+            ),
+            "get_user_user_name": lambda _: get_user(
+                user_name=f"seed user {rng.randrange(1000)}"
+            ),
+            "get_user_org_id": lambda _: get_user(org_id=rng.choice(org_ids)),
+            "update_user": lambda _: update_user(
+                SEED_PHONE_PREFIX,
+                f"{rng.randrange(args.users):09}",
+                user_name=f"seed user {rng.randrange(1000)}",
+            ),
+            "delete_user": lambda index: delete_user(
+                PHONE_PREFIX, created_phones[index % len(created_phones)]
+            ),
+            "delete_org": lambda index: delete_org(
+                created_orgs[index % len(created_orgs)]
+            ),
+        }
+        # NOTE: the deletes remove what the creates made. Without the matching
+        # create in --operations, or with fewer creates than deletes, the rows
+        # are made up front and not timed
+        for_deletes: Dict[str, Callable[[int], None]] = {
+            "delete_user": create_one_user,
+            "delete_org": create_one_org,
+        }
+        created: Dict[str, List[str]] = {
+            "delete_user": created_phones,
+            "delete_org": created_orgs,
+        }
+        for name in OPERATIONS:
+            if name in args.operations:
+                if name in for_deletes:
+                    for index in range(len(created[name]), args.requests):
+                        for_deletes[name](index)
+                print(f"running {name}", file=sys.stderr)
+                results[name] = run_operation(
+                    calls[name], args.requests, args.concurrency
+                )
+
+        output: Dict[str, Any] = {
+            "commit": git_commit(),
+            "config": {
+                "users": args.users,
+                "orgs": args.orgs,
+                "concurrency": args.concurrency,
+                "requests": args.requests,
+                "cache": not args.no_cache,
+                "pool_max": db.pool.maxconn,
+            },
+            "results": results,
+            "pool": get_pool_stats(),
+            "cache": init_user_cache().stats(),
+        }
+        text: str = json.dumps(output, indent=4)
+        if args.output:
+            with open(args.output, "w") as output_file:
+                output_file.write(text)
+        else:
+            print(text)
+    finally:
+        db.run(
+            "DELETE FROM my_schema.illu_user WHERE phone_prefix=%(phone_prefix)s",
+            phone_prefix=PHONE_PREFIX,
+        )
+        db.run(
+            "DELETE FROM my_schema.organization WHERE org_name LIKE %(pattern)s",
+            pattern=ORG_PREFIX + "%",
+        )
+        unseed()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Compares the ways a get_user response can be serialized on a payload of user rows
+like the ones the db helpers return. Doesn't need a database.
+
+    default         what FastAPI does with a returned list: jsonable_encoder, then
+                    starlette's JSONResponse
+    response_model  the same with the rows validated against a pydantic model first
+    fast            FastJSONResponse returned from the endpoint, no encoder pass
+
+Run with the app directory on the path
+
+    python bench/bench_json.py --rows 10000 --number 20
+"""
+
+import argparse
+import asyncio
+import timeit
+from typing import Any, Callable, Dict, List, Optional
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+from pydantic import BaseModel
+from starlette.responses import JSONResponse
+
+from illu_json import FastJSONResponse
+
+
+class UserRow(BaseModel):
+    id: int
+    phone_prefix: str
+    phone: str
+    user_name: str
+    org_id: Optional[int]
+
+
+def make_rows(count: int) -> List[Dict[str, Any]]:
+    """
+    returns:
+        List of count user dicts with the columns of db_user.USER_COLS
+    """
+    return [
+        {
+            "id": index,
+            "phone_prefix": "+998",
+            "phone": f"{index:09}",
+            "user_name": f"seed user {index % 1000}",
+            "org_id": index % 20 if index % 3 else None,
+            "version": 1,
+        }
+        for index in range(count)
+    ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--number", type=int, default=20, help="runs per path")
+    args = parser.parse_args()
+
+    rows: List[Dict[str, Any]] = make_rows(args.rows)
+    field: Any = create_response_field(name="Response_get_user", type_=List[UserRow])
+
+    def default() -> bytes:
+        return JSONResponse(jsonable_encoder(rows)).body
+
+    def response_model() -> bytes:
+        content: Any = asyncio.run(
+            serialize_response(field=field, response_content=rows)
+        )
+        return JSONResponse(content).body
+
+    def fast() -> bytes:
+        return FastJSONResponse(rows).body
+
+    paths: Dict[str, Callable[[], bytes]] = {
+        "default": default,
+        "response_model": response_model,
+        "fast": fast,
+    }
+    bodies: List[bytes] = [path() for path in paths.values()]
+    assert all(body == bodies[0] for body in bodies), "the paths' output differs"
+
+    baseline: float = 0.0
+    for name, path in paths.items():
+        seconds: float = timeit.timeit(path, number=args.number) / args.number
+        baseline = baseline or seconds
+        print(
+            f"{name:<15} {seconds * 1000:8.3f}ms per response "
+            f"speedup={baseline / seconds:.1f}x bytes={len(bodies[0])}"
+        )
+
+
+if __name__ == "__main__":
+    main()
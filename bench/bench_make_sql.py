@@ -0,0 +1,83 @@
+"""
+Microbenchmark of the make_sql builders with a cold and a warm SQL_CACHE.
+Doesn't need a database.
+
+    python bench/bench_make_sql.py --number 100000
+"""
+
+import argparse
+import timeit
+from typing import Any, Callable, Dict, List
+
+from make_sql import SQL_CACHE, SqlParam, make_update_sql, make_where_sql
+
+
+def build_get_user_where() -> str:
+    """
+    the where expression get_user builds for a lookup by phone
+    """
+    return make_where_sql(
+        {
+            "id": None,
+            "phone_prefix": "+1",
+            "phone": "1234567",
+            "user_name": None,
+            "org_id": None,
+        },
+        "AND",
+    )
+
+
+def build_update_user() -> str:
+    """
+    the statement update_user builds when changing the name and org
+    """
+    param_dict: Dict[str, Any] = {}
+    update_args: List[SqlParam] = [
+        SqlParam(col_name="phone_prefix", value=None, param_key="new_phone_prefix"),
+        SqlParam(col_name="phone", value=None),
+        SqlParam(col_name="user_name", value="new name"),
+        SqlParam(col_name="pw_hash", value=None),
+        SqlParam(col_name="jwt", value=None),
+        SqlParam(col_name="org_id", value=5),
+    ]
+    where_args: List[SqlParam] = [
+        SqlParam(col_name="phone_prefix", value="+1", param_key="old_phone_prefix"),
+        SqlParam(col_name="phone", value="1234567", param_key="old_phone"),
+    ]
+    return make_update_sql(
+        param_dict, "my_schema.illu_user", update_args, where_args, "AND"
+    )
+
+
+def time_builder(builder: Callable[[], str], number: int) -> None:
+    """
+    prints the per call cost of builder with a cold and a warm cache
+    """
+
+    def cold() -> str:
+        SQL_CACHE.clear()
+        return builder()
+
+    cold_seconds: float = timeit.timeit(cold, number=number)
+    SQL_CACHE.clear()
+    builder()
+    warm_seconds: float = timeit.timeit(builder, number=number)
+    print(
+        f"{builder.__name__:<22} cold={cold_seconds / number * 1e6:.3f}us "
+        f"warm={warm_seconds / number * 1e6:.3f}us "
+        f"hit_rate={SQL_CACHE.hit_rate():.3f}"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--number", type=int, default=100000)
+    args = parser.parse_args()
+
+    time_builder(build_get_user_where, args.number)
+    time_builder(build_update_user, args.number)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Compares a multi-step flow run as separate helper calls against the same calls
+joined into one illu_db.transaction. The flow creates an org, creates its admin
+user and then sets the user's org, like a signup does.
+
+    separate        every helper checks out a connection and commits on its own
+    transaction     the helpers share one connection and one COMMIT
+
+psycopg2 sends BEGIN and COMMIT as round trips of their own, so a flow costs
+its statements plus two round trips per transaction. Every round trip is a
+network wait once postgres isn't on the same host.
+
+Run against a local postgres (see README) with the app directory on the path
+
+    python bench/bench_unit_of_work.py --iterations 500
+"""
+
+import argparse
+import statistics
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from postgres import Postgres
+
+from db_org import create_org
+from db_user import create_user, update_user
+from illu_db import init_db, transaction
+from illu_query_stats import get_query_stats, QUERY_STATS
+
+PHONE_PREFIX: str = "+997"
+ORG_PREFIX: str = "bench uow org "
+
+
+def separate(tag: str) -> None:
+    """
+    the flow as three helper calls, three transactions
+
+    tag:
+        makes the org name and phone number unique
+    """
+    _, org = create_org(ORG_PREFIX + tag)
+    create_user(PHONE_PREFIX, tag, "bench admin", "fakehash")
+    update_user(PHONE_PREFIX, tag, org_id=org["id"])
+
+
+def one_transaction(tag: str) -> None:
+    """
+    the same flow in one unit of work
+    """
+    with transaction() as cursor:
+        _, org = create_org(ORG_PREFIX + tag, cursor=cursor)
+        create_user(PHONE_PREFIX, tag, "bench admin", "fakehash", cursor=cursor)
+        update_user(PHONE_PREFIX, tag, org_id=org["id"], cursor=cursor)
+
+
+def run_flows(func: Callable[[str], None], iterations: int, tag: str) -> Dict[str, Any]:
+    """
+    runs func iterations times and counts what it cost
+
+    func:
+        the flow to run with a unique tag
+    iterations:
+        how many flows to run
+    tag:
+        keeps the orgs and users of different runs apart
+
+    returns:
+        Dictionary containing the flow latencies in milliseconds and the
+        checkouts, statements and round trips per flow
+    """
+    QUERY_STATS.clear()
+    latencies: List[float] = []
+    for index in range(iterations):
+        start: float = time.perf_counter()
+        func(f"{tag}{index}")
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    stats: Dict[str, Dict[str, Dict[str, float]]] = get_query_stats()
+    checkout: Optional[Dict[str, float]] = stats["checkout"].get("pool")
+    checkouts: float = 0 if checkout is None else checkout["count"]
+    statements: float = sum(query["count"] for query in stats["queries"].values())
+    return {
+        "latencies": latencies,
+        "checkouts": checkouts / iterations,
+        "statements": statements / iterations,
+        # NOTE: every checkout is one transaction, so one BEGIN and one COMMIT
+        "round_trips": (statements + 2 * checkouts) / iterations,
+    }
+
+
+def report(name: str, result: Dict[str, Any]) -> None:
+    """
+    prints the summary for one way of running the flow
+    """
+    latencies: List[float] = result["latencies"]
+    quantiles: List[float] = statistics.quantiles(latencies, n=100)
+    print(
+        f"{name:<12} mean={statistics.mean(latencies):.3f}ms "
+        f"p50={quantiles[49]:.3f}ms p95={quantiles[94]:.3f}ms "
+        f"checkouts={result['checkouts']:g} statements={result['statements']:g} "
+        f"round_trips={result['round_trips']:g}"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--iterations", type=int, default=500)
+    args = parser.parse_args()
+
+    db: Postgres = init_db()
+    try:
+        # NOTE: warm up the pool so the first path doesn't pay for connecting
+        run_flows(one_transaction, 10, "w")
+        report("separate", run_flows(separate, args.iterations, "s"))
+        report("transaction", run_flows(one_transaction, args.iterations, "t"))
+    finally:
+        db.run(
+            "DELETE FROM my_schema.illu_user WHERE phone_prefix=%(phone_prefix)s",
+            phone_prefix=PHONE_PREFIX,
+        )
+        db.run(
+            "DELETE FROM my_schema.organization WHERE org_name LIKE %(pattern)s",
+            pattern=ORG_PREFIX + "%",
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Runs EXPLAIN on every query shape the db helpers can issue against a seeded
+database and reports the estimated cost and any full table or index scans.
+
+Run against a local postgres (see README) with the app directory on the path
+
+    python bench/index_advisor.py --users 100000 --orgs 100
+"""
+
+import argparse
+import json
+from typing import Any, Dict, List
+
+from postgres import Postgres
+
+from illu_db import init_db
+from illu_explain import (
+    explain_shape,
+    get_leading_columns,
+    PlanReport,
+    query_shapes,
+)
+from seed import seed, unseed
+
+
+def report(reports: List[PlanReport]) -> None:
+    """
+    prints one line per query shape, full scans first then by cost
+    """
+    for plan_report in sorted(
+        reports, key=lambda item: (not item.full_scans, -item.total_cost)
+    ):
+        flag: str = "FULL SCAN" if plan_report.full_scans else "ok"
+        print(
+            f"{flag:<10} cost={plan_report.total_cost:>12.2f} "
+            f"{plan_report.shape.name:<50} {', '.join(plan_report.full_scans)}"
+        )
+    full_scan_count: int = sum(1 for item in reports if item.full_scans)
+    print(f"{full_scan_count} of {len(reports)} query shapes read a whole relation")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--orgs", type=int, default=100)
+    parser.add_argument("--json", help="also write the reports to this file")
+    parser.add_argument(
+        "--keep", action="store_true", help="leave the seed data in the database"
+    )
+    args = parser.parse_args()
+
+    db: Postgres = init_db()
+    try:
+        seed(args.users, args.orgs)
+        reports: List[PlanReport] = []
+        with db.get_cursor() as cursor:
+            leading_columns: Dict[str, str] = get_leading_columns(cursor)
+            for shape in query_shapes():
+                reports.append(explain_shape(cursor, shape, leading_columns))
+        report(reports)
+        if args.json:
+            results: List[Dict[str, Any]] = [
+                {
+                    "name": item.shape.name,
+                    "sql": item.shape.sql,
+                    "total_cost": item.total_cost,
+                    "full_scans": item.full_scans,
+                }
+                for item in reports
+            ]
+            with open(args.json, "w") as json_file:
+                json.dump(results, json_file, indent=4)
+    finally:
+        if not args.keep:
+            unseed()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Load test comparing a threadpool endpoint (plain def, blocking psycopg2 pool)
+with an asyncio endpoint (async def, asyncpg pool) as concurrency grows past
+the default threadpool limit of 40 threads.
+
+Requests go through the FastAPI app in process, so no server is needed, only the
+local postgres. --db-latency-ms makes every request hold a connection for that long
+with pg_sleep, standing in for a slower query or a database across the network.
+
+    python bench/load_async.py --concurrency 10 40 80 160 --db-latency-ms 50
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import time
+from typing import Dict, List
+
+import asyncpg
+import httpx
+from postgres import Postgres
+
+import illu_db
+import illu_db_async
+from db_user import create_user, delete_user
+from main import app
+
+PHONE_PREFIX: str = "+998"
+PHONE: str = "1000000"
+DB_LATENCY_SECONDS: float = 0.0
+
+
+@app.get("/bench/sync_user")
+def sync_get_user(user_id: int) -> List[Dict[str, object]]:
+    """
+    the blocking version of GET /user, run in the threadpool like the old endpoints
+    """
+    db: Postgres = illu_db.init_db()
+    with db.get_cursor() as cursor:
+        if DB_LATENCY_SECONDS > 0:
+            cursor.run("SELECT pg_sleep(%(seconds)s)", seconds=DB_LATENCY_SECONDS)
+        return cursor.all(
+            "SELECT id, phone_prefix, phone, user_name, org_id "
+            "FROM my_schema.illu_user WHERE id=%(id)s",
+            id=user_id,
+            back_as=dict,
+        )
+
+
+@app.get("/bench/async_user")
+async def async_get_user(user_id: int) -> List[Dict[str, object]]:
+    """
+    the asyncio version of GET /user
+    """
+    db: asyncpg.Pool = await illu_db_async.init_async_db()
+    async with db.acquire() as connection:
+        if DB_LATENCY_SECONDS > 0:
+            await connection.execute("SELECT pg_sleep($1)", DB_LATENCY_SECONDS)
+        records = await connection.fetch(
+            "SELECT id, phone_prefix, phone, user_name, org_id "
+            "FROM my_schema.illu_user WHERE id=$1",
+            user_id,
+        )
+    return [dict(record) for record in records]
+
+
+async def drive(
+    client: httpx.AsyncClient, path: str, concurrency: int, total: int
+) -> List[float]:
+    """
+    sends total GET requests to path with concurrency requests in flight
+
+    returns:
+        list of request latencies in milliseconds
+    """
+    latencies: List[float] = []
+    remaining: List[int] = [total]
+
+    async def worker() -> None:
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            start: float = time.perf_counter()
+            response: httpx.Response = await client.get(path)
+            response.raise_for_status()
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies
+
+
+async def main() -> None:
+    global DB_LATENCY_SECONDS
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[10, 40, 80, 160])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--db-latency-ms", type=float, default=50.0)
+    parser.add_argument("--pool-size", type=int, default=90)
+    args = parser.parse_args()
+    DB_LATENCY_SECONDS = args.db_latency_ms / 1000
+
+    # NOTE: same pool size on both sides so only the threadpool differs. The sides run
+    # one after the other so together they stay under postgres' max_connections
+    os.environ["PG_POOL_MAX"] = str(args.pool_size)
+
+    _, user = create_user(PHONE_PREFIX, PHONE, "load test user", "fakehash")
+    transport = httpx.ASGITransport(app=app)  # type: ignore[arg-type]
+    try:
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://bench"
+        ) as client:
+            for name in ["sync", "async"]:
+                for concurrency in args.concurrency:
+                    path: str = f"/bench/{name}_user?user_id={user['id']}"
+                    start: float = time.perf_counter()
+                    latencies: List[float] = await drive(
+                        client, path, concurrency, args.requests
+                    )
+                    elapsed: float = time.perf_counter() - start
+                    quantiles: List[float] = statistics.quantiles(latencies, n=100)
+                    print(
+                        f"{name:<5} concurrency={concurrency:<4} "
+                        f"rps={len(latencies) / elapsed:8.1f} "
+                        f"p50={quantiles[49]:7.2f}ms p99={quantiles[98]:7.2f}ms"
+                    )
+                illu_db.init_db().pool.clear()
+    finally:
+        delete_user(PHONE_PREFIX, PHONE)
+        await illu_db_async.close_async_db()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
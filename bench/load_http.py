@@ -0,0 +1,361 @@
+"""
+HTTP load test of the app under uvicorn. For every worker count and keep-alive
+setting it starts `uvicorn main:app`, replays a weighted mix of requests from
+concurrent httpx clients for a fixed time, then reports requests per second,
+error rates and latency histograms per route.
+
+Run from the repository root with the app and bench directories on the path
+
+    python bench/load_http.py --workers 1 2 4 --keep-alive on off \
+        --concurrency 64 --duration 10 --output load_http.json
+
+The default mix is the /info routes and the GET /user lookups. It leaves out
+the write routes, which would change the seeded data between runs, the /org
+routes, /user/export and /metrics. Pass --mix with a JSON file to replay a
+different one, a list of entries like
+
+    {"method": "GET", "path": "/user?user_id={user_id}", "weight": 3}
+
+{user_id}, {org_id}, {phone} and {name} in paths and bodies are filled in
+with seeded values for every request.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+import httpx
+from postgres import Postgres
+
+from illu_db import init_db
+from seed import SEED_PHONE_PREFIX, seed, unseed
+
+REPO_DIR: str = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# NOTE: upper bounds of the latency histogram buckets in ms, the last one is open
+HISTOGRAM_BOUNDS_MS: List[float] = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000]
+DEFAULT_MIX: List[Dict[str, Any]] = [
+    {"method": "GET", "path": "/", "weight": 2},
+    {"method": "GET", "path": "/info?limit=5&score=95", "weight": 2},
+    {
+        "method": "POST",
+        "path": "/info",
+        "json": {"name": "{name}", "id": "{user_id}", "score": 90},
+        "weight": 1,
+    },
+    {"method": "GET", "path": "/info/{name}", "weight": 2},
+    {"method": "GET", "path": "/info/{user_id}/score", "weight": 2},
+    {"method": "GET", "path": "/user?user_id={user_id}", "weight": 4},
+    {
+        "method": "GET",
+        "path": "/user?phone_prefix=%2B998&phone={phone}",
+        "weight": 2,
+    },
+    {"method": "GET", "path": "/user?org_id={org_id}&limit=50", "weight": 1},
+]
+
+
+class RouteStats:
+    latencies_ms: List[float]
+    statuses: Dict[int, int]
+    errors: int
+
+    def __init__(self) -> None:
+        self.latencies_ms = []
+        self.statuses = {}
+        self.errors = 0
+
+    def add(self, latency_ms: float, status: Optional[int]) -> None:
+        """
+        latency_ms:
+            how long the request took
+        status:
+            the response status, None if the request failed without a response
+        """
+        self.latencies_ms.append(latency_ms)
+        if status is None:
+            self.errors += 1
+        else:
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+            if status >= 500:
+                self.errors += 1
+
+    def summary(self, seconds: float) -> Dict[str, Any]:
+        """
+        seconds:
+            how long the run lasted
+
+        returns:
+            Dictionary of the request rate, error rate, percentiles and histogram
+        """
+        latencies: List[float] = sorted(self.latencies_ms)
+        count: int = len(latencies)
+        histogram: Dict[str, int] = {}
+        lower: int = 0
+        for bound in HISTOGRAM_BOUNDS_MS:
+            upper: int = lower
+            while upper < count and latencies[upper] <= bound:
+                upper += 1
+            histogram[f"<={bound:g}ms"] = upper - lower
+            lower = upper
+        histogram[f">{HISTOGRAM_BOUNDS_MS[-1]:g}ms"] = count - lower
+
+        def percentile(fraction: float) -> float:
+            return latencies[max(0, round(fraction * count) - 1)] if count else 0.0
+
+        return {
+            "requests": count,
+            "requests_per_second": count / seconds if seconds > 0 else 0.0,
+            "error_rate": self.errors / count if count else 0.0,
+            "statuses": {str(key): value for key, value in self.statuses.items()},
+            "mean_ms": statistics.mean(latencies) if latencies else 0.0,
+            "p50_ms": percentile(0.50),
+            "p95_ms": percentile(0.95),
+            "p99_ms": percentile(0.99),
+            "histogram": histogram,
+        }
+
+
+def fill(template: Any, values: Dict[str, str]) -> Any:
+    """
+    fills the {placeholders} of a path or a json body with seeded values
+
+    template:
+        a string, or a list or dict that contains strings
+    values:
+        the value of every placeholder
+
+    returns:
+        the filled copy. A string that is only a placeholder of a number is
+        returned as an int
+    """
+    if isinstance(template, str):
+        result: str = template.format(**values)
+        if template.startswith("{") and template.endswith("}") and result.isdigit():
+            return int(result)
+        return result
+    if isinstance(template, list):
+        return [fill(item, values) for item in template]
+    if isinstance(template, dict):
+        return {key: fill(value, values) for key, value in template.items()}
+    return template
+
+
+def start_server(port: int, workers: int, keep_alive_seconds: int) -> subprocess.Popen:
+    """
+    starts uvicorn and waits until it answers
+
+    port:
+        the port to listen on
+    workers:
+        the number of uvicorn worker processes
+    keep_alive_seconds:
+        how long uvicorn keeps an idle connection open
+
+    returns:
+        the server process
+    """
+    server: subprocess.Popen = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "--app-dir",
+            "app",
+            "main:app",
+            "--host",
+            "127.0.0.1",
+            "--port",
+            str(port),
+            "--workers",
+            str(workers),
+            "--timeout-keep-alive",
+            str(keep_alive_seconds),
+            "--no-access-log",
+            "--log-level",
+            "warning",
+        ],
+        cwd=REPO_DIR,
+    )
+    deadline: float = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/").status_code == 200:
+                return server
+        except httpx.TransportError:
+            pass
+        if server.poll() is not None:
+            break
+        time.sleep(0.1)
+    server.kill()
+    raise RuntimeError(f"uvicorn didn't start on port {port}")
+
+
+async def replay(
+    base_url: str,
+    mix: List[Dict[str, Any]],
+    values: Dict[str, List[str]],
+    concurrency: int,
+    duration: float,
+    keep_alive: bool,
+) -> Dict[str, Any]:
+    """
+    sends requests from the mix from concurrency clients until duration is up
+
+    base_url:
+        the server to load
+    mix:
+        the weighted requests to pick from
+    values:
+        the seeded values to fill placeholders with
+    concurrency:
+        the number of requests in flight at once
+    duration:
+        how many seconds to send requests for
+    keep_alive:
+        reuse connections between requests, otherwise every request connects
+
+    returns:
+        Dictionary of the summary of all requests and of every route
+    """
+    limits: httpx.Limits = httpx.Limits(
+        max_connections=concurrency,
+        max_keepalive_connections=concurrency if keep_alive else 0,
+    )
+    routes: Dict[str, RouteStats] = {
+        f"{entry['method']} {entry['path']}": RouteStats() for entry in mix
+    }
+    total: RouteStats = RouteStats()
+    weights: List[float] = [entry.get("weight", 1) for entry in mix]
+    rng: random.Random = random.Random(0)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits) as client:
+        deadline: float = time.monotonic() + duration
+
+        async def worker() -> None:
+            while time.monotonic() < deadline:
+                entry: Dict[str, Any] = rng.choices(mix, weights)[0]
+                picked: Dict[str, str] = {
+                    key: rng.choice(options) for key, options in values.items()
+                }
+                status: Optional[int] = None
+                start: float = time.perf_counter()
+                try:
+                    response: httpx.Response = await client.request(
+                        entry["method"],
+                        fill(entry["path"], picked),
+                        json=fill(entry.get("json"), picked),
+                    )
+                    status = response.status_code
+                except httpx.HTTPError:
+                    pass
+                latency_ms: float = (time.perf_counter() - start) * 1000
+                routes[f"{entry['method']} {entry['path']}"].add(latency_ms, status)
+                total.add(latency_ms, status)
+
+        start: float = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        seconds: float = time.perf_counter() - start
+
+    return {
+        "total": total.summary(seconds),
+        "routes": {name: stats.summary(seconds) for name, stats in routes.items()},
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument(
+        "--keep-alive", nargs="+", choices=["on", "off"], default=["on", "off"]
+    )
+    parser.add_argument(
+        "--server-keep-alive",
+        type=int,
+        default=5,
+        help="seconds uvicorn keeps idle connections open",
+    )
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=10, help="seconds per run")
+    parser.add_argument("--mix", help="JSON file with the request mix")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--users", type=int, default=10000, help="seed users")
+    parser.add_argument("--orgs", type=int, default=20, help="seed orgs")
+    parser.add_argument("--output", help="also write the results to this JSON file")
+    args = parser.parse_args()
+
+    mix: List[Dict[str, Any]] = DEFAULT_MIX
+    if args.mix:
+        with open(args.mix) as mix_file:
+            mix = json.load(mix_file)
+
+    db: Postgres = init_db()
+    runs: List[Dict[str, Any]] = []
+    try:
+        org_ids: List[int] = seed(args.users, args.orgs)
+        user_ids: List[int] = db.all(
+            "SELECT id FROM my_schema.illu_user WHERE phone_prefix=%(phone_prefix)s",
+            phone_prefix=SEED_PHONE_PREFIX,
+        )
+        values: Dict[str, List[str]] = {
+            "user_id": [str(user_id) for user_id in user_ids],
+            "org_id": [str(org_id) for org_id in org_ids],
+            "phone": [f"{index:09}" for index in range(args.users)],
+            "name": [f"seed user {index}" for index in range(1000)],
+        }
+        # NOTE: the seeded values are all we need from this process's pool
+        db.pool.clear()
+
+        for workers in args.workers:
+            for keep_alive in args.keep_alive:
+                server: subprocess.Popen = start_server(
+                    args.port, workers, args.server_keep_alive
+                )
+                try:
+                    result: Dict[str, Any] = asyncio.run(
+                        replay(
+                            f"http://127.0.0.1:{args.port}",
+                            mix,
+                            values,
+                            args.concurrency,
+                            args.duration,
+                            keep_alive == "on",
+                        )
+                    )
+                finally:
+                    server.terminate()
+                    server.wait()
+                total: Dict[str, Any] = result["total"]
+                print(
+                    f"workers={workers} keep-alive={keep_alive:<3} "
+                    f"rps={total['requests_per_second']:.1f} "
+                    f"errors={total['error_rate']:.2%} "
+                    f"p50={total['p50_ms']:.2f}ms p95={total['p95_ms']:.2f}ms "
+                    f"p99={total['p99_ms']:.2f}ms"
+                )
+                runs.append(
+                    dict(
+                        result,
+                        workers=workers,
+                        keep_alive=keep_alive == "on",
+                        concurrency=args.concurrency,
+                    )
+                )
+    finally:
+        unseed()
+
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(runs, output_file, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Profiles a cold start of the app. Reports where the time importing main goes,
+by module, and how long a fresh interpreter takes from importing main to
+answering its first request that queries the database.
+
+Run with the app directory on the path and postgres running
+
+    python bench/profile_startup.py --top 15 --runs 5
+
+tests/test_illu_startup.py fails when a cold start takes longer than
+STARTUP_BUDGET_MS.
+"""
+
+import argparse
+import statistics
+from typing import Any, Dict, List
+
+from illu_startup import ImportTime, profile_imports, time_startup
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--module", default="main", help="the module to import")
+    parser.add_argument("--top", type=int, default=15, help="modules to list")
+    parser.add_argument("--runs", type=int, default=5, help="cold starts to time")
+    parser.add_argument("--path", default="/user?limit=1", help="first request")
+    args = parser.parse_args()
+
+    imports: List[ImportTime] = profile_imports(args.module)
+    print(f"{'self ms':>9} {'total ms':>9}  module")
+    for item in sorted(imports, key=lambda item: item.self_us, reverse=True)[
+        : args.top
+    ]:
+        print(
+            f"{item.self_us / 1000:9.2f} {item.cumulative_us / 1000:9.2f}  "
+            f"{'  ' * item.depth}{item.module}"
+        )
+
+    # NOTE: importtime lists a module after everything it imported, so the direct
+    # imports of the module are the depth 1 lines since the previous top level one
+    direct: List[ImportTime] = []
+    for item in imports:
+        if item.depth == 1:
+            direct.append(item)
+        elif item.depth == 0:
+            if item.module == args.module:
+                break
+            direct = []
+    print(f"\n{'total ms':>9}  imported by {args.module}")
+    for item in direct:
+        print(f"{item.cumulative_us / 1000:9.2f}  {item.module}")
+
+    runs: List[Dict[str, Any]] = [time_startup(args.path) for _ in range(args.runs)]
+    print(f"\nmedian of {args.runs} cold starts, first request {args.path}")
+    for key in ("import_ms", "startup_ms", "first_request_ms", "total_ms"):
+        print(f"{key:<17} {statistics.median(run[key] for run in runs):9.2f}")
+
+
+if __name__ == "__main__":
+    main()
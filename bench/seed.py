@@ -0,0 +1,101 @@
+"""
+Fills the local database with users spread over organizations, for benchmarks
+and query plans that need a realistically sized table.
+
+    python bench/seed.py --users 100000 --orgs 100
+    python bench/seed.py --clean
+"""
+
+import argparse
+from typing import Any, Dict, List
+
+from postgres import Postgres
+
+from db_org import create_org
+from db_user import create_users
+from illu_db import init_db
+
+SEED_PHONE_PREFIX: str = "+998"
+SEED_ORG_PREFIX: str = "seed org "
+# NOTE: rows per create_users call, large enough to go through COPY
+SEED_BATCH_SIZE: int = 10000
+
+
+def seed(users: int, orgs: int) -> List[int]:
+    """
+    creates the seed orgs and users, then refreshes the planner statistics
+
+    users:
+        the number of users to create. Users get one of 1000 names and are spread
+        evenly over the orgs
+    orgs:
+        the number of orgs to create
+
+    returns:
+        List of the seed org ids
+    """
+    org_ids: List[int] = []
+    for index in range(orgs):
+        org: Dict[str, Any]
+        _, org = create_org(f"{SEED_ORG_PREFIX}{index}")
+        org_ids.append(org["id"])
+
+    for start in range(0, users, SEED_BATCH_SIZE):
+        create_users(
+            [
+                {
+                    "phone_prefix": SEED_PHONE_PREFIX,
+                    "phone": f"{index:09}",
+                    "user_name": f"seed user {index % 1000}",
+                    "pw_hash": "fakehash",
+                    "org_id": org_ids[index % len(org_ids)] if org_ids else None,
+                }
+                for index in range(start, min(start + SEED_BATCH_SIZE, users))
+            ]
+        )
+
+    analyze()
+    return org_ids
+
+
+def unseed() -> None:
+    """
+    deletes the seed users and orgs
+    """
+    db: Postgres = init_db()
+    with db.get_cursor() as cursor:
+        cursor.run(
+            "DELETE FROM my_schema.illu_user WHERE phone_prefix=%(phone_prefix)s",
+            phone_prefix=SEED_PHONE_PREFIX,
+        )
+        cursor.run(
+            "DELETE FROM my_schema.organization WHERE org_name LIKE %(pattern)s",
+            pattern=SEED_ORG_PREFIX + "%",
+        )
+    analyze()
+
+
+def analyze() -> None:
+    """
+    refreshes the planner statistics of the app tables
+    """
+    db: Postgres = init_db()
+    db.run("ANALYZE my_schema.illu_user")
+    db.run("ANALYZE my_schema.organization")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--orgs", type=int, default=100)
+    parser.add_argument("--clean", action="store_true", help="delete the seed data")
+    args = parser.parse_args()
+
+    if args.clean:
+        unseed()
+    else:
+        seed(args.users, args.orgs)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,4 @@
+\c illu_db
+
+DROP INDEX IF EXISTS my_schema.illu_user_user_name_idx;
+DROP INDEX IF EXISTS my_schema.illu_user_org_id_idx;
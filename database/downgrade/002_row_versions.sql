@@ -0,0 +1,8 @@
+\c illu_db
+
+DROP TRIGGER IF EXISTS organization_version ON my_schema.organization;
+DROP TRIGGER IF EXISTS illu_user_version ON my_schema.illu_user;
+DROP FUNCTION IF EXISTS my_schema.bump_version();
+
+ALTER TABLE my_schema.organization DROP COLUMN IF EXISTS version;
+ALTER TABLE my_schema.illu_user DROP COLUMN IF EXISTS version;
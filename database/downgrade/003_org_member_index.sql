@@ -0,0 +1,4 @@
+\c illu_db
+
+CREATE INDEX IF NOT EXISTS illu_user_org_id_idx ON my_schema.illu_user(org_id);
+DROP INDEX IF EXISTS my_schema.illu_user_org_id_id_idx;
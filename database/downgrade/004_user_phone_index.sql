@@ -0,0 +1,3 @@
+\c illu_db
+
+DROP INDEX IF EXISTS my_schema.illu_user_phone_idx;
@@ -4,9 +4,19 @@ CREATE DATABASE illu_db;
 
 CREATE SCHEMA my_schema;
 
+-- NOTE: every row has a version that goes up on each update. The read endpoints
+-- build their ETags from it
+CREATE FUNCTION my_schema.bump_version() RETURNS trigger AS $$
+BEGIN
+    NEW.version := OLD.version + 1;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
 CREATE TABLE my_schema.organization(
     id serial PRIMARY KEY,
-    org_name character varying(100) NOT NULL UNIQUE
+    org_name character varying(100) NOT NULL UNIQUE,
+    version bigint NOT NULL DEFAULT 1
 );
 
 CREATE TABLE my_schema.illu_user(
@@ -18,7 +28,20 @@ CREATE TABLE my_schema.illu_user(
     pw_hash character varying(256) NOT NULL,
     jwt character varying(512),
     org_id bigint,
+    version bigint NOT NULL DEFAULT 1,
     CONSTRAINT fk_org 
         FOREIGN KEY(org_id)
         REFERENCES my_schema.organization(id)
-);
\ No newline at end of file
+);
+
+CREATE TRIGGER organization_version BEFORE UPDATE ON my_schema.organization
+    FOR EACH ROW EXECUTE FUNCTION my_schema.bump_version();
+CREATE TRIGGER illu_user_version BEFORE UPDATE ON my_schema.illu_user
+    FOR EACH ROW EXECUTE FUNCTION my_schema.bump_version();
+
+-- NOTE: get_user filters, and the fk_org check when an organization is deleted.
+-- (org_id, id) also pages an org's members in id order. The phone_prefix, phone
+-- unique index can't serve a phone without its prefix
+CREATE INDEX illu_user_user_name_idx ON my_schema.illu_user(user_name);
+CREATE INDEX illu_user_org_id_id_idx ON my_schema.illu_user(org_id, id);
+CREATE INDEX illu_user_phone_idx ON my_schema.illu_user(phone);
\ No newline at end of file
@@ -0,0 +1,4 @@
+\c illu_db
+
+CREATE INDEX IF NOT EXISTS illu_user_user_name_idx ON my_schema.illu_user(user_name);
+CREATE INDEX IF NOT EXISTS illu_user_org_id_idx ON my_schema.illu_user(org_id);
@@ -0,0 +1,18 @@
+\c illu_db
+
+CREATE OR REPLACE FUNCTION my_schema.bump_version() RETURNS trigger AS $$
+BEGIN
+    NEW.version := OLD.version + 1;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+ALTER TABLE my_schema.organization ADD COLUMN IF NOT EXISTS version bigint NOT NULL DEFAULT 1;
+ALTER TABLE my_schema.illu_user ADD COLUMN IF NOT EXISTS version bigint NOT NULL DEFAULT 1;
+
+DROP TRIGGER IF EXISTS organization_version ON my_schema.organization;
+CREATE TRIGGER organization_version BEFORE UPDATE ON my_schema.organization
+    FOR EACH ROW EXECUTE FUNCTION my_schema.bump_version();
+DROP TRIGGER IF EXISTS illu_user_version ON my_schema.illu_user;
+CREATE TRIGGER illu_user_version BEFORE UPDATE ON my_schema.illu_user
+    FOR EACH ROW EXECUTE FUNCTION my_schema.bump_version();
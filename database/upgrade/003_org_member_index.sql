@@ -0,0 +1,6 @@
+\c illu_db
+
+-- NOTE: pages an org's members in id order straight from the index, and still
+-- serves the fk_org check that illu_user_org_id_idx was for
+CREATE INDEX IF NOT EXISTS illu_user_org_id_id_idx ON my_schema.illu_user(org_id, id);
+DROP INDEX IF EXISTS my_schema.illu_user_org_id_idx;
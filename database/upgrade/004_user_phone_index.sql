@@ -0,0 +1,5 @@
+\c illu_db
+
+-- NOTE: get_user by phone without phone_prefix. The unique index leads with
+-- phone_prefix, so it can only serve that filter by reading the whole index
+CREATE INDEX IF NOT EXISTS illu_user_phone_idx ON my_schema.illu_user(phone);
@@ -0,0 +1,46 @@
+import asyncio
+from typing import Callable, Dict, List, Optional
+
+import httpx
+import pytest
+
+from illu_db_async import close_async_db
+from main import app
+
+
+def get_app(
+    paths: List[str], headers: Optional[Dict[str, str]] = None
+) -> List[httpx.Response]:
+    """
+    sends GET requests to the app in one event loop. The asyncio pool is closed at
+    the end since it can't be shared between event loops
+
+    paths:
+        the paths to get, in order
+
+    headers:
+        request headers sent with every request
+
+    returns:
+        List of the responses, in the order of paths
+    """
+
+    async def send() -> List[httpx.Response]:
+        transport: httpx.ASGITransport = httpx.ASGITransport(app=app)
+        try:
+            async with httpx.AsyncClient(
+                transport=transport, base_url="http://test"
+            ) as client:
+                return [await client.get(path, headers=headers) for path in paths]
+        finally:
+            await close_async_db()
+
+    return asyncio.run(send())
+
+
+@pytest.fixture
+def app_get() -> Callable[..., List[httpx.Response]]:
+    """
+    get_app, for tests that send requests to the app
+    """
+    return get_app
@@ -0,0 +1,200 @@
+import asyncio
+from typing import Any, Awaitable, Dict, List, TypeVar
+
+import asyncpg
+import pytest
+
+import db_org_async
+import db_user_async
+import illu_db
+import illu_db_async
+from illu_db import DbConfig
+from illu_timing import REQUEST_TIMING, RequestTiming
+from illu_db_async import (
+    acquire,
+    async_transaction,
+    close_async_db,
+    init_async_db,
+    init_async_read_db,
+)
+
+T = TypeVar("T")
+
+
+def run(coroutine: Awaitable[T]) -> T:
+    """
+    runs a coroutine on a fresh event loop. The pool is closed at the end since
+    it can't be shared between event loops
+    """
+
+    async def run_and_close() -> T:
+        try:
+            return await coroutine
+        finally:
+            await close_async_db()
+
+    return asyncio.run(run_and_close())
+
+
+def test_create_get_delete_user_async() -> None:
+    """
+    tests the async user helpers end to end
+    """
+
+    async def flow() -> None:
+        try:
+            success: bool
+            user: Dict[str, Any]
+            success, user = await db_user_async.create_user(
+                "+1", "2345678", "test async user", "fakehash"
+            )
+            assert success
+            assert user["phone"] == "2345678"
+            assert user["user_name"] == "test async user"
+
+            success, _ = await db_user_async.create_user(
+                "+1", "2345678", "test async user", "fakehash"
+            )
+            assert not success
+
+            outcome: str
+            success, outcome, user = await db_user_async.upsert_user(
+                "+1", "2345678", "test async user", "fakehash", on_conflict="update"
+            )
+            assert success
+            assert outcome == "updated"
+            assert user["user_name"] == "test async user"
+
+            assert await db_user_async.update_user(
+                "+1", "2345678", user_name="new async name"
+            )
+            users: List[Dict[str, Any]]
+            success, users = await db_user_async.get_user(user_id=user["id"])
+            assert success
+            assert users == [
+                dict(user, user_name="new async name", version=user["version"] + 1)
+            ]
+        finally:
+            await db_user_async.delete_user("+1", "2345678")
+
+        success, users = await db_user_async.get_user(
+            phone_prefix="+1", phone="2345678"
+        )
+        assert success
+        assert users == []
+
+    run(flow())
+
+
+def test_create_delete_org_async() -> None:
+    """
+    tests the async org helpers
+    """
+
+    async def flow() -> None:
+        name: str = "test async org"
+        try:
+            success: bool
+            org: Dict[str, Any]
+            success, org = await db_org_async.create_org(name)
+            assert success
+            assert org["org_name"] == name
+
+            success, _ = await db_org_async.create_org(name)
+            assert not success
+
+            outcome: str
+            success, outcome, _ = await db_org_async.upsert_org(name, "existing")
+            assert success
+            assert outcome == "existing"
+        finally:
+            assert await db_org_async.delete_org(name)
+
+    run(flow())
+
+
+def test_async_read_db_round_robin(monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    tests that async reads alternate between the replicas and primary reads
+    don't. Both replicas are the local database, told apart by their
+    application_name
+    """
+    url: str = DbConfig().url
+    monkeypatch.setenv(
+        "PG_REPLICA_CONNS",
+        f"{url}&application_name=illu_a,{url}&application_name=illu_b",
+    )
+    monkeypatch.setattr(illu_db, "DB_CONFIG", DbConfig())
+    monkeypatch.setattr(illu_db_async, "ASYNC_REPLICAS", None)
+
+    async def flow() -> None:
+        names: List[str] = []
+        for _ in range(4):
+            db: asyncpg.Pool = await init_async_read_db()
+            names.append(
+                await db.fetchval("SELECT current_setting('application_name')")
+            )
+        assert sorted(names) == ["illu_a", "illu_a", "illu_b", "illu_b"]
+        assert names[0] != names[1]
+        assert await init_async_read_db(primary=True) is await init_async_db()
+        assert illu_db_async.get_async_replica_pool_stats()[0]["maxconn"] > 0
+
+    run(flow())
+    assert illu_db_async.ASYNC_REPLICAS is None
+
+
+def test_async_transaction() -> None:
+    """
+    tests that async helpers joined into a transaction see each other's writes
+    and are undone together
+    """
+
+    async def flow() -> None:
+        try:
+            async with async_transaction() as connection:
+                _, org = await db_org_async.create_org(
+                    "test async uow org", connection=connection
+                )
+                await db_user_async.create_user(
+                    "+1",
+                    "5559090",
+                    "test async uow",
+                    "fakehash",
+                    org_id=org["id"],
+                    connection=connection,
+                )
+                _, users = await db_user_async.get_user(
+                    org_id=org["id"], connection=connection
+                )
+                assert len(users) == 1
+                raise RuntimeError("abort")
+        except RuntimeError:
+            pass
+        assert await db_org_async.get_org("test async uow org") == (True, {})
+        assert await db_user_async.get_user(phone_prefix="+1", phone="5559090") == (
+            True,
+            [],
+        )
+        assert illu_db_async.TRANSACTION_CALLBACKS == {}
+
+    run(flow())
+
+
+def test_acquire_times_checkout() -> None:
+    """
+    tests that acquire adds the checkout to db_checkout and that executemany is
+    timed like the other statements
+    """
+
+    async def flow() -> None:
+        timing: RequestTiming = RequestTiming()
+        REQUEST_TIMING.set(timing)
+        pool: asyncpg.Pool = await init_async_db()
+        async with acquire(pool) as connection:
+            async with acquire(connection) as same:
+                assert same is connection
+            await connection.executemany("SELECT $1::int", [(1,), (2,)])
+        assert timing.phases["db_checkout"][0] == 1
+        assert timing.phases["db"][0] >= 1
+
+    run(flow())
@@ -1,6 +1,13 @@
-from typing import Any, Dict
+from typing import Any, Dict, List, Tuple
 
-from db_org import create_org, delete_org
+from db_org import (
+    create_org,
+    delete_org,
+    get_org,
+    get_org_with_members,
+    upsert_org,
+)
+from db_user import create_users, delete_user
 
 
 def test_create_org() -> None:
@@ -40,6 +47,60 @@ def test_create_created_org() -> None:
         delete_org(name)
 
 
+def test_get_org() -> None:
+    """
+    tests getting an org, only its version, and a missing org
+    """
+    name: str = "test get org"
+    try:
+        created: Dict[str, Any]
+        _, created = create_org(name)
+
+        success: bool
+        result: Dict[str, Any]
+        success, result = get_org(name)
+        assert success
+        assert result == created
+
+        success, result = get_org(name, version_only=True)
+        assert success
+        assert result == {"id": created["id"], "version": 1}
+    finally:
+        delete_org(name)
+
+    success, result = get_org(name)
+    assert success
+    assert result == {}
+
+
+def test_upsert_org() -> None:
+    """
+    tests that each on_conflict mode reports what happened to an existing org
+    """
+    name: str = "test upsert org"
+    try:
+        success: bool
+        outcome: str
+        result: Dict[str, Any]
+        success, outcome, result = upsert_org(name, on_conflict="existing")
+        assert success
+        assert outcome == "inserted"
+        created: Dict[str, Any] = result
+
+        success, outcome, result = upsert_org(name)
+        assert success
+        assert outcome == "skipped"
+        assert result == {}
+
+        for on_conflict in ("existing", "update"):
+            success, outcome, result = upsert_org(name, on_conflict=on_conflict)
+            assert success
+            assert outcome == "existing"
+            assert result == created
+    finally:
+        delete_org(name)
+
+
 def test_delete_org() -> None:
     """
     tests deleting an existing org
@@ -69,3 +130,48 @@ def test_delete_deleted_org() -> None:
 
     success = delete_org(name)
     assert success
+
+
+def test_get_org_with_members() -> None:
+    """
+    tests paging through an org's members and an org without members
+    """
+    name: str = "test org members"
+    rows: List[Dict[str, Any]] = [
+        {
+            "phone_prefix": "+1",
+            "phone": f"666{index:04}",
+            "user_name": "member",
+            "pw_hash": "fakehash",
+        }
+        for index in range(3)
+    ]
+    try:
+        created: Dict[str, Any]
+        _, created = create_org(name)
+
+        success: bool
+        result: Dict[str, Any]
+        success, result = get_org_with_members(name)
+        assert success
+        assert result == dict(created, members=[])
+
+        for row in rows:
+            row["org_id"] = created["id"]
+        outcomes: List[Tuple[bool, Dict[str, Any]]]
+        _, outcomes = create_users(rows)
+        users: List[Dict[str, Any]] = [user for _, user in outcomes]
+
+        success, result = get_org_with_members(name, limit=2)
+        assert success
+        assert result["org_name"] == name
+        assert result["members"] == users[:2]
+
+        success, result = get_org_with_members(name, after_id=users[1]["id"], limit=2)
+        assert result["members"] == users[2:]
+    finally:
+        for row in rows:
+            delete_user(row["phone_prefix"], row["phone"])
+        delete_org(name)
+
+    assert get_org_with_members(name) == (True, {})
@@ -1,7 +1,22 @@
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional, Tuple
 
+import pytest
+
+import db_user
+from illu_cache import init_user_cache, TTLCache
 from db_org import create_org, delete_org
-from db_user import create_user, get_user, update_user, delete_user
+from db_user import (
+    bulk_update_users,
+    create_user,
+    create_users,
+    get_user,
+    get_users_by_ids,
+    get_users_by_phones,
+    iter_users,
+    update_user,
+    upsert_user,
+    delete_user,
+)
 
 
 class CommonUserData:
@@ -146,6 +161,172 @@ def test_create_user_org_id() -> None:
         delete_org(org_name)
 
 
+def test_upsert_user() -> None:
+    """
+    tests that each on_conflict mode reports what happened to an existing user
+    """
+    user_data: CommonUserData = CommonUserData("test upsert user")
+
+    try:
+        success: bool
+        outcome: str
+        result: Dict[str, Any]
+        success, outcome, result = upsert_user(
+            user_data.phone_prefix,
+            user_data.phone,
+            user_data.user_name,
+            user_data.pw_hash,
+            on_conflict="update",
+        )
+        assert success
+        assert outcome == "inserted"
+        check_created_user(success, user_data, result)
+        created_user_data: Dict[str, Any] = result
+
+        success, outcome, result = upsert_user(
+            user_data.phone_prefix, user_data.phone, "other name", user_data.pw_hash
+        )
+        assert success
+        assert outcome == "skipped"
+        assert result == {}
+
+        success, outcome, result = upsert_user(
+            user_data.phone_prefix,
+            user_data.phone,
+            "other name",
+            user_data.pw_hash,
+            on_conflict="existing",
+        )
+        assert success
+        assert outcome == "existing"
+        assert result == created_user_data
+
+        # NOTE: the cached user has to be dropped when the upsert updates it
+        get_user(user_id=created_user_data["id"])
+        success, outcome, result = upsert_user(
+            user_data.phone_prefix,
+            user_data.phone,
+            "new name",
+            user_data.pw_hash,
+            on_conflict="update",
+        )
+        assert success
+        assert outcome == "updated"
+        assert result == dict(created_user_data, user_name="new name", version=2)
+        got_user_data: List[Dict[str, Any]]
+        _, got_user_data = get_user(user_id=created_user_data["id"])
+        assert got_user_data == [result]
+    finally:
+        delete_user(user_data.phone_prefix, user_data.phone)
+
+
+def make_bulk_rows(user_name: str, count: int) -> List[Dict[str, Any]]:
+    """
+    makes create_users rows with distinct phone numbers
+
+    user_name:
+        the name shared by all of the users
+    count:
+        the number of rows to make
+    """
+    return [
+        {
+            "phone_prefix": "+1",
+            "phone": f"555{index:04}",
+            "user_name": user_name,
+            "pw_hash": "fakehash",
+        }
+        for index in range(count)
+    ]
+
+
+def check_bulk_created(
+    rows: List[Dict[str, Any]], outcomes: List[Tuple[bool, Dict[str, Any]]]
+) -> None:
+    """
+    Asserts that every row was created and that the outcomes are in input order
+    """
+    assert len(outcomes) == len(rows)
+    for row, (created, user) in zip(rows, outcomes):
+        assert created
+        assert not (user["id"] is None)
+        assert user["phone_prefix"] == row["phone_prefix"]
+        assert user["phone"] == row["phone"]
+        assert user["user_name"] == row["user_name"]
+
+
+def test_create_users() -> None:
+    """
+    tests creating a small batch of users with a multi-row insert
+    """
+    rows: List[Dict[str, Any]] = make_bulk_rows("test create users", 5)
+    rows[2]["jwt"] = "fakejwt"
+
+    try:
+        success: bool
+        outcomes: List[Tuple[bool, Dict[str, Any]]]
+        success, outcomes = create_users(rows)
+        assert success
+        check_bulk_created(rows, outcomes)
+    finally:
+        for row in rows:
+            delete_user(row["phone_prefix"], row["phone"])
+
+
+def test_create_users_conflicts() -> None:
+    """
+    tests that conflicting rows are reported per row without failing the batch
+    """
+    rows: List[Dict[str, Any]] = make_bulk_rows("test create users conflicts", 3)
+    # NOTE: duplicate of a row earlier in the batch
+    rows.append(dict(rows[1]))
+
+    try:
+        success: bool
+        success, _ = create_user(**rows[0])
+        assert success
+
+        outcomes: List[Tuple[bool, Dict[str, Any]]]
+        success, outcomes = create_users(rows)
+        assert success
+        assert [created for created, _ in outcomes] == [False, True, True, False]
+        assert outcomes[0][1] == {}
+        assert outcomes[3][1] == {}
+    finally:
+        for row in rows:
+            delete_user(row["phone_prefix"], row["phone"])
+
+
+def test_create_users_copy(monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    tests loading a batch that is large enough to use COPY
+    """
+    monkeypatch.setattr(db_user, "COPY_THRESHOLD", 4)
+    rows: List[Dict[str, Any]] = make_bulk_rows("test create users\twith copy", 6)
+    rows[0]["jwt"] = "fake\\jwt\n"
+
+    try:
+        success: bool
+        success, _ = create_user(**rows[5])
+        assert success
+
+        outcomes: List[Tuple[bool, Dict[str, Any]]]
+        success, outcomes = create_users(rows)
+        assert success
+        check_bulk_created(rows[:5], outcomes[:5])
+        assert outcomes[5] == (False, {})
+    finally:
+        for row in rows:
+            delete_user(row["phone_prefix"], row["phone"])
+
+
+def test_create_users_empty() -> None:
+    """
+    tests that an empty batch is a successful no op
+    """
+    assert create_users([]) == (True, [])
+
+
 def test_get_user_id() -> None:
     """
     test get user by id
@@ -171,6 +352,271 @@ def test_get_user_id() -> None:
         delete_user(user_data.phone_prefix, user_data.phone)
 
 
+def test_get_user_version_only() -> None:
+    """
+    tests that version_only gets the id and version and skips the cache
+    """
+    user_data: CommonUserData = CommonUserData("test get user version only")
+    init_user_cache().clear()
+
+    try:
+        created_user_data: Dict[str, Any]
+        _, created_user_data = create_user(
+            phone_prefix=user_data.phone_prefix,
+            phone=user_data.phone,
+            user_name=user_data.user_name,
+            pw_hash=user_data.pw_hash,
+        )
+
+        versions: List[Dict[str, Any]]
+        for _ in range(2):
+            success, versions = get_user(
+                user_id=created_user_data["id"], version_only=True
+            )
+            assert success
+            assert versions == [{"id": created_user_data["id"], "version": 1}]
+        assert init_user_cache().stats()["misses"] == 0
+    finally:
+        delete_user(user_data.phone_prefix, user_data.phone)
+
+
+def test_get_user_cached() -> None:
+    """
+    tests that repeated lookups by id and by phone are served from the user cache,
+    with or without a limit
+    """
+    user_data: CommonUserData = CommonUserData("test get user cached")
+    cache: TTLCache = init_user_cache()
+
+    try:
+        created_user_data: Dict[str, Any]
+        _, created_user_data = create_user(
+            phone_prefix=user_data.phone_prefix,
+            phone=user_data.phone,
+            user_name=user_data.user_name,
+            pw_hash=user_data.pw_hash,
+        )
+
+        get_user(user_id=created_user_data["id"])
+        hits: float = cache.stats()["hits"]
+
+        got_user_data: List[Dict[str, Any]]
+        _, got_user_data = get_user(user_id=created_user_data["id"])
+        assert got_user_data == [created_user_data]
+        _, got_user_data = get_user(
+            phone_prefix=user_data.phone_prefix, phone=user_data.phone
+        )
+        assert got_user_data == [created_user_data]
+        # NOTE: GET /user always passes a page size
+        _, got_user_data = get_user(user_id=created_user_data["id"], limit=100)
+        assert got_user_data == [created_user_data]
+        assert cache.stats()["hits"] == hits + 3
+
+        # NOTE: callers mutating the result must not change the cached user
+        got_user_data[0]["user_name"] = "mutated"
+        _, got_user_data = get_user(user_id=created_user_data["id"])
+        assert got_user_data == [created_user_data]
+    finally:
+        delete_user(user_data.phone_prefix, user_data.phone)
+
+    _, got_user_data = get_user(user_id=created_user_data["id"])
+    assert got_user_data == []
+
+
+def test_update_user_phone_invalidates_cache() -> None:
+    """
+    tests that changing the phone number drops the old and new phone entries
+    """
+    user_data: CommonUserData = CommonUserData("test update phone cache")
+    new_phone: str = "0000000"
+
+    try:
+        created_user_data: Dict[str, Any]
+        _, created_user_data = create_user(
+            phone_prefix=user_data.phone_prefix,
+            phone=user_data.phone,
+            user_name=user_data.user_name,
+            pw_hash=user_data.pw_hash,
+        )
+        get_user(phone_prefix=user_data.phone_prefix, phone=user_data.phone)
+        # NOTE: nothing is cached for a phone that doesn't exist yet
+        get_user(phone_prefix=user_data.phone_prefix, phone=new_phone)
+
+        assert update_user(user_data.phone_prefix, user_data.phone, new_phone=new_phone)
+
+        got_user_data: List[Dict[str, Any]]
+        _, got_user_data = get_user(
+            phone_prefix=user_data.phone_prefix, phone=user_data.phone
+        )
+        assert got_user_data == []
+        _, got_user_data = get_user(
+            phone_prefix=user_data.phone_prefix, phone=new_phone
+        )
+        assert got_user_data == [dict(created_user_data, phone=new_phone, version=2)]
+    finally:
+        delete_user(user_data.phone_prefix, user_data.phone)
+        delete_user(user_data.phone_prefix, new_phone)
+
+
+def test_get_user_racing_update_isnt_cached(monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    tests that a user read before an update commits isn't cached after the
+    update invalidated it
+    """
+    user_data: CommonUserData = CommonUserData("test racing update cache")
+    cache: TTLCache = init_user_cache()
+    cache.clear()
+    cache_user = db_user.cache_user
+
+    def update_then_cache(user: Dict[str, Any], guard: Tuple[Any, int]) -> None:
+        # NOTE: the update commits between the reader's SELECT and its fill
+        update_user(user_data.phone_prefix, user_data.phone, user_name="updated")
+        cache_user(user, guard)
+
+    try:
+        created_user_data: Dict[str, Any]
+        _, created_user_data = create_user(
+            phone_prefix=user_data.phone_prefix,
+            phone=user_data.phone,
+            user_name=user_data.user_name,
+            pw_hash=user_data.pw_hash,
+        )
+        monkeypatch.setattr(db_user, "cache_user", update_then_cache)
+        got_user_data: List[Dict[str, Any]]
+        _, got_user_data = get_user(user_id=created_user_data["id"])
+        assert got_user_data[0]["user_name"] == user_data.user_name
+        monkeypatch.undo()
+
+        assert cache.stats()["size"] == 0
+        _, got_user_data = get_user(user_id=created_user_data["id"])
+        assert got_user_data[0]["user_name"] == "updated"
+    finally:
+        delete_user(user_data.phone_prefix, user_data.phone)
+
+
+def test_get_user_pages() -> None:
+    """
+    tests keyset pagination forwards and backwards through an org's users
+    """
+    org_name: str = "test get user pages org"
+    rows: List[Dict[str, Any]] = make_bulk_rows("test get user pages", 5)
+
+    try:
+        org_data: Dict[str, Any]
+        _, org_data = create_org(org_name)
+        for row in rows:
+            row["org_id"] = org_data["id"]
+        outcomes: List[Tuple[bool, Dict[str, Any]]]
+        _, outcomes = create_users(rows)
+        ids: List[int] = sorted(user["id"] for _, user in outcomes)
+
+        pages: List[List[int]] = []
+        after_id: Any = None
+        while True:
+            success: bool
+            page: List[Dict[str, Any]]
+            success, page = get_user(org_id=org_data["id"], after_id=after_id, limit=2)
+            assert success
+            if len(page) == 0:
+                break
+            pages.append([user["id"] for user in page])
+            after_id = page[-1]["id"]
+        assert pages == [ids[0:2], ids[2:4], ids[4:5]]
+
+        _, page = get_user(
+            org_id=org_data["id"], after_id=ids[3], limit=2, descending=True
+        )
+        assert [user["id"] for user in page] == [ids[2], ids[1]]
+    finally:
+        for row in rows:
+            delete_user(row["phone_prefix"], row["phone"])
+        delete_org(org_name)
+
+
+def test_iter_users() -> None:
+    """
+    tests streaming an org's users in fetches smaller than the result
+    """
+    org_name: str = "test iter users org"
+    rows: List[Dict[str, Any]] = make_bulk_rows("test iter users", 5)
+
+    try:
+        org_data: Dict[str, Any]
+        _, org_data = create_org(org_name)
+        for row in rows:
+            row["org_id"] = org_data["id"]
+        outcomes: List[Tuple[bool, Dict[str, Any]]]
+        _, outcomes = create_users(rows)
+
+        streamed: List[Dict[str, Any]] = list(
+            iter_users(org_id=org_data["id"], fetch_size=2)
+        )
+        assert streamed == sorted((user for _, user in outcomes), key=lambda u: u["id"])
+    finally:
+        for row in rows:
+            delete_user(row["phone_prefix"], row["phone"])
+        delete_org(org_name)
+
+
+def test_get_users_by_ids() -> None:
+    """
+    tests a batch lookup by id with missing and repeated ids
+    """
+    rows: List[Dict[str, Any]] = make_bulk_rows("test get users by ids", 3)
+
+    try:
+        outcomes: List[Tuple[bool, Dict[str, Any]]]
+        _, outcomes = create_users(rows)
+        users: List[Dict[str, Any]] = [user for _, user in outcomes]
+        missing_id: int = max(user["id"] for user in users) + 1000
+
+        for _ in range(2):
+            # NOTE: the first pass queries the database, the second hits the cache
+            success: bool
+            found: Dict[int, Any]
+            success, found = get_users_by_ids(
+                [users[0]["id"], missing_id, users[2]["id"], users[0]["id"]]
+            )
+            assert success
+            assert found == {
+                users[0]["id"]: users[0],
+                missing_id: None,
+                users[2]["id"]: users[2],
+            }
+    finally:
+        for row in rows:
+            delete_user(row["phone_prefix"], row["phone"])
+
+
+def test_get_users_by_phones() -> None:
+    """
+    tests a batch lookup by (phone_prefix, phone) with a missing pair
+    """
+    rows: List[Dict[str, Any]] = make_bulk_rows("test get users by phones", 3)
+    init_user_cache().clear()
+
+    try:
+        outcomes: List[Tuple[bool, Dict[str, Any]]]
+        _, outcomes = create_users(rows)
+        users: List[Dict[str, Any]] = [user for _, user in outcomes]
+
+        success: bool
+        found: Dict[Tuple[str, str], Any]
+        success, found = get_users_by_phones(
+            [("+1", users[1]["phone"]), ("+44", users[1]["phone"]), ("+1", "5550002")]
+        )
+        assert success
+        assert found == {
+            ("+1", users[1]["phone"]): users[1],
+            ("+44", users[1]["phone"]): None,
+            ("+1", "5550002"): users[2],
+        }
+        assert init_user_cache().stats()["hits"] == 0
+    finally:
+        for row in rows:
+            delete_user(row["phone_prefix"], row["phone"])
+
+
 def test_update_user_no_fields() -> None:
     user_data: CommonUserData = CommonUserData(
         "test update user function without any arguments"
@@ -224,6 +670,8 @@ def test_update_user_one_field() -> None:
         assert user_updated
 
         expected_user_data: Dict[str, Any] = created_user_data.copy()
+        # NOTE: every update bumps the version
+        expected_user_data["version"] += 1
         expected_user_data["user_name"] = new_user_name
 
         got_user: bool
@@ -268,6 +716,8 @@ def test_update_user_two_fields() -> None:
         assert user_updated
 
         expected_user_data: Dict[str, Any] = created_user_data.copy()
+        # NOTE: every update bumps the version
+        expected_user_data["version"] += 1
         expected_user_data["user_name"] = new_user_name
         expected_user_data["org_id"] = org_data["id"]
 
@@ -306,6 +756,8 @@ def test_update_user_phone() -> None:
         assert user_updated
 
         expected_user_data: Dict[str, Any] = created_user_data.copy()
+        # NOTE: every update bumps the version
+        expected_user_data["version"] += 1
         expected_user_data["phone"] = new_phone
 
         got_user: bool
@@ -348,6 +800,8 @@ def test_update_user_prefix_and_phone() -> None:
         assert user_updated
 
         expected_user_data: Dict[str, Any] = created_user_data.copy()
+        # NOTE: every update bumps the version
+        expected_user_data["version"] += 1
         expected_user_data["phone"] = new_phone
         expected_user_data["phone_prefix"] = new_prefix
 
@@ -406,6 +860,8 @@ def test_update_user_all_args() -> None:
         assert user_updated
 
         expected_user_data: Dict[str, Any] = created_user_data.copy()
+        # NOTE: every update bumps the version
+        expected_user_data["version"] += 1
         expected_user_data["phone"] = new_phone
         expected_user_data["phone_prefix"] = new_prefix
         expected_user_data["user_name"] = new_user_name
@@ -422,6 +878,83 @@ def test_update_user_all_args() -> None:
         delete_org(org_name)
 
 
+def test_bulk_update_users() -> None:
+    """
+    tests that each row of a bulk update changes only its own columns
+    """
+    rows: List[Dict[str, Any]] = make_bulk_rows("test bulk update users", 4)
+
+    try:
+        success: bool
+        outcomes: List[Tuple[bool, Dict[str, Any]]]
+        success, outcomes = create_users(rows)
+        assert success
+        users: List[Dict[str, Any]] = [user for _, user in outcomes]
+        # NOTE: cache the user whose phone changes under its old phone
+        get_user(phone_prefix="+1", phone=rows[1]["phone"])
+
+        updated: List[bool]
+        success, updated = bulk_update_users(
+            [
+                {"phone_prefix": "+1", "phone": rows[0]["phone"], "user_name": "a"},
+                {
+                    "phone_prefix": "+1",
+                    "phone": rows[1]["phone"],
+                    "new_phone": "5559999",
+                },
+                {"phone_prefix": "+1", "phone": rows[2]["phone"]},
+                {"phone_prefix": "+1", "phone": "0000000", "user_name": "b"},
+            ]
+        )
+        assert success
+        assert updated == [True, True, False, False]
+
+        got_users: Dict[int, Optional[Dict[str, Any]]]
+        _, got_users = get_users_by_ids([user["id"] for user in users])
+        assert got_users[users[0]["id"]] == dict(users[0], user_name="a", version=2)
+        assert got_users[users[1]["id"]] == dict(users[1], phone="5559999", version=2)
+        assert got_users[users[2]["id"]] == users[2]
+        assert got_users[users[3]["id"]] == users[3]
+
+        got_user_data: List[Dict[str, Any]]
+        _, got_user_data = get_user(phone_prefix="+1", phone=rows[1]["phone"])
+        assert got_user_data == []
+    finally:
+        for row in rows:
+            delete_user(row["phone_prefix"], row["phone"])
+        delete_user("+1", "5559999")
+
+
+def test_bulk_update_users_duplicates() -> None:
+    """
+    tests that of several rows finding the same user only the applied one is
+    reported as changed
+    """
+    rows: List[Dict[str, Any]] = make_bulk_rows("test bulk update duplicates", 1)
+
+    try:
+        success: bool
+        outcomes: List[Tuple[bool, Dict[str, Any]]]
+        success, outcomes = create_users(rows)
+        assert success
+
+        updated: List[bool]
+        success, updated = bulk_update_users(
+            [
+                {"phone_prefix": "+1", "phone": rows[0]["phone"], "user_name": "a"},
+                {"phone_prefix": "+1", "phone": rows[0]["phone"], "user_name": "b"},
+            ]
+        )
+        assert success
+        assert sorted(updated) == [False, True]
+
+        got_user_data: List[Dict[str, Any]]
+        _, got_user_data = get_user(user_id=outcomes[0][1]["id"], primary=True)
+        assert got_user_data[0]["user_name"] == ["a", "b"][updated.index(True)]
+    finally:
+        delete_user(rows[0]["phone_prefix"], rows[0]["phone"])
+
+
 def test_delete_user() -> None:
     """
     Test deleting a user
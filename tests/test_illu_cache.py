@@ -0,0 +1,85 @@
+import time
+from typing import Dict
+
+from illu_cache import TTLCache
+
+
+def test_ttl_cache_hit_and_miss() -> None:
+    """
+    tests getting a set value and counting hits and misses
+    """
+    cache: TTLCache = TTLCache(maxsize=2, ttl=60)
+    assert cache.get("a") is None
+    cache.set("a", 1)
+    assert cache.get("a") == 1
+
+    stats: Dict[str, float] = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["hit_rate"] == 0.5
+    assert stats["size"] == 1
+
+
+def test_ttl_cache_evicts_least_recently_used() -> None:
+    """
+    tests that the cache stays bounded and evicts the least recently used entry
+    """
+    cache: TTLCache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    # NOTE: touch a so that b is the least recently used
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_ttl_cache_expires() -> None:
+    """
+    tests that entries aren't served after the ttl
+    """
+    cache: TTLCache = TTLCache(maxsize=2, ttl=0.01)
+    cache.set("a", 1)
+    time.sleep(0.02)
+
+    assert cache.get("a") is None
+    assert cache.stats()["expirations"] == 1
+    assert cache.stats()["size"] == 0
+
+
+def test_ttl_cache_delete_and_disabled() -> None:
+    """
+    tests deleting an entry and that a zero size cache never stores anything
+    """
+    cache: TTLCache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.delete("a")
+    cache.delete("missing")
+    assert cache.get("a") is None
+
+    disabled: TTLCache = TTLCache(maxsize=0, ttl=60)
+    disabled.set("a", 1)
+    assert disabled.get("a") is None
+
+
+def test_ttl_cache_guard() -> None:
+    """
+    tests that a set guarded by a generation from before a delete is dropped
+    """
+    cache: TTLCache = TTLCache(maxsize=2, ttl=60)
+    generation: int = cache.generation("a")
+    cache.set("a", 1, ("a", generation))
+    assert cache.get("a") == 1
+
+    generation = cache.generation("a")
+    cache.delete("a")
+    cache.set("a", 1, ("a", generation))
+    cache.set("b", 2, ("a", generation))
+    assert cache.get("a") is None
+    assert cache.get("b") is None
+
+    cache.set("a", 3, ("a", cache.generation("a")))
+    assert cache.get("a") == 3
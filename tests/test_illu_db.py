@@ -0,0 +1,396 @@
+import os
+import threading
+import time
+from typing import Any, Dict, List
+
+import pytest
+from postgres import Postgres
+from psycopg2_pool import PoolError
+
+import illu_db
+from db_org import create_org, delete_org, get_org
+from db_user import create_user, delete_user, get_user, update_user
+from illu_cache import init_user_cache
+from illu_query_stats import get_query_stats, QUERY_STATS
+from illu_db import (
+    DbConfig,
+    IlluConnectionPool,
+    get_pool_stats,
+    init_db,
+    init_read_db,
+    init_replicas,
+    transaction,
+    warm_db,
+)
+
+
+def make_pool(acquire_timeout: float) -> IlluConnectionPool:
+    """
+    makes a two connection pool against the configured database
+    """
+    return IlluConnectionPool(
+        acquire_timeout=acquire_timeout,
+        minconn=2,
+        maxconn=2,
+        idle_timeout=600,
+        dsn=DbConfig().url,
+    )
+
+
+def test_pool_opens_minconn() -> None:
+    """
+    tests that minconn connections are open before anything is checked out
+    """
+    pool: IlluConnectionPool = make_pool(acquire_timeout=0.1)
+    try:
+        stats: Dict[str, float] = pool.stats()
+        assert stats["idle"] == 2
+        assert stats["in_use"] == 0
+        assert stats["maxconn"] == 2
+    finally:
+        pool.clear()
+
+
+def test_pool_exhausted_times_out() -> None:
+    """
+    tests that an exhausted pool waits for acquire_timeout and then raises
+    """
+    pool: IlluConnectionPool = make_pool(acquire_timeout=0.05)
+    try:
+        first: Any = pool.getconn()
+        second: Any = pool.getconn()
+        assert pool.stats()["in_use"] == 2
+
+        start: float = time.perf_counter()
+        with pytest.raises(PoolError):
+            pool.getconn()
+        assert time.perf_counter() - start >= 0.05
+        assert pool.stats()["timeouts"] == 1
+
+        pool.putconn(first)
+        pool.putconn(second)
+    finally:
+        pool.clear()
+
+
+def test_pool_waits_for_returned_connection() -> None:
+    """
+    tests that a waiting thread gets a connection once one is returned
+    and that the wait shows up in the stats
+    """
+    pool: IlluConnectionPool = make_pool(acquire_timeout=5)
+    try:
+        first: Any = pool.getconn()
+        second: Any = pool.getconn()
+
+        returner = threading.Timer(0.05, pool.putconn, args=[first])
+        returner.start()
+        third: Any = pool.getconn()
+        assert third is first
+
+        stats: Dict[str, float] = pool.stats()
+        assert stats["acquires"] == 3
+        assert stats["wait_seconds_max"] >= 0.05
+        assert stats["waiting"] == 0
+
+        pool.putconn(second)
+        pool.putconn(third)
+    finally:
+        pool.clear()
+
+
+def test_warm_db() -> None:
+    """
+    tests that warming opens the requested connections and leaves them idle
+    """
+    assert warm_db(3) == 3
+    stats: Dict[str, float] = get_pool_stats()
+    assert stats["idle"] >= 3
+    assert stats["in_use"] == 0
+
+
+def test_connection_budget(monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    tests that PG_MAX_CONNECTIONS is split between the pools of every worker
+    """
+    monkeypatch.setenv("PG_POOL_MIN", "4")
+    monkeypatch.setenv("PG_POOL_MAX", "10")
+    monkeypatch.setenv("WEB_CONCURRENCY", "4")
+    monkeypatch.setenv("PG_MAX_CONNECTIONS", "24")
+    config: DbConfig = DbConfig()
+    assert config.maxconn == 3
+    assert config.minconn == 3
+
+    monkeypatch.setenv("PG_MAX_CONNECTIONS", "200")
+    config = DbConfig()
+    assert config.maxconn == 10
+    assert config.minconn == 4
+
+    monkeypatch.delenv("PG_MAX_CONNECTIONS")
+    assert DbConfig().max_connections is None
+
+
+def test_fork_opens_own_connections() -> None:
+    """
+    tests that a forked child doesn't use the parent's pool, and that the
+    parent's connection still works after the child exits
+    """
+    db: Postgres = init_db()
+    parent_pid: int = db.one("SELECT pg_backend_pid()")
+
+    read_fd, write_fd = os.pipe()
+    child: int = os.fork()
+    if child == 0:
+        # NOTE: never return into pytest from the child
+        status: int = 1
+        try:
+            os.close(read_fd)
+            assert illu_db.DB is None
+            child_db: Postgres = init_db()
+            assert child_db is not db
+            os.write(write_fd, str(child_db.one("SELECT pg_backend_pid()")).encode())
+            status = 0
+        finally:
+            os._exit(status)
+
+    os.close(write_fd)
+    with os.fdopen(read_fd) as reader:
+        child_pid: str = reader.read()
+    _, status = os.waitpid(child, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
+    assert child_pid.isdigit()
+    assert int(child_pid) != parent_pid
+    assert db.one("SELECT pg_backend_pid()") == parent_pid
+
+
+def use_replicas(
+    monkeypatch: pytest.MonkeyPatch, urls: List[str], selection: str
+) -> List[Postgres]:
+    """
+    points illu_db at the replica urls for the rest of the test. The caller
+    clears the returned pools
+    """
+    monkeypatch.setenv("PG_REPLICA_CONNS", ",".join(urls))
+    monkeypatch.setenv("PG_REPLICA_SELECTION", selection)
+    monkeypatch.setattr(illu_db, "DB_CONFIG", DbConfig())
+    monkeypatch.setattr(illu_db, "REPLICAS", None)
+    return init_replicas()
+
+
+def application_name(db: Postgres) -> str:
+    """
+    the application_name of the connection a read on db gets
+    """
+    return db.one("SELECT current_setting('application_name')")
+
+
+def test_replica_config(monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    tests parsing PG_REPLICA_CONNS and PG_REPLICA_SELECTION
+    """
+    monkeypatch.setenv("PG_REPLICA_CONNS", " postgresql://a , ,postgresql://b")
+    assert DbConfig().replica_urls == ["postgresql://a", "postgresql://b"]
+    assert DbConfig().replica_selection == "round_robin"
+
+    monkeypatch.setenv("PG_REPLICA_SELECTION", "random")
+    with pytest.raises(ValueError):
+        DbConfig()
+
+    monkeypatch.delenv("PG_REPLICA_CONNS")
+    monkeypatch.delenv("PG_REPLICA_SELECTION")
+    assert DbConfig().replica_urls == []
+
+
+def test_read_db_round_robin(monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    tests that reads alternate between the replicas and that primary reads and
+    a tree without replicas use the primary. Both replicas are the local
+    database, told apart by their application_name
+    """
+    assert init_read_db() is init_db()
+
+    url: str = DbConfig().url
+    replicas: List[Postgres] = use_replicas(
+        monkeypatch,
+        [f"{url}&application_name=illu_a", f"{url}&application_name=illu_b"],
+        "round_robin",
+    )
+    try:
+        names: List[str] = [application_name(init_read_db()) for _ in range(4)]
+        assert sorted(names) == ["illu_a", "illu_a", "illu_b", "illu_b"]
+        assert names[0] != names[1]
+        assert init_read_db(primary=True) is init_db()
+    finally:
+        for replica in replicas:
+            replica.pool.clear()
+
+
+def test_read_db_least_busy(monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    tests that reads skip a replica whose connections are checked out
+    """
+    url: str = DbConfig().url
+    replicas: List[Postgres] = use_replicas(
+        monkeypatch,
+        [f"{url}&application_name=illu_a", f"{url}&application_name=illu_b"],
+        "least_busy",
+    )
+    try:
+        busy: Any = replicas[0].pool.getconn()
+        for _ in range(3):
+            assert init_read_db() is replicas[1]
+        replicas[0].pool.putconn(busy)
+    finally:
+        for replica in replicas:
+            replica.pool.clear()
+
+
+@pytest.mark.skipif(
+    "TEST_PG_REPLICA_CONN" not in os.environ,
+    reason="needs a second postgres instance, see the README",
+)
+def test_reads_go_to_replica(monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    tests the routing against a second instance with the same schema. It isn't
+    replicating, so a user written to the primary is only found by primary reads
+    """
+    replicas: List[Postgres] = use_replicas(
+        monkeypatch, [os.environ["TEST_PG_REPLICA_CONN"]], "round_robin"
+    )
+    init_user_cache().clear()
+    try:
+        success: bool
+        success, _ = create_user("+1", "5557070", "test replica user", "fakehash")
+        assert success
+
+        users: List[Dict[str, Any]]
+        success, users = get_user(phone_prefix="+1", phone="5557070")
+        assert success
+        assert users == []
+
+        success, users = get_user(phone_prefix="+1", phone="5557070", primary=True)
+        assert success
+        assert users[0]["user_name"] == "test replica user"
+    finally:
+        delete_user("+1", "5557070")
+        for replica in replicas:
+            replica.pool.clear()
+
+
+def test_replica_reads_skip_cache(monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    tests that users read from a replica aren't cached and that primary reads
+    don't answer from the cache. The replica is the local database
+    """
+    url: str = DbConfig().url
+    replicas: List[Postgres] = use_replicas(
+        monkeypatch, [f"{url}&application_name=illu_a"], "round_robin"
+    )
+    cache_key = ("phone", "+1", "5557171")
+    init_user_cache().clear()
+    try:
+        create_user("+1", "5557171", "test replica cache", "fakehash")
+        users: List[Dict[str, Any]]
+        _, users = get_user(phone_prefix="+1", phone="5557171")
+        assert users[0]["user_name"] == "test replica cache"
+        assert init_user_cache().get(cache_key) is None
+
+        # NOTE: what a replica read could have cached before a later update
+        init_user_cache().set(cache_key, dict(users[0], user_name="stale"))
+        _, users = get_user(phone_prefix="+1", phone="5557171", primary=True)
+        assert users[0]["user_name"] == "test replica cache"
+    finally:
+        delete_user("+1", "5557171")
+        for replica in replicas:
+            replica.pool.clear()
+
+
+@pytest.mark.skipif(
+    "TEST_PG_REPLICA_CONN" not in os.environ,
+    reason="needs a second postgres instance, see the README",
+)
+def test_primary_read_after_lagging_replica(monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    tests read-your-writes against a second instance holding the user as it was
+    before an update, like a replica that hasn't applied the update yet
+    """
+    replica_url: str = os.environ["TEST_PG_REPLICA_CONN"]
+    replicas: List[Postgres] = use_replicas(monkeypatch, [replica_url], "round_robin")
+    init_user_cache().clear()
+    try:
+        create_user("+1", "5557272", "old name", "fakehash")
+        _, users = get_user(phone_prefix="+1", phone="5557272", primary=True)
+        replicas[0].run(
+            "INSERT INTO my_schema.illu_user(phone_prefix, phone, user_name, pw_hash) "
+            "VALUES ('+1', '5557272', 'old name', 'fakehash')"
+        )
+
+        assert update_user("+1", "5557272", user_name="new name")
+        _, users = get_user(phone_prefix="+1", phone="5557272")
+        assert users[0]["user_name"] == "old name"
+
+        _, users = get_user(phone_prefix="+1", phone="5557272", primary=True)
+        assert users[0]["user_name"] == "new name"
+    finally:
+        delete_user("+1", "5557272")
+        replicas[0].run(
+            "DELETE FROM my_schema.illu_user WHERE phone_prefix='+1' AND phone='5557272'"
+        )
+        for replica in replicas:
+            replica.pool.clear()
+
+
+def test_transaction_commits_once() -> None:
+    """
+    tests that helpers joined into a transaction share one checkout, see each
+    other's writes, and commit together
+    """
+    QUERY_STATS.clear()
+    try:
+        with transaction() as cursor:
+            _, org = create_org("test uow org", cursor=cursor)
+            create_user("+1", "5558080", "test uow user", "fakehash", cursor=cursor)
+            assert update_user("+1", "5558080", org_id=org["id"], cursor=cursor)
+            _, users = get_user(phone_prefix="+1", phone="5558080", cursor=cursor)
+            assert users[0]["org_id"] == org["id"]
+        assert get_query_stats()["checkout"]["pool"]["count"] == 1
+
+        _, users = get_user(phone_prefix="+1", phone="5558080")
+        assert users[0]["org_id"] == org["id"]
+    finally:
+        delete_user("+1", "5558080")
+        delete_org("test uow org")
+
+
+def test_transaction_rolls_back() -> None:
+    """
+    tests that an exception undoes every helper of the transaction
+    """
+    with pytest.raises(RuntimeError):
+        with transaction() as cursor:
+            create_org("test uow rollback", cursor=cursor)
+            raise RuntimeError("abort")
+    assert get_org("test uow rollback", primary=True) == (True, {})
+
+
+def test_transaction_invalidates_after_commit() -> None:
+    """
+    tests that a cached user is only dropped from the user cache once the
+    transaction that changed it commits
+    """
+    init_user_cache().clear()
+    try:
+        create_user("+1", "5558181", "test uow cache", "fakehash")
+        _, users = get_user(phone_prefix="+1", phone="5558181")
+        cache_key = ("phone", "+1", "5558181")
+        assert init_user_cache().get(cache_key) is not None
+
+        with transaction() as cursor:
+            update_user("+1", "5558181", user_name="renamed", cursor=cursor)
+            assert init_user_cache().get(cache_key) is not None
+        assert init_user_cache().get(cache_key) is None
+
+        _, users = get_user(phone_prefix="+1", phone="5558181")
+        assert users[0]["user_name"] == "renamed"
+    finally:
+        delete_user("+1", "5558181")
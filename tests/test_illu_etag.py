@@ -0,0 +1,94 @@
+from typing import Any, Callable, Dict, List
+
+import httpx
+
+from db_org import create_org, delete_org
+from db_user import create_user, delete_user, update_user
+from illu_cache import init_user_cache
+from illu_etag import etag_matches, make_etag
+
+
+def test_make_etag() -> None:
+    """
+    tests that the ETag ignores row order and other columns but not versions
+    """
+    rows: List[Dict[str, Any]] = [
+        {"id": 1, "version": 1, "user_name": "a"},
+        {"id": 2, "version": 5, "user_name": "b"},
+    ]
+    etag: str = make_etag(rows)
+    assert etag.startswith('W/"')
+    assert make_etag([{"id": 2, "version": 5}, {"id": 1, "version": 1}]) == etag
+    assert make_etag([{"id": 1, "version": 2}, {"id": 2, "version": 5}]) != etag
+    assert make_etag(rows[:1]) != etag
+
+
+def test_etag_matches() -> None:
+    """
+    tests the weak comparison of If-None-Match
+    """
+    etag: str = 'W/"abc"'
+    assert etag_matches('W/"abc"', etag)
+    assert etag_matches('"abc"', etag)
+    assert etag_matches('"xyz", W/"abc"', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches('W/"xyz"', etag)
+    assert not etag_matches(None, etag)
+
+
+def test_get_user_not_modified(app_get: Callable[..., List[httpx.Response]]) -> None:
+    """
+    tests that a current ETag gets a 304 without a body, that an update
+    changes the ETag and that "*" doesn't match a filter without users
+    """
+    init_user_cache().clear()
+    try:
+        create_user("+1", "5553131", "test etag user", "fakehash")
+        path: str = "/user?user_name=test etag user"
+
+        response: httpx.Response = app_get([path])[0]
+        assert response.status_code == 200
+        etag: str = response.headers["etag"]
+
+        response = app_get([path], {"If-None-Match": etag})[0]
+        assert response.status_code == 304
+        assert response.headers["etag"] == etag
+        assert response.content == b""
+        assert app_get([path], {"If-None-Match": "*"})[0].status_code == 304
+
+        update_user("+1", "5553131", jwt="new jwt")
+        response = app_get([path], {"If-None-Match": etag})[0]
+        assert response.status_code == 200
+        assert response.headers["etag"] != etag
+        assert len(response.json()) == 1
+    finally:
+        delete_user("+1", "5553131")
+
+    response = app_get([path], {"If-None-Match": "*"})[0]
+    assert response.status_code == 200
+    assert response.json() == []
+
+
+def test_get_org_not_modified(app_get: Callable[..., List[httpx.Response]]) -> None:
+    """
+    tests the org ETag and that a missing org is a 404 with or without one
+    """
+    try:
+        create_org("test etag org")
+
+        response: httpx.Response = app_get(["/org/test etag org"])[0]
+        assert response.status_code == 200
+        assert response.json()["org_name"] == "test etag org"
+        etag: str = response.headers["etag"]
+
+        assert (
+            app_get(["/org/test etag org"], {"If-None-Match": etag})[0].status_code
+            == 304
+        )
+    finally:
+        delete_org("test etag org")
+
+    assert app_get(["/org/test etag org"])[0].status_code == 404
+    assert (
+        app_get(["/org/test etag org"], {"If-None-Match": etag})[0].status_code == 404
+    )
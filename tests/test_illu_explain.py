@@ -0,0 +1,114 @@
+from typing import Any, Dict, List
+
+from postgres import Postgres
+
+from db_user import create_users
+from illu_db import init_db
+from illu_explain import (
+    explain_shape,
+    find_full_scans,
+    get_leading_columns,
+    PlanReport,
+    query_shapes,
+)
+
+
+def test_find_full_scans() -> None:
+    """
+    tests that only scans without an index condition are reported
+    """
+    plan: Dict[str, Any] = {
+        "Node Type": "Nested Loop",
+        "Plans": [
+            {"Node Type": "Seq Scan", "Relation Name": "organization"},
+            {
+                "Node Type": "Index Scan",
+                "Relation Name": "illu_user",
+                "Index Cond": "(org_id = organization.id)",
+            },
+            {"Node Type": "Index Only Scan", "Relation Name": "illu_user"},
+        ],
+    }
+    assert find_full_scans(plan) == [
+        "Seq Scan on organization",
+        "Index Only Scan on illu_user",
+    ]
+
+
+def test_find_full_scans_leading_column() -> None:
+    """
+    tests that an index condition without the index's leading column is reported
+    """
+    leading_columns: Dict[str, str] = {
+        "illu_user_phone_prefix_phone_key": "phone_prefix",
+        "illu_user_pkey": "id",
+    }
+    plan: Dict[str, Any] = {
+        "Node Type": "Nested Loop",
+        "Plans": [
+            {
+                "Node Type": "Index Scan",
+                "Relation Name": "illu_user",
+                "Index Name": "illu_user_phone_prefix_phone_key",
+                "Index Cond": "((phone)::text = '5550001'::text)",
+            },
+            {
+                "Node Type": "Index Scan",
+                "Relation Name": "illu_user",
+                "Index Name": "illu_user_phone_prefix_phone_key",
+                "Index Cond": "(((phone_prefix)::text = '+1'::text) AND "
+                "((phone)::text = '5550001'::text))",
+            },
+            {
+                "Node Type": "Bitmap Index Scan",
+                "Index Name": "illu_user_pkey",
+                "Index Cond": "(org_id = organization.id)",
+            },
+            {
+                "Node Type": "Index Scan",
+                "Relation Name": "illu_user",
+                "Index Name": "illu_user_pkey",
+                "Index Cond": "(id = ANY ('{1,2}'::integer[]))",
+            },
+        ],
+    }
+    assert find_full_scans(plan, leading_columns) == [
+        "Index Scan on illu_user using illu_user_phone_prefix_phone_key",
+        "Bitmap Index Scan on illu_user_pkey using illu_user_pkey",
+    ]
+    assert find_full_scans(plan) == []
+
+
+def test_query_shapes_use_indexes() -> None:
+    """
+    tests that every query shape with a filter can be answered from an index
+    """
+    db: Postgres = init_db()
+    rows: List[Dict[str, Any]] = [
+        {
+            "phone_prefix": "+997",
+            "phone": f"{index:06}",
+            "user_name": f"test explain {index % 100}",
+            "pw_hash": "fakehash",
+        }
+        for index in range(2000)
+    ]
+    try:
+        success: bool
+        success, _ = create_users(rows)
+        assert success
+        db.run("ANALYZE my_schema.illu_user")
+
+        reports: List[PlanReport] = []
+        with db.get_cursor() as cursor:
+            # NOTE: the tables are small enough that scanning them is cheaper, so
+            # make the planner use any index that fits
+            cursor.run("SET LOCAL enable_seqscan = off")
+            leading_columns: Dict[str, str] = get_leading_columns(cursor)
+            for shape in query_shapes():
+                reports.append(explain_shape(cursor, shape, leading_columns))
+        assert [item.shape.name for item in reports if item.full_scans] == [
+            "get_user all"
+        ]
+    finally:
+        db.run("DELETE FROM my_schema.illu_user WHERE phone_prefix='+997'")
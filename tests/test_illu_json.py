@@ -0,0 +1,24 @@
+from typing import Any, Dict, List
+
+from starlette.responses import JSONResponse
+
+from illu_json import dumps, FastJSONResponse
+
+
+def test_dumps_matches_json_response() -> None:
+    """
+    tests that the fast path renders the same bytes as starlette's JSONResponse
+    """
+    rows: List[Dict[str, Any]] = [
+        {"id": 1, "user_name": "Žofia 🚀", "org_id": None, "score": 0.5},
+        {"id": 2, "user_name": 'quote " and \\ slash', "org_id": 3, "ok": True},
+    ]
+    assert dumps(rows) == JSONResponse(rows).body
+    assert FastJSONResponse(rows).body == JSONResponse(rows).body
+
+
+def test_dumps_int_keys() -> None:
+    """
+    tests that int keys become strings like they do with the json module
+    """
+    assert dumps({7: ["87", "91"]}) == b'{"7":["87","91"]}'
@@ -0,0 +1,70 @@
+import asyncio
+from typing import Callable, Dict, List
+
+import httpx
+
+import db_user_async
+from illu_db_async import close_async_db
+from illu_metrics import format_labels, REQUEST_METRICS
+from illu_query_stats import get_query_stats, QUERY_STATS
+
+
+def test_format_labels() -> None:
+    """
+    tests that label values are escaped
+    """
+    assert format_labels({}) == ""
+    assert (
+        format_labels({"shape": 'a "b"\n\\c', "route": "/"})
+        == '{shape="a \\"b\\"\\n\\\\c",route="/"}'
+    )
+
+
+def test_metrics_endpoint(app_get: Callable[..., List[httpx.Response]]) -> None:
+    """
+    tests that requests are counted by route template and status
+    """
+    REQUEST_METRICS.clear()
+    response: httpx.Response = app_get(
+        ["/info/first", "/info/second", "/no/such/route", "/metrics"]
+    )[-1]
+    assert response.headers["content-type"].startswith("text/plain")
+    lines: List[str] = response.text.splitlines()
+
+    assert "illu_http_requests_in_flight 1" in lines
+    assert (
+        'illu_http_request_duration_seconds_count{method="GET",route="/info/{name}",'
+        'status="200"} 2' in lines
+    )
+    assert (
+        'illu_http_request_duration_seconds_bucket{method="GET",route="/info/{name}",'
+        'status="200",le="+Inf"} 2' in lines
+    )
+    assert (
+        'illu_http_request_duration_seconds_count{method="GET",route="unmatched",'
+        'status="404"} 1' in lines
+    )
+    assert "# TYPE illu_db_queries_total counter" in lines
+    assert any(
+        line.startswith('illu_db_pool_connections{pool="sync"') for line in lines
+    )
+
+
+def test_async_queries_are_counted() -> None:
+    """
+    tests that statements of the asyncio pool are counted by shape too
+    """
+
+    async def query() -> None:
+        try:
+            await db_user_async.get_user(user_name="test async query stats")
+        finally:
+            await close_async_db()
+
+    QUERY_STATS.clear()
+    asyncio.run(query())
+
+    queries: Dict[str, Dict[str, float]] = get_query_stats()["queries"]
+    assert [
+        stats["count"] for shape, stats in queries.items() if "user_name=$1" in shape
+    ] == [1]
@@ -0,0 +1,115 @@
+from typing import Any, Dict, List, Set
+
+import pytest
+from postgres import Postgres
+
+import illu_db
+from db_org import create_org, delete_org
+from db_user import create_user, delete_user, get_user
+from illu_db import init_db
+import illu_prepared
+from illu_prepared import PreparedStatement, prepared_names, prepared_sql
+
+
+def server_prepared_names() -> Set[str]:
+    """
+    the statements postgres has prepared on the most recently used pooled connection
+    """
+    db: Postgres = init_db()
+    # NOTE: the pool is last in first out so this is the connection the helpers used
+    with db.get_cursor() as cursor:
+        names: List[str] = cursor.all("SELECT name FROM pg_prepared_statements")
+        assert set(names) == prepared_names(cursor.connection)
+    return set(names)
+
+
+def test_prepared_statement_numbers_params() -> None:
+    """
+    Test that pyformat placeholders become positional parameters
+    """
+    statement: PreparedStatement = PreparedStatement(
+        "illu_test", "SELECT %(a)s, %(b)s WHERE x=%(a)s"
+    )
+    assert statement.prepare_sql == "PREPARE illu_test AS SELECT $1, $2 WHERE x=$1"
+    assert statement.execute_sql == "EXECUTE illu_test(%(a)s, %(b)s)"
+
+
+def test_prepared_statement_no_params() -> None:
+    """
+    Test a statement without parameters
+    """
+    statement: PreparedStatement = PreparedStatement("illu_test", "SELECT 1")
+    assert statement.prepare_sql == "PREPARE illu_test AS SELECT 1"
+    assert statement.execute_sql == "EXECUTE illu_test"
+
+
+def test_prepared_name_reused(monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    Test that reusing a statement name for other sql fails instead of running the
+    first statement
+    """
+    monkeypatch.setattr(illu_db, "PREPARED_STATEMENTS", True)
+    monkeypatch.setitem(
+        illu_prepared.STATEMENTS,
+        "illu_test",
+        PreparedStatement("illu_test", "SELECT 1"),
+    )
+    with pytest.raises(ValueError):
+        prepared_sql(None, "illu_test", "SELECT 2")
+
+
+def test_prepared_helpers(monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    Test that the helpers prepare their statements once per connection
+    """
+    init_db()
+    monkeypatch.setattr(illu_db, "PREPARED_STATEMENTS", True)
+    name: str = "test prepared org"
+    try:
+        success: bool
+        org_data: Dict[str, Any]
+        success, org_data = create_org(name)
+        assert success
+        success, org_data = create_org(name)
+        assert not success
+
+        success, user_data = create_user("+1", "7654321", "prepared user", "fakehash")
+        assert success
+        for _ in range(2):
+            users: List[Dict[str, Any]]
+            success, users = get_user(user_id=user_data["id"])
+            assert success
+            assert users == [user_data]
+
+        assert delete_user("+1", "7654321")
+        assert delete_org(name)
+        assert {
+            "illu_upsert_org_nothing",
+            "illu_get_user_id",
+            "illu_delete_user",
+            "illu_delete_org",
+        } <= server_prepared_names()
+    finally:
+        delete_user("+1", "7654321")
+        delete_org(name)
+
+
+def test_prepared_after_reconnect(monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    Test that statements are prepared again on a fresh connection
+    """
+    db: Postgres = init_db()
+    monkeypatch.setattr(illu_db, "PREPARED_STATEMENTS", True)
+    name: str = "test prepared reconnect org"
+    try:
+        assert create_org(name)[0]
+        assert delete_org(name)
+
+        # NOTE: closes the pooled connections, the next checkout reconnects
+        db.pool.clear()
+        assert server_prepared_names() == set()
+
+        assert create_org(name)[0]
+        assert "illu_upsert_org_nothing" in server_prepared_names()
+    finally:
+        delete_org(name)
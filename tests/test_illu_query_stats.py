@@ -0,0 +1,124 @@
+import json
+import logging
+import threading
+from typing import Any, Dict, List
+
+import pytest
+from postgres import Postgres
+
+import illu_query_stats
+from db_user import SELECT_USER
+from illu_db import init_db
+from illu_query_stats import get_query_stats, normalize_sql, QueryStats, QUERY_STATS
+from make_sql import make_insert_many_sql
+
+
+def test_normalize_sql() -> None:
+    """
+    tests that every multi-row batch size of a statement has the same shape
+    """
+    shapes: List[str] = []
+    for count in (2, 5):
+        sql: str = make_insert_many_sql(
+            {}, "my_schema.table", ["a", "b"], [{"a": 1}] * count
+        )
+        shapes.append(normalize_sql(sql))
+    assert shapes[0] == shapes[1]
+    assert shapes[0] == (
+        "INSERT INTO my_schema.table(a, b) VALUES(%(a_N)s, %(b_N)s), ..."
+    )
+    assert normalize_sql("SELECT 1\r\n    FROM t ") == "SELECT 1 FROM t"
+
+
+def test_normalize_sql_skips_cache_for_long_statements() -> None:
+    """
+    tests that large batches are normalized without being kept in the cache
+    """
+    illu_query_stats.SHAPE_CACHE.clear()
+    sql: str = make_insert_many_sql(
+        {}, "my_schema.table", ["a", "b"], [{"a": 1}] * 1000
+    )
+    assert len(sql) > illu_query_stats.SHAPE_CACHE_MAX_SQL
+    assert normalize_sql(sql).endswith("VALUES(%(a_N)s, %(b_N)s), ...")
+    assert len(illu_query_stats.SHAPE_CACHE) == 0
+
+    normalize_sql("SELECT 1")
+    assert len(illu_query_stats.SHAPE_CACHE) == 1
+
+
+def test_query_stats_threads() -> None:
+    """
+    tests that the counters of several threads are summed when they are read
+    """
+    stats: QueryStats = QueryStats()
+
+    def work() -> None:
+        for _ in range(100):
+            stats.record_query("SELECT 1", 0.001, False)
+        stats.record_query("SELECT 1", 0.5, True)
+        stats.record_checkout(0.25)
+
+    threads: List[threading.Thread] = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    snapshot: Dict[str, Dict[str, Dict[str, float]]] = stats.snapshot()
+    query: Dict[str, float] = snapshot["queries"]["SELECT 1"]
+    assert query["count"] == 404
+    assert query["errors"] == 4
+    assert query["seconds_total"] == pytest.approx(2.4)
+    assert query["seconds_max"] == 0.5
+    assert snapshot["checkout"]["pool"]["count"] == 4
+
+    stats.clear()
+    assert stats.snapshot()["queries"] == {}
+
+
+def test_cursor_records_statements() -> None:
+    """
+    tests that statements run through init_db's cursors are counted by shape
+    """
+    db: Postgres = init_db()
+    QUERY_STATS.clear()
+    for user_name in ("test query stats", "test query stats 2"):
+        with db.get_cursor() as cursor:
+            cursor.all(
+                SELECT_USER + "WHERE user_name=%(user_name)s",
+                user_name=user_name,
+                back_as=dict,
+            )
+
+    snapshot: Dict[str, Dict[str, Dict[str, float]]] = get_query_stats()
+    counts: Dict[str, float] = {
+        shape: stats["count"] for shape, stats in snapshot["queries"].items()
+    }
+    assert counts == {
+        "SELECT id, phone_prefix, phone, user_name, org_id, version "
+        "FROM my_schema.illu_user "
+        "WHERE user_name=%(user_name)s": 2
+    }
+    assert snapshot["checkout"]["pool"]["count"] >= 2
+
+
+def test_slow_query_log(
+    monkeypatch: pytest.MonkeyPatch, caplog: pytest.LogCaptureFixture
+) -> None:
+    """
+    tests that statements over the threshold are logged with their param keys
+    but without their values
+    """
+    db: Postgres = init_db()
+    monkeypatch.setattr(illu_query_stats, "SLOW_QUERY_MS", 0)
+    with caplog.at_level(logging.WARNING, logger="illu_db.slow_query"):
+        with db.get_cursor() as cursor:
+            cursor.one("SELECT %(secret)s::text", secret="hunter2", back_as=dict)
+
+    assert len(caplog.records) == 1
+    assert "hunter2" not in caplog.records[0].getMessage()
+    entry: Dict[str, Any] = json.loads(caplog.records[0].getMessage())
+    assert entry["event"] == "slow_query"
+    assert entry["shape"] == "SELECT %(secret)s::text"
+    assert entry["param_keys"] == ["secret"]
+    assert not entry["failed"]
@@ -0,0 +1,46 @@
+import os
+from typing import Any, Dict, List, Set
+
+from illu_config import load_env
+from illu_startup import ImportTime, parse_import_times, profile_imports, time_startup
+
+
+def test_parse_import_times() -> None:
+    """
+    tests reading the self time, cumulative time and depth of each import
+    """
+    imports: List[ImportTime] = parse_import_times(
+        "import time: self [us] | cumulative | imported package\n"
+        "import time:       120 |        120 |     fastapi.types\n"
+        "import time:       434 |     231909 |   fastapi\n"
+        "import time:     10096 |     334441 | main\n"
+    )
+    assert [(item.module, item.depth) for item in imports] == [
+        ("fastapi.types", 2),
+        ("fastapi", 1),
+        ("main", 0),
+    ]
+    assert imports[1].self_us == 434
+    assert imports[1].cumulative_us == 231909
+
+
+def test_import_skips_db_drivers() -> None:
+    """
+    tests that importing the app leaves the db drivers to the startup event
+    """
+    modules: Set[str] = {item.module for item in profile_imports("main")}
+    assert "main" in modules
+    assert modules.isdisjoint({"asyncpg", "psycopg2", "postgres"})
+
+
+def test_startup_budget() -> None:
+    """
+    tests that a cold start, from importing the app to answering its first db
+    request, fits in STARTUP_BUDGET_MS
+    """
+    load_env()
+    budget_ms: float = float(os.environ.get("STARTUP_BUDGET_MS", "1000"))
+
+    timings: Dict[str, Any] = time_startup()
+    assert timings["status"] == 200
+    assert timings["total_ms"] <= budget_ms, timings
@@ -0,0 +1,87 @@
+import json
+import logging
+from typing import Any, Callable, Dict, List
+
+import httpx
+import pytest
+
+import illu_timing
+from illu_timing import RequestTiming
+
+
+def parse_server_timing(header: str) -> Dict[str, str]:
+    """
+    returns:
+        Dictionary of every metric name and the rest of its entry
+    """
+    metrics: Dict[str, str] = {}
+    for entry in header.split(", "):
+        name, _, params = entry.partition(";")
+        metrics[name] = params
+    return metrics
+
+
+def test_request_timing_header() -> None:
+    """
+    tests that phases are summed and listed in order, ending with the total
+    """
+    timing: RequestTiming = RequestTiming()
+    timing.add("db", 0.001)
+    timing.add("db", 0.002)
+    timing.add("validation", 0.0005)
+
+    header: str = timing.header()
+    assert list(parse_server_timing(header)) == ["validation", "db", "total"]
+    assert 'db;dur=3.000;desc="2 statements"' in header
+
+
+def test_server_timing(app_get: Callable[..., List[httpx.Response]]) -> None:
+    """
+    tests that db time of the async helpers is reported, and that a request
+    rejected by validation only reports validation
+    """
+    responses: List[httpx.Response] = app_get(
+        ["/user?user_name=test server timing", "/info?limit=many"]
+    )
+
+    assert responses[0].status_code == 200
+    metrics: Dict[str, str] = parse_server_timing(responses[0].headers["server-timing"])
+    assert list(metrics) == [
+        "validation",
+        "app",
+        "db_checkout",
+        "db",
+        "serialization",
+        "total",
+    ]
+
+    assert responses[1].status_code == 422
+    metrics = parse_server_timing(responses[1].headers["server-timing"])
+    assert list(metrics) == ["validation", "total"]
+
+
+def test_access_log_sampling(
+    app_get: Callable[..., List[httpx.Response]],
+    caplog: pytest.LogCaptureFixture,
+    monkeypatch: Any,
+) -> None:
+    """
+    tests that every request is logged at sample rate 1 and none at 0
+    """
+    caplog.set_level(logging.INFO, logger="illu_access")
+
+    monkeypatch.setattr(illu_timing, "ACCESS_LOG_SAMPLE_RATE", 0.0)
+    app_get(["/"])
+    assert caplog.records == []
+
+    monkeypatch.setattr(illu_timing, "ACCESS_LOG_SAMPLE_RATE", 1.0)
+    app_get(["/user?user_name=test access log", "/info/{x}?phone=5550001"])
+    entries: List[Dict[str, Any]] = [
+        json.loads(record.getMessage()) for record in caplog.records
+    ]
+    assert [(entry["path"], entry["status"]) for entry in entries] == [
+        ("/user", 200),
+        ("/info/{x}", 200),
+    ]
+    assert entries[0]["statements"] >= 1
+    assert set(entries[0]["phases_ms"]) >= {"validation", "app", "db"}
@@ -0,0 +1,109 @@
+import json
+from typing import Any, Callable, Dict, List, Tuple
+
+import httpx
+
+from db_org import create_org, delete_org
+from db_user import create_users, delete_user
+from main import ndjson_users
+
+
+def test_ndjson_users() -> None:
+    """
+    tests that an org's users are exported one json object per line in chunks
+    """
+    org_name: str = "test export org"
+    rows: List[Dict[str, Any]] = [
+        {"phone_prefix": "+1", "phone": f"444{index:04}", "user_name": "export"}
+        for index in range(5)
+    ]
+
+    try:
+        org_data: Dict[str, Any]
+        _, org_data = create_org(org_name)
+        for row in rows:
+            row["pw_hash"] = "fakehash"
+            row["org_id"] = org_data["id"]
+        outcomes: List[Tuple[bool, Dict[str, Any]]]
+        _, outcomes = create_users(rows)
+
+        chunks: List[str] = list(ndjson_users(org_data["id"], chunk_size=2))
+        assert [chunk.count("\n") for chunk in chunks] == [2, 2, 1]
+
+        exported: List[Dict[str, Any]] = [
+            json.loads(line) for line in "".join(chunks).splitlines()
+        ]
+        assert exported == [user for _, user in outcomes]
+    finally:
+        for row in rows:
+            delete_user(row["phone_prefix"], row["phone"])
+        delete_org(org_name)
+
+
+def test_get_org_members(app_get: Callable[..., List[httpx.Response]]) -> None:
+    """
+    tests that the members route pages through an org's members with the
+    Org and User models
+    """
+    org_name: str = "test members org"
+    rows: List[Dict[str, Any]] = [
+        {"phone_prefix": "+1", "phone": f"777{index:04}", "user_name": "member"}
+        for index in range(3)
+    ]
+
+    try:
+        org_data: Dict[str, Any]
+        _, org_data = create_org(org_name)
+        for row in rows:
+            row["pw_hash"] = "fakehash"
+            row["org_id"] = org_data["id"]
+        outcomes: List[Tuple[bool, Dict[str, Any]]]
+        _, outcomes = create_users(rows)
+        users: List[Dict[str, Any]] = [user for _, user in outcomes]
+
+        response: httpx.Response = app_get([f"/org/{org_name}/members?limit=2"])[0]
+        assert response.status_code == 200
+        page: Dict[str, Any] = response.json()
+        assert page == {
+            "id": org_data["id"],
+            "org_name": org_name,
+            "members": users[:2],
+            "next_after_id": users[1]["id"],
+        }
+
+        response = app_get(
+            [f"/org/{org_name}/members?limit=2&after_id={users[1]['id']}"]
+        )[0]
+        page = response.json()
+        assert page["members"] == users[2:]
+        assert page["next_after_id"] is None
+
+        assert app_get([f"/org/{org_name}/members?limit=0"])[0].status_code == 422
+    finally:
+        for row in rows:
+            delete_user(row["phone_prefix"], row["phone"])
+        delete_org(org_name)
+
+    assert app_get([f"/org/{org_name}/members"])[0].status_code == 404
+
+
+def test_get_user_rejects_bad_limit(
+    app_get: Callable[..., List[httpx.Response]],
+) -> None:
+    """
+    tests that a limit below 1 or above 1000 is a 422 instead of reaching postgres
+    """
+    assert app_get(["/user?limit=-1"])[0].status_code == 422
+    assert app_get(["/user?limit=0"])[0].status_code == 422
+    assert app_get(["/user?limit=1001"])[0].status_code == 422
+    assert app_get(["/user?user_name=test bad limit&limit=1"])[0].status_code == 200
+
+
+def test_export_users_rejects_bad_chunk_size(
+    app_get: Callable[..., List[httpx.Response]],
+) -> None:
+    """
+    tests that a chunk_size below 1 is a 422 instead of an empty export
+    """
+    assert app_get(["/user/export?chunk_size=0"])[0].status_code == 422
+    assert app_get(["/user/export?chunk_size=-5"])[0].status_code == 422
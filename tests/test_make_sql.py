@@ -1,6 +1,19 @@
-from typing import Any, Dict, List
-
-from make_sql import make_where_sql_col, make_where_sql, make_update_sql, SqlParam
+from typing import Any, Dict, List, Tuple
+
+from make_sql import (
+    make_where_sql_col,
+    make_where_sql,
+    make_update_sql,
+    make_insert_sql,
+    make_insert_many_sql,
+    make_upsert_sql,
+    make_bulk_update_sql,
+    make_copy_text,
+    make_numbered_args,
+    SqlCache,
+    SqlParam,
+    SQL_CACHE,
+)
 
 
 def test_make_where_sql_col_empty_and() -> None:
@@ -273,3 +286,319 @@ def test_make_update_sql_where_mixed_nones() -> None:
         == "UPDATE my_schema.table SET column1=%(column1)s, column2=%(column2)s WHERE column2=%(old_column2)s"
     )
     assert param_dict == {"column1": "value", "column2": 55, "old_column2": 56}
+
+
+def test_make_insert_sql_empty() -> None:
+    """
+    Test make_insert_sql with no columns to insert
+    """
+    param_dict: Dict[str, Any] = {}
+
+    result: str = make_insert_sql(param_dict, "my_schema.table", [], ["id"])
+    assert result == ""
+    assert param_dict == {}
+
+
+def test_make_insert_sql_no_returning() -> None:
+    """
+    Test make_insert_sql without a RETURNING clause
+    """
+    param_dict: Dict[str, Any] = {}
+    insert_args: List[SqlParam] = [
+        SqlParam(col_name="column1", value="value"),
+        SqlParam(col_name="column2", value=55, param_key="new_column2"),
+    ]
+
+    result: str = make_insert_sql(param_dict, "my_schema.table", insert_args)
+    assert (
+        result
+        == "INSERT INTO my_schema.table(column1, column2) VALUES(%(column1)s, %(new_column2)s)"
+    )
+    assert param_dict == {"column1": "value", "new_column2": 55}
+
+
+def test_make_insert_sql_returning() -> None:
+    """
+    Test make_insert_sql returning the inserted row. None values are still inserted
+    """
+    param_dict: Dict[str, Any] = {}
+    insert_args: List[SqlParam] = [
+        SqlParam(col_name="column1", value="value"),
+        SqlParam(col_name="column2", value=None),
+    ]
+
+    result: str = make_insert_sql(
+        param_dict, "my_schema.table", insert_args, ["id", "column1"]
+    )
+    assert (
+        result
+        == "INSERT INTO my_schema.table(column1, column2) VALUES(%(column1)s, %(column2)s) RETURNING id, column1"
+    )
+    assert param_dict == {"column1": "value", "column2": None}
+
+
+def test_make_upsert_sql_nothing() -> None:
+    """
+    Test make_upsert_sql skipping duplicates
+    """
+    param_dict: Dict[str, Any] = {}
+
+    result: str = make_upsert_sql(
+        param_dict, "my_schema.table", [SqlParam("a", 1)], ["a"], "nothing", ["id"]
+    )
+    assert (
+        result
+        == "INSERT INTO my_schema.table(a) VALUES(%(a)s) ON CONFLICT (a) DO NOTHING RETURNING id, 'inserted' AS upsert_outcome"
+    )
+    assert param_dict == {"a": 1}
+
+
+def test_make_upsert_sql_update() -> None:
+    """
+    Test make_upsert_sql only updates the non-None columns outside the conflict
+    """
+    param_dict: Dict[str, Any] = {}
+    insert_args: List[SqlParam] = [
+        SqlParam("a", 1),
+        SqlParam("b", "x"),
+        SqlParam("c", None),
+    ]
+
+    result: str = make_upsert_sql(
+        param_dict, "my_schema.table", insert_args, ["a"], "update", ["id"]
+    )
+    assert (
+        result
+        == "INSERT INTO my_schema.table(a, b, c) VALUES(%(a)s, %(b)s, %(c)s) ON CONFLICT (a) DO UPDATE SET b=EXCLUDED.b RETURNING id, CASE WHEN xmax = 0 THEN 'inserted' ELSE 'updated' END AS upsert_outcome"
+    )
+    assert param_dict == {"a": 1, "b": "x", "c": None}
+
+
+def test_make_upsert_sql_existing() -> None:
+    """
+    Test make_upsert_sql reading back the existing row
+    """
+    param_dict: Dict[str, Any] = {}
+
+    result: str = make_upsert_sql(
+        param_dict, "my_schema.table", [SqlParam("a", 1)], ["a"], "existing", ["id"]
+    )
+    assert (
+        result
+        == "WITH inserted AS (INSERT INTO my_schema.table(a) VALUES(%(a)s) ON CONFLICT (a) DO NOTHING RETURNING id) SELECT *, 'inserted' AS upsert_outcome FROM inserted UNION ALL SELECT id, 'existing' AS upsert_outcome FROM my_schema.table WHERE a=%(a)s AND NOT EXISTS (SELECT 1 FROM inserted)"
+    )
+    # NOTE: update with nothing to update falls back to existing
+    assert result == make_upsert_sql(
+        {}, "my_schema.table", [SqlParam("a", 1)], ["a"], "update", ["id"]
+    )
+
+
+def test_make_insert_many_sql_empty() -> None:
+    """
+    Test make_insert_many_sql with no rows
+    """
+    param_dict: Dict[str, Any] = {}
+
+    result: str = make_insert_many_sql(param_dict, "my_schema.table", ["a"], [])
+    assert result == ""
+    assert param_dict == {}
+
+
+def test_make_insert_many_sql() -> None:
+    """
+    Test make_insert_many_sql with missing columns, a conflict target and RETURNING
+    """
+    param_dict: Dict[str, Any] = {}
+    rows: List[Dict[str, Any]] = [{"a": 1, "b": "x"}, {"a": 2}]
+
+    result: str = make_insert_many_sql(
+        param_dict, "my_schema.table", ["a", "b"], rows, ["id"], ["a"]
+    )
+    assert (
+        result
+        == "INSERT INTO my_schema.table(a, b) VALUES(%(a_0)s, %(b_0)s), (%(a_1)s, %(b_1)s) ON CONFLICT (a) DO NOTHING RETURNING id"
+    )
+    assert param_dict == {"a_0": 1, "b_0": "x", "a_1": 2, "b_1": None}
+
+
+def test_make_copy_text() -> None:
+    """
+    Test make_copy_text escapes special characters and writes NULLs
+    """
+    rows: List[Dict[str, Any]] = [
+        {"a": 1, "b": "tab\there"},
+        {"a": None, "b": "back\\slash\nnew line"},
+    ]
+
+    result: str = make_copy_text(["a", "b"], rows)
+    assert result == "1\ttab\\there\n\\N\tback\\\\slash\\nnew line\n"
+
+
+def test_sql_cache_hits_and_misses() -> None:
+    """
+    Test that SqlCache only builds a shape once and counts hits and misses
+    """
+    cache: SqlCache = SqlCache(maxsize=4)
+    builds: List[str] = []
+
+    def build() -> str:
+        builds.append("built")
+        return "SELECT 1"
+
+    assert cache.get_or_build("shape", build) == "SELECT 1"
+    assert cache.get_or_build("shape", build) == "SELECT 1"
+    assert builds == ["built"]
+    assert cache.hits == 1
+    assert cache.misses == 1
+    assert cache.hit_rate() == 0.5
+
+
+def test_sql_cache_evicts_least_recently_used() -> None:
+    """
+    Test that SqlCache stays bounded and evicts the least recently used shape
+    """
+    cache: SqlCache = SqlCache(maxsize=2)
+    cache.get_or_build("a", lambda: "a")
+    cache.get_or_build("b", lambda: "b")
+    # NOTE: touch a so that b is the least recently used
+    cache.get_or_build("a", lambda: "a")
+    cache.get_or_build("c", lambda: "c")
+
+    assert len(cache) == 2
+    assert cache.get_or_build("a", lambda: "rebuilt a") == "a"
+    assert cache.get_or_build("b", lambda: "rebuilt b") == "rebuilt b"
+
+
+def test_make_update_sql_cached() -> None:
+    """
+    Test that a repeated update shape is served from the cache with new params
+    """
+    SQL_CACHE.clear()
+    first_params: Dict[str, Any] = {}
+    second_params: Dict[str, Any] = {}
+
+    first: str = make_update_sql(
+        first_params,
+        "my_schema.table",
+        [SqlParam(col_name="column1", value="value"), SqlParam("column2", None)],
+        [SqlParam(col_name="id", value=1)],
+        "AND",
+    )
+    second: str = make_update_sql(
+        second_params,
+        "my_schema.table",
+        [SqlParam(col_name="column1", value="other"), SqlParam("column2", None)],
+        [SqlParam(col_name="id", value=2)],
+        "AND",
+    )
+    assert (
+        first
+        == second
+        == "UPDATE my_schema.table SET column1=%(column1)s WHERE id=%(id)s"
+    )
+    assert second_params == {"column1": "other", "id": 2}
+    assert SQL_CACHE.hits == 1
+    assert SQL_CACHE.misses == 1
+
+
+def test_make_where_sql_operator_is_part_of_shape() -> None:
+    """
+    Test that the same columns with a different operator don't share sql
+    """
+    where_dict: Dict[str, Any] = {"test": 55, "test2": "string"}
+
+    assert (
+        make_where_sql(where_dict, "AND") == "WHERE test=%(test)s AND test2=%(test2)s"
+    )
+    assert make_where_sql(where_dict, "OR") == "WHERE test=%(test)s OR test2=%(test2)s"
+
+
+def test_make_numbered_args() -> None:
+    """
+    Test converting pyformat placeholders to positional ones for asyncpg
+    """
+    sql, args = make_numbered_args(
+        "UPDATE t SET a=%(a)s WHERE b=%(b)s AND c=%(a)s AND d LIKE 'x%%'",
+        {"a": 1, "b": "two", "unused": None},
+    )
+    assert sql == "UPDATE t SET a=$1 WHERE b=$2 AND c=$1 AND d LIKE 'x%'"
+    assert args == [1, "two"]
+
+
+def test_make_where_sql_col_comparison() -> None:
+    """
+    Test where expressions with comparisons other than equality
+    """
+    param_dict: Dict[str, Any] = {}
+    where_args: List[SqlParam] = [
+        SqlParam(col_name="org_id", value=3),
+        SqlParam(col_name="id", value=10, param_key="after_id", comparison=">"),
+    ]
+
+    result: str = make_where_sql_col(param_dict, where_args, "AND")
+    assert result == "WHERE org_id=%(org_id)s AND id>%(after_id)s"
+    assert param_dict == {"org_id": 3, "after_id": 10}
+
+
+def test_make_where_sql_col_any() -> None:
+    """
+    Test matching a column against any element of a list
+    """
+    param_dict: Dict[str, Any] = {}
+    where_args: List[SqlParam] = [
+        SqlParam(col_name="id", value=[1, 2], param_key="ids", comparison="= ANY"),
+    ]
+
+    result: str = make_where_sql_col(param_dict, where_args, "AND")
+    assert result == "WHERE id=ANY(%(ids)s)"
+    assert param_dict == {"ids": [1, 2]}
+
+
+def test_make_bulk_update_sql_empty() -> None:
+    """
+    Test make_bulk_update_sql leaves out rows that change nothing
+    """
+    param_dict: Dict[str, Any] = {}
+
+    result: str = make_bulk_update_sql(
+        param_dict,
+        "my_schema.table",
+        [([SqlParam("a", None)], [SqlParam("id", 1)])],
+        {"a": "varchar", "id": "int"},
+    )
+    assert result == ""
+    assert param_dict == {}
+
+
+def test_make_bulk_update_sql() -> None:
+    """
+    Test make_bulk_update_sql with rows that change different columns
+    """
+    param_dict: Dict[str, Any] = {}
+    rows: List[Tuple[List[SqlParam], List[SqlParam]]] = [
+        ([SqlParam("a", "x"), SqlParam("b", None)], [SqlParam("id", 1, "old_id")]),
+        ([SqlParam("a", None), SqlParam("b", None)], [SqlParam("id", 2, "old_id")]),
+        ([SqlParam("a", None), SqlParam("b", 5)], [SqlParam("id", 3, "old_id")]),
+    ]
+
+    result: str = make_bulk_update_sql(
+        param_dict,
+        "my_schema.table",
+        rows,
+        {"a": "varchar", "b": "bigint", "id": "int"},
+        ["t.id"],
+    )
+    assert (
+        result
+        == "UPDATE my_schema.table AS t SET a=COALESCE(v.a::varchar, t.a), b=COALESCE(v.b::bigint, t.b) FROM (VALUES(%(ord_0)s, %(old_id_0)s, %(a_0)s, %(b_0)s), (%(ord_1)s, %(old_id_1)s, %(a_1)s, %(b_1)s)) AS v(ord, old_id, a, b) WHERE t.id=v.old_id::int RETURNING t.id"
+    )
+    assert param_dict == {
+        "ord_0": 0,
+        "old_id_0": 1,
+        "a_0": "x",
+        "b_0": None,
+        "ord_1": 2,
+        "old_id_1": 3,
+        "a_1": None,
+        "b_1": 5,
+    }